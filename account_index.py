@@ -0,0 +1,228 @@
+# account_index.py
+# Índice das contas COSIF sobre o dataset Parquet (parquet_store): árvore
+# conta -> pai/filhos, subtotais recalculados a partir dos filhos (rollups)
+# conferidos contra os saldos informados, e os valores de cada conta por
+# competência e fundo já ordenados por conta, para responder "valor da conta X
+# de todos os fundos no mês M" lendo só os row groups daquela conta.
+#
+#   index/
+#     accounts.parquet   conta, descricao, nivel, conta_pai
+#     values.parquet     conta, competencia, cnpj, valor, rollup, filhos, confere
+#     totals.parquet     conta, competencia, fundos, soma
+#
+# Uso:
+#   python account_index.py build --store store --out index
+#   python account_index.py query 11000006 --month 2025-09 --index index
+#   python account_index.py check --index index
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from balancete_model import TOTAL_ACCOUNTS, cosif_parents
+
+DEFAULT_ROOT = os.environ.get("CVM_ACCOUNT_INDEX", "index")
+
+# diferença tolerada entre o saldo informado e a soma dos filhos (arredondamento)
+TOLERANCE = 0.005
+
+# linhas por row group em values.parquet (ordenado por conta: poucos row groups por consulta)
+ROW_GROUP_SIZE = 64 * 1024
+
+# totalizadores e os grupos (1º dígito) que somam em cada um
+TOTAL_GROUPS = {39999993: (1, 2, 3), 99999995: (4, 5, 6, 7, 8, 9)}
+
+
+def with_parents(df):
+    """Acrescenta nivel e conta_pai (níveis 1 apontam para o totalizador do seu lado)."""
+    parents, levels = cosif_parents(df["conta"].to_numpy())
+    group = df["conta"].to_numpy() // 10_000_000
+    for total, groups in TOTAL_GROUPS.items():
+        parents = np.where((levels == 1) & np.isin(group, groups), total, parents)
+    return df.assign(nivel=levels.astype(np.int8), conta_pai=parents.astype(np.int32))
+
+
+def compute_rollups(values):
+    """
+    values: cnpj, competencia, conta, valor (uma linha por conta de cada balancete).
+    Retorna com nivel, conta_pai, rollup (soma dos filhos diretos; o próprio
+    valor nas folhas), filhos (quantidade) e confere (saldo == soma dos filhos).
+    """
+    df = with_parents(values)
+    sums = (
+        df[df["conta_pai"] != 0]
+        .groupby(["cnpj", "competencia", "conta_pai"], sort=False)["valor"]
+        .agg(["sum", "size"])
+        .rename_axis(["cnpj", "competencia", "conta"])
+        .rename(columns={"sum": "rollup", "size": "filhos"})
+    )
+    df = df.join(sums, on=["cnpj", "competencia", "conta"])
+    df["filhos"] = df["filhos"].fillna(0).astype(np.int32)
+    leaf = df["filhos"] == 0
+    df["rollup"] = df["rollup"].where(~leaf, df["valor"])
+    df["confere"] = leaf | ((df["valor"] - df["rollup"]).abs() <= TOLERANCE)
+    return df
+
+
+class AccountIndex:
+    """Índice das contas gravado em `root` (ver o cabeçalho do módulo)."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self._accounts = None
+
+    def path(self, name):
+        return os.path.join(self.root, name + ".parquet")
+
+    # --------------------------
+    # CONSTRUÇÃO
+    # --------------------------
+    @classmethod
+    def build(cls, store, root=DEFAULT_ROOT, cnpjs=None, competencias=None):
+        """
+        Lê o dataset do parquet_store.BalanceteStore uma vez e grava os três
+        arquivos do índice. Retorna o AccountIndex.
+        """
+        raw = store.read(cnpjs=cnpjs, competencias=competencias,
+                         columns=["cnpj", "competencia", "conta", "descricao", "valor"])
+        df = compute_rollups(raw[["cnpj", "competencia", "conta", "valor"]])
+        os.makedirs(root, exist_ok=True)
+        index = cls(root)
+
+        accounts = (
+            raw.groupby("conta", sort=True)["descricao"].agg(lambda s: s.mode().iat[0]).reset_index()
+        )
+        accounts = with_parents(accounts)
+        accounts["conta_pai"] = accounts["conta_pai"].where(~accounts["conta"].isin(list(TOTAL_ACCOUNTS)), 0)
+        _write(accounts, index.path("accounts"))
+
+        values = df.sort_values(["conta", "competencia", "cnpj"])[
+            ["conta", "competencia", "cnpj", "valor", "rollup", "filhos", "confere"]
+        ]
+        _write(values, index.path("values"), row_group_size=ROW_GROUP_SIZE)
+
+        totals = (
+            df.groupby(["conta", "competencia"], sort=True)["valor"]
+            .agg(fundos="count", soma="sum")
+            .reset_index()
+        )
+        _write(totals, index.path("totals"))
+        return index
+
+    # --------------------------
+    # ÁRVORE
+    # --------------------------
+    @property
+    def accounts(self):
+        if self._accounts is None:
+            self._accounts = pq.read_table(self.path("accounts")).to_pandas().set_index("conta")
+        return self._accounts
+
+    def parent(self, conta):
+        p = int(self.accounts.at[int(conta), "conta_pai"]) if int(conta) in self.accounts.index else 0
+        return p or None
+
+    def children(self, conta):
+        acc = self.accounts
+        return acc.index[acc["conta_pai"] == int(conta)].tolist()
+
+    def descendants(self, conta):
+        out, todo = [], [int(conta)]
+        while todo:
+            kids = self.children(todo.pop())
+            out.extend(kids)
+            todo.extend(kids)
+        return out
+
+    # --------------------------
+    # CONSULTAS
+    # --------------------------
+    def _values(self, filter_expr, columns=None):
+        dataset = ds.dataset(self.path("values"), format="parquet")
+        return dataset.to_table(filter=filter_expr, columns=columns).to_pandas()
+
+    def value(self, conta, competencia):
+        """Saldo da conta em todos os fundos na competência: Series cnpj -> valor."""
+        from parse_html import normalize_competencia
+
+        df = self._values(
+            (ds.field("conta") == int(conta)) & (ds.field("competencia") == normalize_competencia(competencia)),
+            columns=["cnpj", "valor"],
+        )
+        return df.set_index("cnpj")["valor"]
+
+    def series(self, conta, cnpj=None):
+        """Saldo da conta ao longo das competências (DataFrame competencia x cnpj)."""
+        expr = ds.field("conta") == int(conta)
+        if cnpj is not None:
+            expr = expr & (ds.field("cnpj") == "".join(c for c in str(cnpj) if c.isdigit()))
+        df = self._values(expr, columns=["competencia", "cnpj", "valor"])
+        return df.pivot(index="competencia", columns="cnpj", values="valor")
+
+    def total(self, conta, competencia=None):
+        """Soma da conta entre os fundos (por competência), pré-calculada no build."""
+        expr = ds.field("conta") == int(conta)
+        if competencia is not None:
+            from parse_html import normalize_competencia
+
+            expr = expr & (ds.field("competencia") == normalize_competencia(competencia))
+        return ds.dataset(self.path("totals"), format="parquet").to_table(filter=expr).to_pandas()
+
+    def mismatches(self):
+        """Contas cujo saldo informado não bate com a soma dos filhos."""
+        df = self._values(ds.field("confere") == False)  # noqa: E712 (expressão do pyarrow)
+        df["diferenca"] = df["valor"] - df["rollup"]
+        return df
+
+
+def _write(df, path, row_group_size=None):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, row_group_size=row_group_size,
+                   compression="zstd")
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    from parquet_store import DEFAULT_ROOT as DEFAULT_STORE, BalanceteStore
+    from scraping import log
+
+    parser = argparse.ArgumentParser(description="Índice de contas COSIF (árvore, rollups e consultas por conta).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="(re)constrói o índice a partir do dataset Parquet")
+    p_build.add_argument("--store", default=DEFAULT_STORE)
+    p_query = sub.add_parser("query", help="valor de uma conta em todos os fundos")
+    p_query.add_argument("conta", type=int)
+    p_query.add_argument("--month", default=None, help="competência (AAAA-MM); sem ela, a série histórica")
+    p_check = sub.add_parser("check", help="lista contas cujo saldo não bate com a soma dos filhos")
+    for p in (p_build, p_query, p_check):
+        p.add_argument("--index", default=DEFAULT_ROOT)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        index = AccountIndex.build(BalanceteStore(args.store), args.index)
+        bad = index.mismatches()
+        log(f"Índice gravado em {args.index}: {len(index.accounts)} contas; {len(bad)} saldos não conferem")
+        return 0
+
+    index = AccountIndex(args.index)
+    if args.cmd == "query":
+        desc = index.accounts["descricao"].get(args.conta, "?")
+        log(f"{args.conta} {desc} (pai: {index.parent(args.conta)}, filhos: {index.children(args.conta)})")
+        print(index.value(args.conta, args.month) if args.month else index.series(args.conta))
+        return 0
+
+    bad = index.mismatches()
+    if bad.empty:
+        log("✅ Todos os saldos conferem com a soma das contas-filhas.")
+        return 0
+    print(bad.to_string(index=False))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,450 @@
+# async_scraping.py
+# Versão asyncio (playwright.async_api) do fluxo busca -> fundo -> Balancete -> tabela.
+# Um único navegador e um único event loop atendem vários fundos ao mesmo tempo;
+# a concorrência é limitada por um asyncio.Semaphore (uma página por fundo).
+#
+# Uso:
+#   python async_scraping.py cnpjs.txt --concurrency 8 --out-dir saida
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# pandas e Playwright são importados nas funções que os usam (como em scraping.py)
+
+from loading_profile import LoadingProfile
+from scraping import (
+    TABLE_ROWS_JS,
+    URL,
+    find_frame_with_url_fragment,
+    load_cached_balancete,
+    log,
+    normalize_cnpj,
+    persist_balancete,
+    records_from_rows,
+)
+from strategy_cache import StrategyCache
+from waits import WaitConfig
+
+
+# --------------------------
+# LOCALIZA FRAME COM FRAGMENTO NA URL
+# --------------------------
+async def wait_for_frame(page, fragment, timeout):
+    """Versão async de waits.wait_for_frame (evento framenavigated, sem polling)."""
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    f = find_frame_with_url_fragment(page, fragment)
+    if f:
+        return f
+    fragment = fragment.lower()
+    try:
+        return await page.wait_for_event(
+            "framenavigated",
+            predicate=lambda f: fragment in (f.url or "").lower(),
+            timeout=timeout,
+        )
+    except PlaywrightTimeoutError:
+        return None
+
+
+async def _scan_frames(page, selectors):
+    for f in page.frames:
+        try:
+            for sel in selectors:
+                el = await f.query_selector(sel)
+                if el:
+                    return f, el, sel
+        except Exception:
+            continue
+    return None, None, None
+
+
+async def wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=None):
+    """Versão async de waits.wait_for_selector_in_frames."""
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    found = await _scan_frames(page, selectors)
+    if found[0]:
+        return found
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    if prefer_frame is not None:
+        try:
+            await prefer_frame.wait_for_selector(", ".join(selectors), state="attached", timeout=timeout)
+        except PlaywrightTimeoutError:
+            return None, None, None
+        except Exception:
+            pass
+        for sel in selectors:
+            try:
+                el = await prefer_frame.query_selector(sel)
+            except Exception:
+                break
+            if el:
+                return prefer_frame, el, sel
+        return await _scan_frames(page, selectors)
+
+    while True:
+        remaining = int((deadline - loop.time()) * 1000)
+        if remaining <= 0:
+            return None, None, None
+        try:
+            f = await page.wait_for_event("framenavigated", timeout=remaining)
+            await f.wait_for_load_state("domcontentloaded", timeout=max(1, int((deadline - loop.time()) * 1000)))
+        except PlaywrightTimeoutError:
+            return await _scan_frames(page, selectors)
+        except Exception:
+            pass
+        found = await _scan_frames(page, selectors)
+        if found[0]:
+            return found
+
+
+async def click_and_wait_navigation(frame, target, timeout):
+    """Versão async de waits.click_and_wait_navigation."""
+    async with frame.expect_navigation(wait_until="domcontentloaded", timeout=timeout):
+        if isinstance(target, str):
+            await frame.click(target)
+        else:
+            await target.click()
+
+
+async def click_link_and_wait(page, frame, link_handle, timeout):
+    """
+    Versão async de waits.click_link_and_wait: popup ou navegação de um frame
+    da página, o que vier primeiro. Retorna (page_ou_popup, frame).
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    popup = asyncio.ensure_future(page.wait_for_event("popup", timeout=timeout))
+    navigated = asyncio.ensure_future(page.wait_for_event("framenavigated", timeout=timeout))
+    try:
+        await link_handle.click()
+        await asyncio.wait({popup, navigated}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (popup, navigated):
+            if not task.done():
+                task.cancel()
+
+    if popup.done() and not popup.cancelled() and popup.exception() is None:
+        new_page = popup.result()
+        await new_page.wait_for_load_state("domcontentloaded", timeout=timeout)
+        return new_page, new_page.main_frame
+    if navigated.done() and not navigated.cancelled() and navigated.exception() is None:
+        nav_frame = navigated.result()
+        await nav_frame.wait_for_load_state("domcontentloaded", timeout=timeout)
+        return page, nav_frame
+    raise PlaywrightTimeoutError(f"nem popup nem navegação {timeout} ms depois do clique")
+
+
+# --------------------------
+# PROCURA LINK EM TODOS OS FRAMES
+# --------------------------
+async def find_link_in_all_frames(page, css_selector=None, text_contains=None, href_contains=None):
+    """
+    Procura um link/elemento em todos os frames.
+    Retorna (frame, element) ou (None, None).
+    """
+    for f in page.frames:
+        try:
+            if css_selector:
+                el = await f.query_selector(css_selector)
+                if el:
+                    return f, el
+            if text_contains:
+                loc = f.locator(f"text={text_contains}")
+                if await loc.count() > 0:
+                    return f, loc.nth(0)
+            if href_contains:
+                anchors = await f.query_selector_all("a")
+                for a in anchors:
+                    href = (await a.get_attribute("href") or "").lower()
+                    if href_contains.lower() in href:
+                        return f, a
+        except Exception:
+            continue
+    return None, None
+
+
+async def find_cached(page, cache, step):
+    """Versão async de scraping.find_cached."""
+    if not cache:
+        return None, None, None
+    for f, sel in cache.candidates(page, step):
+        try:
+            el = await f.query_selector(sel)
+        except Exception:
+            continue
+        if el:
+            cache.record(step, f, sel)
+            return f, el, sel
+    return None, None, None
+
+
+async def find_link_by_multiple_strategies(page, selectors=None, texts=None, href_keywords=None, timeout=10000,
+                                           prefer_frame=None, cache=None, cache_step="balancete_link"):
+    selectors = selectors or []
+    texts = texts or []
+    href_keywords = href_keywords or []
+    f, el, _ = await find_cached(page, cache, cache_step)
+    if el:
+        return f, el
+    if selectors:
+        f, el, sel = await wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=prefer_frame)
+        if el:
+            if cache:
+                cache.record(cache_step, f, sel)
+            return f, el
+    for txt in texts:
+        f, el = await find_link_in_all_frames(page, text_contains=txt)
+        if el:
+            if cache:
+                cache.record(cache_step, f, f"text={txt}")
+            return f, el
+    for kw in href_keywords:
+        f, el = await find_link_in_all_frames(page, href_contains=kw)
+        if el:
+            if cache:
+                cache.record(cache_step, f, f"a[href*='{kw}' i]")
+            return f, el
+    return None, None
+
+
+# --------------------------
+# PROCURA TABELA EM TODOS OS FRAMES
+# --------------------------
+async def find_table_frame(page, selectors=None, timeout=10000, prefer_frame=None, cache=None,
+                           cache_step="balancete_table"):
+    selectors = selectors or ["table#Table1", "table.BodyPP", "form#form1 table"]
+    f, el, sel = await find_cached(page, cache, cache_step)
+    if el:
+        return f, el, sel
+    f, el, sel = await wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=prefer_frame)
+    if el:
+        log(f"Encontrada tabela com seletor '{sel}' no frame: name='{f.name}' url='{f.url}'")
+        if cache:
+            cache.record(cache_step, f, sel)
+    return f, el, sel
+
+
+# --------------------------
+# EXTRAI LINHAS DA TABELA DO BALANCETE
+# --------------------------
+async def extract_balancete_table_from_frame(frame, table_handle=None, mode="evaluate"):
+    """
+    Mesmo contrato de scraping.extract_balancete_table_from_frame.
+    Retorna pandas.DataFrame com colunas: conta, descricao, valor_text, valor
+    """
+    import pandas as pd
+
+    if table_handle is None:
+        table_handle = await frame.query_selector("table#Table1") or await frame.query_selector("table.BodyPP")
+        if table_handle is None:
+            log("❌ table_handle não fornecida e não encontrada no frame.")
+            return None
+
+    if mode == "evaluate":
+        rows = await table_handle.evaluate(TABLE_ROWS_JS)
+    else:
+        rows = []
+        for tr in await table_handle.query_selector_all("tr"):
+            try:
+                rows.append([(await td.inner_text()).strip() for td in await tr.query_selector_all("td")])
+            except Exception:
+                continue
+
+    return pd.DataFrame(records_from_rows(rows))
+
+
+# --------------------------
+# CAPTURA BALANCETE (procura tabela e salva)
+# --------------------------
+async def capture_balancete_and_save(page, out_prefix="balancete", timeout=10000, prefer_frame=None, cache=None,
+                                     page_cache=None, cnpj=None, store=None, snapshots=None):
+    """
+    Procura a tabela do balancete em todos os frames, extrai e salva CSV/JSON.
+    A escrita em disco roda numa thread para não travar o event loop.
+    Retorna DataFrame.
+    """
+    f, table_handle, used_sel = await find_table_frame(page, selectors=["table#Table1", "table.BodyPP", "form#form1 table"],
+                                                       timeout=timeout, prefer_frame=prefer_frame, cache=cache)
+    if not f:
+        log("❌ Não localizei a tabela do balancete em nenhum frame.")
+        await page.screenshot(path=f"{out_prefix}_no_table.png", full_page=True)
+        for i, fr in enumerate(page.frames):
+            try:
+                open(f"{out_prefix}_frame_{i}.html", "w", encoding="utf-8").write(await fr.content())
+            except:
+                pass
+        return None
+
+    log(f"Extraindo tabela no frame '{f.name}' ({f.url}) com seletor '{used_sel}'...")
+    df = await extract_balancete_table_from_frame(f, table_handle=table_handle)
+    if df is None or df.empty:
+        log("❌ Extração retornou vazio.")
+        return None
+
+    html = await f.content() if cnpj and (page_cache, store, snapshots) != (None, None, None) else None
+    await asyncio.to_thread(persist_balancete, df, out_prefix, cnpj, html, page_cache, store, snapshots)
+    return df
+
+
+# ==========================================================
+# FLUXO DE UM FUNDO
+# ==========================================================
+async def scrape_balancete(page, cnpj, out_prefix="balancete", debug_dir=".", url=URL, wait_config=None,
+                           strategy_cache=None, page_cache=None, store=None, snapshots=None):
+    """
+    Versão async de scraping.scrape_balancete. Retorna DataFrame ou levanta
+    RuntimeError descrevendo a etapa que falhou.
+    """
+    cnpj = normalize_cnpj(cnpj)
+    if page_cache is not None:
+        df = await asyncio.to_thread(load_cached_balancete, page_cache, cnpj, out_prefix, "", store,
+                                     snapshots)
+        if df is not None:
+            return df
+    waits = wait_config or WaitConfig()
+    cache = StrategyCache.shared() if strategy_cache is None else strategy_cache or None
+    page.set_default_timeout(waits.default)
+
+    log(f"[{cnpj}] Abrindo página inicial...")
+    await page.goto(url, wait_until="domcontentloaded", timeout=waits.timeout("goto"))
+
+    search_frame = await wait_for_frame(page, "FormBuscaParticFdo.aspx", waits.timeout("search_frame"))
+    if not search_frame:
+        raise RuntimeError("Frame de busca não encontrado")
+
+    log(f"[{cnpj}] Preenchendo CNPJ e clicando em btnContinuar...")
+    await search_frame.fill("#txtCNPJNome", cnpj, timeout=waits.timeout("search_frame"))
+    await click_and_wait_navigation(search_frame, "#btnContinuar", waits.timeout("search_submit"))
+
+    links = await search_frame.query_selector_all("a[id*='Linkbutton4']")
+    log(f"[{cnpj}] Fundos encontrados: {len(links)}")
+    if not links:
+        raise RuntimeError(f"Nenhum fundo encontrado para o CNPJ {cnpj}")
+
+    await links[0].scroll_into_view_if_needed()
+    await click_and_wait_navigation(search_frame, links[0], waits.timeout("fund_click"))
+
+    frame_link, link_handle = await find_link_by_multiple_strategies(
+        page,
+        selectors=["#Hyperlink5", "a[id*='Hyperlink5']"],
+        texts=["Balancete", "Balançete"],
+        href_keywords=["balanc", "balan"],
+        timeout=waits.timeout("balancete_link"),
+        prefer_frame=search_frame,
+        cache=cache
+    )
+    if not link_handle:
+        await page.screenshot(path=os.path.join(debug_dir, "balancete_not_found.png"), full_page=True)
+        for i, f in enumerate(page.frames):
+            try:
+                open(os.path.join(debug_dir, f"frame_debug_{i}.html"), "w", encoding="utf-8").write(await f.content())
+            except:
+                pass
+        raise RuntimeError("Link do Balancete (#Hyperlink5) não encontrado")
+
+    log(f"[{cnpj}] Clicando no link do Balancete...")
+    page_to_extract, table_frame = await click_link_and_wait(page, frame_link, link_handle, waits.timeout("balancete_open"))
+
+    df = await capture_balancete_and_save(page_to_extract, out_prefix=out_prefix,
+                                          timeout=waits.timeout("balancete_table"), prefer_frame=table_frame,
+                                          cache=cache, page_cache=page_cache, cnpj=cnpj, store=store,
+                                          snapshots=snapshots)
+    if page_to_extract is not page:
+        await page_to_extract.close()
+    if df is None:
+        raise RuntimeError("Falha ao extrair tabela do balancete")
+    return df
+
+
+# ==========================================================
+# VÁRIOS FUNDOS NO MESMO EVENT LOOP
+# ==========================================================
+async def _scrape_one(browser, semaphore, raw, out_dir, light, scrape_kwargs):
+    async with semaphore:
+        result = {"cnpj": raw, "status": "error", "rows": 0, "elapsed": 0.0, "error": None}
+        started = time.perf_counter()
+        context = None
+        try:
+            cnpj = normalize_cnpj(raw)
+            result["cnpj"] = cnpj
+            fund_dir = os.path.join(out_dir, cnpj)
+            os.makedirs(fund_dir, exist_ok=True)
+
+            context = await browser.new_context(accept_downloads=True)
+            if light:
+                profile = await LoadingProfile().install_async(context)
+            page = await context.new_page()
+            df = await scrape_balancete(page, cnpj, out_prefix=os.path.join(fund_dir, "balancete"), debug_dir=fund_dir,
+                                        **scrape_kwargs)
+            result["status"] = "ok"
+            result["rows"] = len(df)
+            if light:
+                result["loading"] = profile.stats()
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            log(f"❌ {raw}: {result['error']}")
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            result["elapsed"] = round(time.perf_counter() - started, 3)
+        return result
+
+
+async def run_many(cnpjs, concurrency=8, out_dir="saida", headless=True, wait_config=None, light=None,
+                   page_cache=None, store=None, snapshots=None):
+    """
+    Roda scrape_balancete para todos os CNPJs com no máximo `concurrency`
+    páginas abertas ao mesmo tempo, todas no mesmo navegador.
+    light: perfil de carregamento leve (loading_profile); padrão = ligado se headless.
+    Retorna a lista de resultados no mesmo formato de batch.run_batch.
+    """
+    from playwright.async_api import async_playwright
+
+    os.makedirs(out_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    light = headless if light is None else light
+    scrape_kwargs = {"wait_config": wait_config, "page_cache": page_cache, "store": store, "snapshots": snapshots}
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        try:
+            return await asyncio.gather(*[_scrape_one(browser, semaphore, c, out_dir, light, scrape_kwargs) for c in cnpjs])
+        finally:
+            await browser.close()
+
+
+def main(argv=None):
+    from batch import add_timeout_args, read_cnpjs, write_summary
+
+    parser = argparse.ArgumentParser(description="Baixa balancetes da CVM (asyncio, um navegador).")
+    parser.add_argument("source", help="arquivo com um CNPJ por linha, ou '-' para stdin")
+    parser.add_argument("--concurrency", type=int, default=8, help="páginas simultâneas")
+    parser.add_argument("--out-dir", default="saida", help="diretório de saída")
+    parser.add_argument("--headed", action="store_true", help="mostra o navegador (debug)")
+    parser.add_argument("--full-load", action="store_true", help="desliga o perfil de carregamento leve")
+    add_timeout_args(parser)
+    args = parser.parse_args(argv)
+
+    cnpjs = read_cnpjs(args.source)
+    if not cnpjs:
+        log("Nenhum CNPJ informado.")
+        return 1
+    started = time.perf_counter()
+    results = asyncio.run(run_many(cnpjs, concurrency=args.concurrency, out_dir=args.out_dir, headless=not args.headed,
+                                   wait_config=WaitConfig.from_args(args.timeout, args.step_timeout),
+                                   light=not args.headed and not args.full_load))
+    write_summary(results, args.out_dir, args.concurrency, time.perf_counter() - started)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+# balancete_model.py
+# Modelo compacto de um Balancete: os dados do fundo (cabeçalho da tabela:
+# Nome do Fundo, CNPJ, Tipo, Cód. CVM) ficam uma vez só em FundMeta, e as
+# contas em arrays paralelos (código int32, descrição, valor float64), em vez
+# de uma lista de dicts com o cabeçalho misturado às contas.
+#
+# A hierarquia vem do próprio código COSIF: 8 dígitos = 7 de conta + 1 dígito
+# verificador. Os 7 primeiros se dividem em segmentos 1-1-1-2-2
+# (grupo, subgrupo, desdobramento, desdobramento de subtítulo, título):
+#
+#   10000007 REALIZÁVEL                         nível 1
+#   11000006 DISPONIBILIDADES                   nível 2, pai 10000007
+#   11200002 DEPÓSITOS BANCÁRIOS                nível 3, pai 11000006
+#   11210009 BANCOS OFICIAIS - CONTA DEPÓSITOS  nível 4, pai 11200002
+#
+# O pai é o código com o último segmento não nulo zerado e o dígito
+# verificador recalculado (soma dos dígitos x pesos 7,9,3,7,9,3,7, módulo 10).
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from br_numbers import parse_br_series
+from parse_html import HEADER_FIELDS  # rótulos do cabeçalho da tabela -> campo de FundMeta
+
+# tamanhos dos segmentos dos 7 dígitos da conta (sem o verificador)
+COSIF_SEGMENTS = (1, 1, 1, 2, 2)
+CHECK_WEIGHTS = (7, 9, 3, 7, 9, 3, 7)
+
+# totalizadores fora da árvore (não têm pai nem filhos)
+TOTAL_ACCOUNTS = {39999993: "TOTAL GERAL DO ATIVO", 99999995: "TOTAL GERAL DO PASSIVO"}
+
+
+# potência de 10 que isola cada segmento dos 7 dígitos: 1000000, 100000, 10000, 100, 1
+_SEGMENT_DIV = tuple(10 ** (7 - sum(COSIF_SEGMENTS[:i + 1])) for i in range(len(COSIF_SEGMENTS)))
+_DIGIT_DIV = np.array([10 ** (6 - i) for i in range(7)], dtype=np.int64)
+
+
+# --------------------------
+# CÓDIGOS COSIF
+# --------------------------
+def cosif_check_digit(body):
+    """Dígito verificador dos 7 dígitos da conta: 1121000 -> 9 (conta 11210009)."""
+    return sum(int(d) * w for d, w in zip(f"{int(body):07d}", CHECK_WEIGHTS)) % 10
+
+
+def is_cosif(conta):
+    """True se `conta` (int ou texto) tem 8 dígitos e o verificador confere."""
+    text = str(conta).strip()
+    return len(text) == 8 and text.isdigit() and cosif_check_digit(text[:7]) == int(text[7])
+
+
+def cosif_level(conta):
+    """Nível 1..5 da conta (0 para os totalizadores 39999993/99999995)."""
+    conta = int(conta)
+    if conta in TOTAL_ACCOUNTS:
+        return 0
+    body = conta // 10
+    level = 0
+    for i, div in enumerate(_SEGMENT_DIV):
+        size = 10 ** COSIF_SEGMENTS[i]
+        if (body // div) % size:
+            level = i + 1
+    return level
+
+
+def cosif_parent(conta):
+    """Código da conta-pai (com verificador) ou None para grupos e totalizadores."""
+    conta = int(conta)
+    level = cosif_level(conta)
+    if level <= 1:
+        return None
+    body = conta // 10
+    div = _SEGMENT_DIV[level - 1]
+    body -= (body // div) % (10 ** COSIF_SEGMENTS[level - 1]) * div
+    return body * 10 + cosif_check_digit(body)
+
+
+def cosif_parents(contas):
+    """cosif_parent para um array de códigos de uma vez. 0 onde não há pai."""
+    contas = np.asarray(contas, dtype=np.int64)
+    body = contas // 10
+    segments = np.stack([(body // div) % (10 ** size) for div, size in zip(_SEGMENT_DIV, COSIF_SEGMENTS)])
+    nonzero = segments != 0
+    # nível = posição do último segmento não nulo (+1)
+    level = np.where(nonzero.any(axis=0), len(COSIF_SEGMENTS) - np.argmax(nonzero[::-1], axis=0), 0)
+    level[np.isin(contas, list(TOTAL_ACCOUNTS))] = 0
+
+    divs = np.array(_SEGMENT_DIV, dtype=np.int64)
+    idx = np.clip(level - 1, 0, None)
+    parent_body = body - segments[idx, np.arange(len(contas))] * divs[idx]
+    digits = (parent_body[:, None] // _DIGIT_DIV) % 10
+    check = (digits * np.array(CHECK_WEIGHTS)).sum(axis=1) % 10
+    return np.where(level > 1, parent_body * 10 + check, 0), level
+
+
+# --------------------------
+# MODELO
+# --------------------------
+class FundMeta:
+    """Dados do fundo, guardados uma vez por Balancete."""
+
+    __slots__ = ("nome", "cnpj", "tipo", "cod_cvm", "competencia")
+
+    def __init__(self, nome=None, cnpj=None, tipo=None, cod_cvm=None, competencia=None):
+        self.nome = nome
+        self.cnpj = cnpj
+        self.tipo = tipo
+        self.cod_cvm = cod_cvm
+        self.competencia = competencia
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"FundMeta(cnpj={self.cnpj!r}, cod_cvm={self.cod_cvm!r}, competencia={self.competencia!r})"
+
+
+def _header_field(text):
+    label, sep, value = str(text).partition(":")
+    field = HEADER_FIELDS.get(label.strip().lower())
+    return (field, value.strip()) if sep and field else (None, None)
+
+
+class Balancete:
+    """
+    Um Balancete: meta (FundMeta) + contas em arrays paralelos.
+
+        contas      numpy int32      códigos COSIF
+        descricoes  tuple[str]       descrições (internadas: as mesmas entre fundos)
+        valores     numpy float64    saldos (NaN se a célula não era número)
+
+    Índices de hierarquia (pais/níveis) são calculados na primeira consulta.
+    """
+
+    __slots__ = ("meta", "contas", "descricoes", "valores", "_pos", "_parents", "_levels")
+
+    def __init__(self, meta, contas, descricoes, valores):
+        self.meta = meta
+        self.contas = np.asarray(contas, dtype=np.int32)
+        self.descricoes = tuple(sys.intern(d) for d in descricoes)
+        self.valores = np.asarray(valores, dtype=np.float64)
+        self._pos = None
+        self._parents = None
+        self._levels = None
+
+    # --------------------------
+    # CONSTRUÇÃO
+    # --------------------------
+    @classmethod
+    def from_rows(cls, rows, competencia=None):
+        """
+        A partir da matriz de textos da tabela (scraping.read_table_rows,
+        parse_html.table_rows): linhas de cabeçalho viram FundMeta, linhas com
+        código COSIF viram contas; o resto (ex.: "Conta | Descrição | Valor") é ignorado.
+        """
+        meta = FundMeta(competencia=competencia)
+        contas, descricoes, valores = [], [], []
+        for texts in rows:
+            if not texts or len(texts) < 2:
+                continue
+            code = texts[0].strip()
+            if len(code) == 8 and code.isdigit():
+                contas.append(int(code))
+                descricoes.append(texts[1])
+                valores.append(texts[-1])
+                continue
+            for text in texts:
+                field, value = _header_field(text)
+                if field and getattr(meta, field) is None:
+                    setattr(meta, field, value)
+        return cls(meta, contas, descricoes, parse_br_series(valores).to_numpy())
+
+    @classmethod
+    def from_frame(cls, df, competencia=None):
+        """A partir do DataFrame dos extratores (conta/descricao/valor_text[/valor])."""
+        return cls.from_rows(df[["conta", "descricao", "valor_text"]].astype(str).values.tolist(), competencia)
+
+    @classmethod
+    def from_html(cls, html):
+        """A partir do HTML da página do Balancete (competência lida do select#ddCOMPTC)."""
+        from bs4 import BeautifulSoup
+
+        from parse_html import HTML_PARSER, competencia_from_html, find_balancete_table, table_rows
+
+        soup = BeautifulSoup(html, HTML_PARSER)
+        table, _ = find_balancete_table(soup)
+        if table is None:
+            return None
+        return cls.from_rows(table_rows(table), competencia_from_html(soup))
+
+    # --------------------------
+    # ACESSO
+    # --------------------------
+    def __len__(self):
+        return len(self.contas)
+
+    def __iter__(self):
+        return zip(self.contas.tolist(), self.descricoes, self.valores.tolist())
+
+    def __repr__(self):
+        return f"Balancete({self.meta!r}, {len(self)} contas)"
+
+    def index_of(self, conta):
+        if self._pos is None:
+            self._pos = {c: i for i, c in enumerate(self.contas.tolist())}
+        return self._pos.get(int(conta))
+
+    def valor(self, conta, default=None):
+        i = self.index_of(conta)
+        return default if i is None else float(self.valores[i])
+
+    def descricao(self, conta, default=None):
+        i = self.index_of(conta)
+        return default if i is None else self.descricoes[i]
+
+    # --------------------------
+    # HIERARQUIA
+    # --------------------------
+    def _hierarchy(self):
+        if self._parents is None:
+            parents, levels = cosif_parents(self.contas)
+            self._parents = parents.astype(np.int32)
+            self._levels = levels.astype(np.int8)
+        return self._parents, self._levels
+
+    @property
+    def parents(self):
+        """Array com o código da conta-pai de cada conta (0 = sem pai)."""
+        return self._hierarchy()[0]
+
+    @property
+    def levels(self):
+        """Array com o nível (1..5; 0 = totalizador) de cada conta."""
+        return self._hierarchy()[1]
+
+    def parent(self, conta):
+        i = self.index_of(conta)
+        if i is None:
+            return cosif_parent(conta)
+        p = int(self.parents[i])
+        return p or None
+
+    def children(self, conta):
+        """Contas deste Balancete cujo pai é `conta`, na ordem da tabela."""
+        return self.contas[self.parents == int(conta)].tolist()
+
+    # --------------------------
+    # CONVERSÃO
+    # --------------------------
+    def to_frame(self, hierarchy=True):
+        data = {"conta": self.contas, "descricao": self.descricoes, "valor": self.valores}
+        if hierarchy:
+            data["nivel"] = self.levels
+            data["conta_pai"] = self.parents
+        return pd.DataFrame(data)
+
+    def nbytes(self):
+        """Bytes ocupados pelas contas (arrays, tupla e descrições distintas)."""
+        strings = sum(sys.getsizeof(d) for d in set(self.descricoes))
+        return self.contas.nbytes + self.valores.nbytes + sys.getsizeof(self.descricoes) + strings
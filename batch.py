@@ -0,0 +1,382 @@
+# batch.py
+# Executa o fluxo do scraping.py para uma lista de CNPJs, com um pool de workers
+# headless. Cada worker abre o Chromium UMA vez e reaproveita o mesmo contexto
+# entre fundos, reciclando contexto/navegador a cada N fundos ou acima de um
+# limite de RSS (browser_pool.py). A sync_api do Playwright é presa à thread
+# que a criou, por isso cada thread tem o seu próprio navegador.
+#
+# Uso:
+#   python batch.py cnpjs.txt --workers 4 --out-dir saida
+#   cat cnpjs.txt | python batch.py - --workers 4
+#   python batch.py cnpjs.txt --queue jobs.sqlite   (se cair, rodar de novo retoma)
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+
+import metrics
+from browser_pool import ManagedBrowser, PoolStats, add_pool_args, pool_options_from_args
+from fund_index import DEFAULT_PATH as FUND_INDEX_PATH, FundIndex
+from page_cache import DEFAULT_ROOT as DEFAULT_CACHE_ROOT, DEFAULT_TTL, PageCache
+from scraping import log, normalize_cnpj, scrape_balancete
+from snapshot_diff import DEFAULT_PATH as SNAPSHOTS_PATH, SnapshotStore
+from throttle import add_throttle_args, throttle_from_args
+from waits import STEP_TIMEOUTS, WaitConfig
+
+
+# --------------------------
+# LEITURA DOS CNPJs
+# --------------------------
+def read_cnpjs(source):
+    """
+    Lê CNPJs de um arquivo (um por linha) ou de stdin quando source == "-".
+    Ignora linhas vazias e comentários (#). Remove duplicados (comparando só os
+    dígitos, então "32.811.422/0001-33" e "32811422000133" contam uma vez).
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding="utf-8") as fh:
+            lines = fh.read().splitlines()
+
+    seen = set()
+    cnpjs = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        key = "".join(c for c in line if c.isdigit()) or line
+        if not line or key in seen:
+            continue
+        seen.add(key)
+        cnpjs.append(line)
+    return cnpjs
+
+
+# --------------------------
+# WORKER (um navegador gerenciado, contexto reaproveitado entre fundos)
+# --------------------------
+def _scrape_fund(slot, cnpj, fund_dir, scrape_kwargs):
+    """
+    Um fundo numa página nova do contexto do worker (browser_pool fecha a
+    página e os popups ao final). Retorna (DataFrame, stats do perfil leve ou None).
+    """
+    with slot.page() as page:
+        df = scrape_balancete(page, cnpj, out_prefix=os.path.join(fund_dir, "balancete"), debug_dir=fund_dir,
+                              **scrape_kwargs)
+    return df, slot.last_loading
+
+
+def _worker(worker_id, next_job, report, out_dir, headless, light, scrape_kwargs, pool_stats=None,
+            pool_options=None):
+    """
+    next_job() -> (cnpj, token) ou None quando acabou; report(token, result)
+    recebe o resultado de cada fundo (lista em memória ou job_queue.JobQueue).
+    Com scrape_kwargs["throttle"], um fundo que falha por timeout/erro
+    transitório é refeito do início num contexto novo (espera com backoff).
+    pool_stats / pool_options: browser_pool.PoolStats compartilhado e kwargs de
+    ManagedBrowser (reciclagem por número de fundos e por RSS).
+    """
+    from playwright.sync_api import sync_playwright
+
+    throttle = scrape_kwargs.get("throttle")
+    with sync_playwright() as p, ManagedBrowser(p, headless=headless, light=light, stats=pool_stats,
+                                                **(pool_options or {})) as slot:
+        while True:
+            item = next_job()
+            if item is None:
+                return
+            raw, token = item
+
+            result = {"cnpj": raw, "status": "error", "rows": 0, "elapsed": 0.0, "error": None, "worker": worker_id}
+            started = time.perf_counter()
+            pending = None
+            try:
+                cnpj = normalize_cnpj(raw)
+                result["cnpj"] = cnpj
+                fund_dir = os.path.join(out_dir, cnpj)
+                os.makedirs(fund_dir, exist_ok=True)
+
+                args = (slot, cnpj, fund_dir, scrape_kwargs)
+                with metrics.fund(cnpj):
+                    df, loading = _scrape_fund(*args) if throttle is None else throttle.retrying(
+                        "fund", _scrape_fund, *args)
+                if loading:
+                    result["loading"] = loading
+                    metrics.count("bytes_fetched", loading["bytes_loaded"], step="browser")
+                if isinstance(df, Future):
+                    pending = df  # parse/gravação no parse_stage; o resultado sai no callback
+                else:
+                    result["status"] = "ok"
+                    result["rows"] = len(df)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                log(f"❌ [{worker_id}] {raw}: {result['error']}")
+            finally:
+                if pending is None:
+                    result["elapsed"] = round(time.perf_counter() - started, 3)
+                    report(token, result)
+                else:
+                    pending.add_done_callback(partial(_finish_parsed, result, started, token, report))
+
+
+def _finish_parsed(result, started, token, report, future):
+    """Callback do Future do parse_stage: completa o resultado do fundo e reporta."""
+    try:
+        result["rows"] = len(future.result())
+        result["status"] = "ok"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        log(f"❌ [{result['worker']}] {result['cnpj']}: {result['error']}")
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    report(token, result)
+
+
+# --------------------------
+# EXECUÇÃO DO LOTE
+# --------------------------
+def run_batch(cnpjs, workers=4, out_dir="saida", headless=True, wait_config=None, light=None, page_cache=None,
+              store=None, snapshots=None, job_queue=None, throttle=None, url=None, pool_options=None,
+              parse_workers=0, fund_index=None):
+    """
+    Processa os CNPJs com `workers` navegadores em paralelo.
+    light: perfil de carregamento leve (loading_profile); padrão = ligado se headless.
+    page_cache: page_cache.PageCache consultado antes de ir ao site.
+    store: parquet_store.BalanceteStore que recebe cada extração (além do CSV/JSON).
+    snapshots: snapshot_diff.SnapshotStore; fundos sem mudança não são regravados.
+    job_queue: job_queue.JobQueue; os CNPJs entram na fila persistente e os
+    workers consomem dela, então uma execução interrompida retoma do ponto em
+    que parou (fundos já concluídos não são refeitos; com cnpjs vazio, só
+    consome o que já está na fila).
+    throttle: throttle.Throttle compartilhado pelos workers (ritmo adaptativo
+    e novas tentativas com backoff).
+    url: página inicial (ex.: stub_server.py); padrão = cvmweb.
+    pool_options: kwargs de browser_pool.ManagedBrowser (context_funds,
+    browser_funds, max_rss_mb).
+    parse_workers: > 0 tira o parse e a gravação das threads do navegador e
+    os passa a um parse_stage.ParseStage com esse número de processos.
+    fund_index: fund_index.FundIndex; fundos já indexados abrem direto, sem a busca.
+    Salva cada fundo em out_dir/<cnpj>/balancete.{csv,json} e o resumo em
+    out_dir/summary.json. Retorna a lista de resultados (um dict por CNPJ).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    light = headless if light is None else light
+    results = []
+    lock = threading.Lock()
+
+    if job_queue is None:
+        jobs = queue.Queue()
+        for c in cnpjs:
+            jobs.put(c)
+        total = len(cnpjs)
+
+        def next_job():
+            try:
+                return jobs.get_nowait(), None
+            except queue.Empty:
+                return None
+
+        def report(token, result):
+            with lock:
+                results.append(result)
+    else:
+        valid = []
+        for c in cnpjs:
+            try:
+                valid.append(normalize_cnpj(c))
+            except ValueError as e:
+                results.append({"cnpj": c, "status": "error", "rows": 0, "elapsed": 0.0, "error": f"ValueError: {e}",
+                                "worker": None})
+        added = job_queue.enqueue(valid)
+        released = job_queue.release_orphans()
+        if released:
+            log(f"Fila {job_queue.path}: {released} itens de uma execução interrompida voltaram para a fila")
+        counts = job_queue.counts(monthly=False)
+        total = job_queue.claimable(monthly=False)
+        log(f"Fila {job_queue.path}: {added} novos, {total} a processar, {counts.get('done', 0)} já concluídos")
+
+        def next_job():
+            job = job_queue.claim(monthly=False)
+            return None if job is None else (job.cnpj, job)
+
+        # um item que falha volta à fila e pode ser pego de novo nesta execução:
+        # vale só o último resultado de cada item
+        slots = {}
+
+        def report(job, result):
+            job_queue.record(job, result)
+            with lock:
+                if job.id in slots:
+                    results[slots[job.id]] = result
+                else:
+                    slots[job.id] = len(results)
+                    results.append(result)
+
+    workers = min(max(1, workers), total)  # fila vazia: nenhum navegador
+    pool_stats = PoolStats()
+    parse_stage = None
+    if parse_workers and total:
+        from parse_stage import ParseStage
+
+        parse_stage = ParseStage(workers=parse_workers)
+    started = time.perf_counter()
+
+    threads = [
+        threading.Thread(target=_worker, args=(i, next_job, report, out_dir, headless, light,
+                                               {"wait_config": wait_config, "page_cache": page_cache,
+                                                "store": store, "snapshots": snapshots, "throttle": throttle,
+                                                "parse_stage": parse_stage, "fund_index": fund_index,
+                                                **({"url": url} if url else {})},
+                                               pool_stats, pool_options),
+                         daemon=True)
+        for i in range(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if parse_stage is not None:
+        parse_stage.close()  # espera os HTMLs que ainda estão na fila
+        log(parse_stage.summary())
+
+    write_summary(results, out_dir, workers, time.perf_counter() - started, pool_stats=pool_stats)
+    return results
+
+
+def write_summary(results, out_dir, workers, elapsed, pool_stats=None):
+    """Grava out_dir/summary.json e loga as falhas. Retorna o dict do resumo."""
+    ok = [r for r in results if r["status"] == "ok"]
+    summary = {
+        "total": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "workers": workers,
+        "elapsed": round(elapsed, 3),
+        "results": results,
+    }
+    steps = metrics.METRICS.summary()
+    if steps["steps"]:
+        summary["steps"] = steps["steps"]
+        summary["counters"] = steps["counters"]
+    if pool_stats is not None:
+        summary["browser_pool"] = pool_stats.snapshot()
+    loading = [r["loading"] for r in results if r.get("loading")]
+    if loading:
+        summary["loading"] = {
+            "blocked": sum(l["blocked"] for l in loading),
+            "bytes_loaded": sum(l["bytes_loaded"] for l in loading),
+        }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+
+    log(f"Lote finalizado: {summary['ok']}/{summary['total']} ok em {elapsed:.1f}s ({workers} workers)")
+    if loading:
+        log(f"Perfil leve: {summary['loading']['blocked']} requisições bloqueadas, "
+            f"{summary['loading']['bytes_loaded'] / 1024:.1f} KiB carregados")
+    if pool_stats is not None and pool_stats.counts["funds"]:
+        log(pool_stats.summary())
+    for r in results:
+        if r["status"] != "ok":
+            log(f"  falhou {r['cnpj']}: {r['error']}")
+    metrics.METRICS.log_summary()
+    return summary
+
+
+def add_timeout_args(parser):
+    parser.add_argument("--timeout", type=int, default=None,
+                        help="timeout global em ms (vale para todas as etapas)")
+    parser.add_argument("--step-timeout", action="append", default=[], metavar="ETAPA=MS",
+                        help="timeout de uma etapa, ex.: balancete_table=5000 (etapas: %s)" % ", ".join(STEP_TIMEOUTS))
+
+
+# opções (dest do argparse) que o caminho --async não usa: passá-las com --async é erro
+ASYNC_UNSUPPORTED = ("queue", "parse_workers", "fund_index", "context_funds", "browser_funds", "max_rss_mb",
+                     "rate", "max_rate", "max_concurrency", "target_latency", "retries")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa balancetes da CVM para vários CNPJs.")
+    parser.add_argument("source", help="arquivo com um CNPJ por linha, ou '-' para stdin")
+    parser.add_argument("--workers", type=int, default=4, help="número de navegadores em paralelo")
+    parser.add_argument("--out-dir", default="saida", help="diretório de saída")
+    parser.add_argument("--headed", action="store_true", help="mostra o navegador (debug)")
+    parser.add_argument("--full-load", action="store_true",
+                        help="não bloqueia imagens/CSS/fontes nem header/footer (perfil leve é o padrão em headless)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_ROOT, help="cache local de páginas (page_cache)")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL / 3600,
+                        help="validade em horas do Balancete mais recente em cache")
+    parser.add_argument("--no-cache", action="store_true", help="sempre busca no site")
+    parser.add_argument("--parquet", default=None, metavar="DIR",
+                        help="grava também no dataset Parquet particionado (parquet_store) neste diretório")
+    parser.add_argument("--snapshots", nargs="?", const=SNAPSHOTS_PATH, default=None, metavar="DB",
+                        help="compara cada fundo com a última extração (snapshot_diff) e não regrava se nada mudou")
+    parser.add_argument("--queue", default=None, metavar="DB",
+                        help="fila persistente (job_queue) em SQLite: retoma uma execução interrompida de onde parou")
+    parser.add_argument("--fund-index", nargs="?", const=FUND_INDEX_PATH, default=None, metavar="DB",
+                        help="índice local CNPJ -> fundo (fund_index): fundos já vistos abrem direto, sem a busca")
+    parser.add_argument("--parse-workers", type=int, default=0, metavar="N",
+                        help="parse/gravação em N processos separados (parse_stage), fora das threads do navegador")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="usa async_scraping: um navegador, --workers páginas no mesmo event loop")
+    add_timeout_args(parser)
+    add_pool_args(parser)
+    add_throttle_args(parser)
+    metrics.add_metrics_args(parser)
+    args = parser.parse_args(argv)
+    if args.use_async:
+        # async_scraping roda num event loop: não tem fila persistente, throttle (síncrono),
+        # parse_stage, fund_index nem a reciclagem do browser_pool
+        for dest in ASYNC_UNSUPPORTED:
+            if getattr(args, dest) != parser.get_default(dest):
+                parser.error(f"--{dest.replace('_', '-')} não funciona com --async")
+    metrics.metrics_from_args(args)
+    wait_config = WaitConfig.from_args(args.timeout, args.step_timeout)
+    light = not args.headed and not args.full_load
+    page_cache = None if args.no_cache else PageCache(args.cache_dir, ttl=args.cache_ttl * 3600)
+    store = None
+    if args.parquet:
+        from parquet_store import BalanceteStore
+
+        store = BalanceteStore(args.parquet)
+    snapshots = SnapshotStore(args.snapshots) if args.snapshots else None
+    fund_index = FundIndex(args.fund_index) if args.fund_index else None
+    throttle = throttle_from_args(args, concurrency=args.workers)
+
+    job_queue = None
+    if args.queue:
+        from job_queue import JobQueue
+
+        job_queue = JobQueue(args.queue)
+
+    cnpjs = read_cnpjs(args.source)
+    if not cnpjs and job_queue is None:
+        log("Nenhum CNPJ informado.")
+        return 1
+    if args.use_async:
+        import asyncio
+        from async_scraping import run_many
+
+        started = time.perf_counter()
+        results = asyncio.run(run_many(cnpjs, concurrency=args.workers, out_dir=args.out_dir, headless=not args.headed,
+                                       wait_config=wait_config, light=light, page_cache=page_cache,
+                                       store=store, snapshots=snapshots))
+        write_summary(results, args.out_dir, args.workers, time.perf_counter() - started)
+    else:
+        results = run_batch(cnpjs, workers=args.workers, out_dir=args.out_dir, headless=not args.headed,
+                            wait_config=wait_config, light=light, page_cache=page_cache, store=store,
+                            snapshots=snapshots, job_queue=job_queue, throttle=throttle,
+                            pool_options=pool_options_from_args(args), parse_workers=args.parse_workers,
+                            fund_index=fund_index)
+    if page_cache is not None:
+        page_cache.evict()
+    if args.metrics_prom:
+        metrics.METRICS.write_prometheus(args.metrics_prom)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# benchmarks/_common.py
+# Peças comuns dos benchmarks: fixtures sintéticas (N fundos servidos pelo
+# stub_server a partir do mesmo Balancete gravado), pico de memória (RSS),
+# silêncio dos log() durante as medições e gravação do resultado em JSON.
+
+import contextlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from stub_server import FIXTURES_DIR  # noqa: E402
+
+BASE_CNPJ = "32811422000133"
+
+
+def cnpj_with_check_digits(base12):
+    """CNPJ válido (14 dígitos) a partir dos 12 primeiros."""
+    digits = [int(d) for d in base12]
+    for weights in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        r = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if r < 2 else 11 - r)
+    return "".join(map(str, digits))
+
+
+def synthetic_cnpjs(n):
+    """n CNPJs determinísticos (o primeiro é o fundo gravado em fixtures/)."""
+    return [BASE_CNPJ] + [cnpj_with_check_digits(f"{90000000 + i:08d}0001") for i in range(1, n)]
+
+
+@contextlib.contextmanager
+def synthetic_fixtures(n_funds):
+    """
+    Diretório temporário com as páginas de fixtures/ e um funds.json com
+    n_funds fundos (todos com as competências do fundo gravado).
+    Rende (diretório, lista de CNPJs).
+    """
+    with open(os.path.join(FIXTURES_DIR, "funds.json"), encoding="utf-8") as fh:
+        template = json.load(fh)[BASE_CNPJ][0]
+    tmp = tempfile.mkdtemp(prefix="cvm_bench_fixtures_")
+    try:
+        for name in os.listdir(FIXTURES_DIR):
+            if name != "funds.json":
+                shutil.copy(os.path.join(FIXTURES_DIR, name), tmp)
+        cnpjs = synthetic_cnpjs(n_funds)
+        funds = {}
+        for i, cnpj in enumerate(cnpjs):
+            fund = dict(template)
+            if i:
+                fund["pk_partic"] = str(900000 + i)
+                fund["cnpj"] = f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+            funds[cnpj] = [fund]
+        with open(os.path.join(tmp, "funds.json"), "w", encoding="utf-8") as fh:
+            json.dump(funds, fh, ensure_ascii=False)
+        yield tmp, cnpjs
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (e dos filhos já encerrados), em MiB."""
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    rss_bytes = rss if sys.platform == "darwin" else rss * 1024  # ru_maxrss: bytes no macOS, KiB no Linux
+    return round(rss_bytes / 2 ** 20, 1)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Descarta o stdout (os log() do fluxo) durante a medição."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def report(name, result, json_path=None):
+    """Acrescenta peak_rss_mb, imprime e (opcionalmente) grava o resultado em JSON."""
+    result = {"benchmark": name, **result, "peak_rss_mb": peak_rss_mb()}
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False, indent=2)
+    return result
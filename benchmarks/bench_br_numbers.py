@@ -0,0 +1,78 @@
+# benchmarks/bench_br_numbers.py
+# Compara a conversão de valores BR célula a célula (parse_num_br via
+# .astype(str).apply, como fazia o extract_table.py) com a conversão da
+# coluna inteira (br_numbers.parse_br_series).
+#
+# Uso (da raiz do repositório):
+#   python benchmarks/bench_br_numbers.py --rows 1000000 --repeat 3
+
+import argparse
+import sys
+import time
+
+from _common import report
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from br_numbers import parse_br_series, parse_num_br  # noqa: E402
+
+
+def make_values(rows, seed=0):
+    """Coluna parecida com valor_text do Balancete: milhares, negativos, ',00', parênteses e R$."""
+    rng = np.random.default_rng(seed)
+    cents = rng.integers(-10 ** 11, 10 ** 11, size=rows)
+    base = pd.Series(cents // 100).abs().map("{:,}".format).str.replace(",", ".", regex=False)
+    text = base + "," + pd.Series(np.abs(cents) % 100).map("{:02d}".format)
+    text = text.where(cents >= 0, "-" + text)
+    kind = rng.integers(0, 20, size=rows)
+    text = text.where(kind != 0, ",00")
+    text = text.where(kind != 1, "(" + base + ",00)")
+    text = text.where(kind != 2, "R$ " + base + ",50")
+    return text
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark: parse_num_br por célula x parse_br_series por coluna.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", default=None, help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    values = make_values(args.rows)
+    print(f"{args.rows:,} valores, melhor de {args.repeat}")
+
+    t_apply, legacy = best_of(lambda: values.astype(str).apply(parse_num_br), args.repeat)
+    t_series, fast = best_of(lambda: parse_br_series(values), args.repeat)
+    t_exact, exact = best_of(lambda: parse_br_series(values, exact=True), args.repeat)
+
+    # parênteses: parse_num_br ignora o sinal; o resto tem que bater
+    plain = ~values.str.startswith("(")
+    mismatches = int((~np.isclose(legacy[plain].astype(float), fast[plain], rtol=0, atol=1e-6)).sum())
+    print(f"  parse_num_br (.apply)        {t_apply:8.3f} s")
+    print(f"  parse_br_series (float64)    {t_series:8.3f} s   {t_apply / t_series:5.1f}x")
+    print(f"  parse_br_series (Decimal)    {t_exact:8.3f} s   {t_apply / t_exact:5.1f}x")
+    print(f"  divergências (sem parênteses): {mismatches}; NaN: {int(fast.isna().sum())}; "
+          f"None (Decimal): {int(exact.isna().sum())}")
+    report("br_numbers", {
+        "rows": args.rows,
+        "apply_s": round(t_apply, 4),
+        "series_s": round(t_series, 4),
+        "exact_s": round(t_exact, 4),
+        "speedup": round(t_apply / t_series, 2),
+        "mismatches": mismatches,
+    }, args.json)
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
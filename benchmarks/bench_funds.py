@@ -0,0 +1,121 @@
+# benchmarks/bench_funds.py
+# Fluxo completo por fundo contra o stub_server (páginas gravadas em
+# fixtures/, N fundos sintéticos), sem rede:
+#   - latência ponta a ponta por fundo (p50/p95) e quanto dela é cada etapa
+#     (metrics.py);
+#   - fundos/minuto para cada tamanho de pool (--pools 1,2,4,8).
+# Por padrão usa o fluxo HTTP (http_fetch.fetch_balancete, uma sessão por
+# thread); --browser usa o Playwright (batch.run_batch), se o Chromium estiver
+# instalado. --latency simula o tempo de resposta do cvmweb em cada requisição.
+#
+# Uso (da raiz do repositório):
+#   python benchmarks/bench_funds.py --funds 40 --pools 1,2,4,8
+#   python benchmarks/bench_funds.py --funds 20 --pools 2,4 --latency 0.05 --browser --json saida/bench_funds.json
+
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from _common import quiet, report, synthetic_fixtures
+
+import metrics  # noqa: E402
+from http_fetch import CvmHttpClient, fetch_balancete  # noqa: E402
+from stub_server import Faults, running_stub  # noqa: E402
+
+
+def run_http(base_url, cnpjs, pool, out_dir):
+    """Processa os CNPJs com `pool` threads (uma sessão HTTP cada). Retorna [(cnpj, segundos, ok)]."""
+    jobs = queue.Queue()
+    for c in cnpjs:
+        jobs.put(c)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        with CvmHttpClient(base_url) as client:
+            while True:
+                try:
+                    cnpj = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                t0 = time.perf_counter()
+                ok = True
+                try:
+                    with metrics.fund(cnpj):
+                        fetch_balancete(cnpj, out_prefix=os.path.join(out_dir, cnpj), client=client,
+                                        browser_fallback=False)
+                except Exception:
+                    ok = False
+                with lock:
+                    results.append((cnpj, time.perf_counter() - t0, ok))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(pool)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run_browser(base_url, cnpjs, pool, out_dir):
+    """Mesmo lote pelo Playwright (batch.run_batch). Retorna [(cnpj, segundos, ok)]."""
+    from batch import run_batch
+    from http_fetch import START_PATH
+
+    results = run_batch(cnpjs, workers=pool, out_dir=out_dir, headless=True, url=base_url + START_PATH)
+    return [(r["cnpj"], r["elapsed"], r["status"] == "ok") for r in results]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark: latência por fundo e fundos/minuto por pool (offline).")
+    parser.add_argument("--funds", type=int, default=40, help="fundos sintéticos no stub")
+    parser.add_argument("--pools", default="1,2,4,8", help="tamanhos de pool, separados por vírgula")
+    parser.add_argument("--latency", type=float, default=0.0, help="atraso (s) do stub em cada resposta")
+    parser.add_argument("--browser", action="store_true", help="usa o Playwright em vez do fluxo HTTP")
+    parser.add_argument("--json", default=None, help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+    pools = [int(p) for p in args.pools.split(",") if p.strip()]
+    run = run_browser if args.browser else run_http
+
+    rows = []
+    with synthetic_fixtures(args.funds) as (fixtures, cnpjs), \
+            running_stub(fixtures_dir=fixtures, faults=Faults(latency=args.latency)) as base_url:
+        for pool in pools:
+            metrics.METRICS.reset()
+            with tempfile.TemporaryDirectory(prefix="cvm_bench_out_") as out_dir, quiet():
+                t0 = time.perf_counter()
+                results = run(base_url, cnpjs, pool, out_dir)
+                elapsed = time.perf_counter() - t0
+            latencies = [s for _, s, ok in results if ok]
+            steps = metrics.METRICS.summary()["steps"]
+            rows.append({
+                "pool": pool,
+                "funds": len(results),
+                "failed": sum(1 for *_, ok in results if not ok),
+                "elapsed": round(elapsed, 3),
+                "funds_per_min": round(len(latencies) / elapsed * 60, 1),
+                "latency_p50": round(metrics.percentile(latencies, 0.5) or 0, 4),
+                "latency_p95": round(metrics.percentile(latencies, 0.95) or 0, 4),
+                "steps_p50": {name: v["p50"] for name, v in steps.items() if name != "fund"},
+            })
+
+    mode = "browser" if args.browser else "http"
+    print(f"{args.funds} fundos, fluxo {mode}, latência do stub {args.latency:.3f}s")
+    print(f"{'pool':>5}{'fundos/min':>12}{'p50 s':>9}{'p95 s':>9}{'falhas':>8}")
+    for r in rows:
+        print(f"{r['pool']:>5}{r['funds_per_min']:>12.1f}{r['latency_p50']:>9.3f}{r['latency_p95']:>9.3f}"
+              f"{r['failed']:>8}")
+    slowest = max(rows[0]["steps_p50"].items(), key=lambda kv: kv[1], default=None)
+    if slowest:
+        print(f"etapa mais lenta (p50, pool {rows[0]['pool']}): {slowest[0]} {slowest[1]:.4f}s")
+    result = report("funds", {"mode": mode, "latency": args.latency, "runs": rows}, args.json)
+    print(f"pico de RSS: {result['peak_rss_mb']} MiB")
+    return 0 if all(r["failed"] == 0 for r in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
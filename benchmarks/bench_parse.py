@@ -0,0 +1,85 @@
+# benchmarks/bench_parse.py
+# Tempo de parse do Balancete por 1.000 linhas, a partir da página gravada
+# (stub_server.StubCvm) com as linhas de conta repetidas até --rows:
+#   parse_html.parse_balancete_html   HTML -> DataFrame (fluxo HTTP/cache)
+#   Balancete.from_html               HTML -> modelo compacto
+#   scraping.records_from_rows        matriz de textos -> registros (fluxo Playwright)
+#
+# Uso (da raiz do repositório):
+#   python benchmarks/bench_parse.py --rows 1000,10000,50000 --repeat 3
+
+import argparse
+import re
+import sys
+import time
+
+from _common import report
+
+import pandas as pd  # noqa: E402
+
+from balancete_model import Balancete  # noqa: E402
+from parse_html import parse_balancete_html  # noqa: E402
+from scraping import records_from_rows  # noqa: E402
+from stub_server import StubCvm  # noqa: E402
+
+ROW_RE = re.compile(r"<tr>\s*<td>\d{8}</td>.*?</tr>", re.S)
+
+
+def make_page(rows):
+    """Página do Balancete com `rows` linhas de conta (as gravadas, repetidas)."""
+    page = StubCvm().render_balancete("170939")
+    found = ROW_RE.findall(page)
+    body = "\n".join(found[i % len(found)] for i in range(rows))
+    start = page.index(found[0])
+    end = page.index(found[-1]) + len(found[-1])
+    return page[:start] + body + page[end:], found
+
+
+def cells(found, rows):
+    texts = [re.findall(r"<td[^>]*>(.*?)</td>", tr, re.S) for tr in found]
+    return [texts[i % len(texts)] for i in range(rows)]
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark: tempo de parse do Balancete por 1k linhas.")
+    parser.add_argument("--rows", default="1000,10000,50000", help="tamanhos de tabela, separados por vírgula")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", default=None, help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    runs = []
+    print(f"{'linhas':>8}{'parse_html ms/1k':>18}{'from_html ms/1k':>17}{'records ms/1k':>15}")
+    for rows in [int(r) for r in args.rows.split(",") if r.strip()]:
+        html, found = make_page(rows)
+        matrix = cells(found, rows)
+        df = parse_balancete_html(html)
+        assert len(df) >= rows, f"esperava {rows} linhas, veio {len(df)}"
+
+        per_1k = 1000 / rows * 1000  # s -> ms por 1k linhas
+        run = {
+            "rows": rows,
+            "parse_html_ms_per_1k": round(best_of(lambda: parse_balancete_html(html), args.repeat) * per_1k, 3),
+            "from_html_ms_per_1k": round(best_of(lambda: Balancete.from_html(html), args.repeat) * per_1k, 3),
+            "records_ms_per_1k": round(best_of(lambda: pd.DataFrame(records_from_rows(matrix)), args.repeat)
+                                       * per_1k, 3),
+        }
+        runs.append(run)
+        print(f"{rows:>8}{run['parse_html_ms_per_1k']:>18.2f}{run['from_html_ms_per_1k']:>17.2f}"
+              f"{run['records_ms_per_1k']:>15.2f}")
+
+    result = report("parse", {"repeat": args.repeat, "runs": runs}, args.json)
+    print(f"pico de RSS: {result['peak_rss_mb']} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
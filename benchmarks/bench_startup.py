@@ -0,0 +1,88 @@
+# benchmarks/bench_startup.py
+# Tempo de partida das invocações curtas (as do cron): cada caso roda num
+# processo novo, --repeat vezes, e o resultado é o mínimo e a mediana do
+# tempo de parede. "python" (interpretador vazio) é a referência; overhead_ms
+# é o que o caso gasta além dela. Também lista quais dependências pesadas
+# (pandas, Playwright, requests, pyarrow) cada caso chegou a importar.
+#
+# Uso (da raiz do repositório):
+#   python benchmarks/bench_startup.py --repeat 10
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import ROOT, report
+
+from stub_server import StubCvm  # noqa: E402
+
+HEAVY = ("pandas", "playwright", "requests", "pyarrow", "numpy", "bs4")
+
+
+def cases(page, out_dir):
+    """nome -> argumentos do interpretador."""
+    cli = os.path.join(ROOT, "cli.py")
+    return {
+        "python": ["-c", "pass"],
+        "cli_help": [cli, "--help"],
+        "normalize_cnpj": ["-c", "from scraping import normalize_cnpj; normalize_cnpj('32.811.422/0001-33')"],
+        "scrape_help": [cli, "scrape", "--help"],
+        "batch_help": [cli, "batch", "--help"],
+        "parse_file": [cli, "parse", page],
+        "export_file": [cli, "export", page, "--ndjson", os.path.join(out_dir, "rows.ndjson")],
+    }
+
+
+def run_once(args):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=True)
+    return time.perf_counter() - t0
+
+
+def heavy_imports(args):
+    """Dependências pesadas importadas pelo caso (saída de -X importtime)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True)
+    loaded = {line.rsplit("|", 1)[-1].strip() for line in proc.stderr.splitlines() if "|" in line}
+    return [name for name in HEAVY if name in loaded]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark: tempo de partida da CLI por subcomando.")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--only", default=None, help="casos, separados por vírgula")
+    parser.add_argument("--json", default=None, help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cvm_bench_startup_") as tmp:
+        page = os.path.join(tmp, "balancete_popup.html")
+        with open(page, "w", encoding="utf-8") as fh:
+            fh.write(StubCvm().render_balancete("170939"))
+        all_cases = cases(page, tmp)
+        names = args.only.split(",") if args.only else list(all_cases)
+        if "python" not in names:
+            names.insert(0, "python")
+
+        runs = []
+        print(f"{'caso':<16}{'min ms':>9}{'mediana ms':>12}{'overhead ms':>13}  importa")
+        base = None
+        for name in names:
+            times = [run_once(all_cases[name]) for _ in range(args.repeat)]
+            best, median = min(times) * 1000, statistics.median(times) * 1000
+            base = median if name == "python" else base
+            heavy = heavy_imports(all_cases[name])
+            runs.append({"command": name, "min_ms": round(best, 1), "median_ms": round(median, 1),
+                         "overhead_ms": round(median - base, 1), "heavy_imports": heavy})
+            print(f"{name:<16}{best:>9.1f}{median:>12.1f}{median - base:>13.1f}  {', '.join(heavy) or '-'}")
+
+    result = report("startup", {"repeat": args.repeat, "runs": runs}, args.json)
+    return 0 if result else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# benchmarks/run_all.py
+# Roda os benchmarks (cada um num processo próprio, para o pico de RSS ser
+# só dele), grava os resultados juntos num JSON e, com --compare, mostra a
+# variação de cada métrica contra um baseline gravado antes.
+# Tudo offline: stub_server + fixtures/.
+#
+# Uso (da raiz do repositório):
+#   python benchmarks/run_all.py --save benchmarks/baseline.json
+#   ... mudança ...
+#   python benchmarks/run_all.py --compare benchmarks/baseline.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# benchmark -> argumentos (tamanhos pequenos o bastante para rodar em ~1 min)
+SUITE = {
+    "funds": ["bench_funds.py", "--funds", "40", "--pools", "1,2,4,8"],
+    "funds_latency": ["bench_funds.py", "--funds", "24", "--pools", "1,4", "--latency", "0.05"],
+    "parse": ["bench_parse.py", "--rows", "1000,10000", "--repeat", "3"],
+    "br_numbers": ["bench_br_numbers.py", "--rows", "200000", "--repeat", "3"],
+    "startup": ["bench_startup.py", "--repeat", "5"],
+}
+
+# métricas em que maior é melhor (nas demais, menor é melhor)
+HIGHER_IS_BETTER = ("funds_per_min", "speedup")
+
+
+def flatten(result, prefix=""):
+    """{"runs": [{"pool": 1, "x": 2}]} -> {"runs[pool=1].x": 2} (só valores numéricos)."""
+    out = {}
+    if isinstance(result, dict):
+        for k, v in result.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else k))
+    elif isinstance(result, list):
+        for i, v in enumerate(result):
+            key = next((f"{k}={v[k]}" for k in ("pool", "rows", "command") if isinstance(v, dict) and k in v), str(i))
+            out.update(flatten(v, f"{prefix}[{key}]"))
+    elif isinstance(result, (int, float)) and not isinstance(result, bool):
+        out[prefix] = result
+    return out
+
+
+def run_suite(names):
+    results = {}
+    for name in names:
+        script, *args = SUITE[name]
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            path = tmp.name
+        try:
+            print(f"== {name}: {script} {' '.join(args)}", flush=True)
+            proc = subprocess.run([sys.executable, os.path.join(HERE, script), *args, "--json", path], cwd=HERE)
+            with open(path, encoding="utf-8") as fh:
+                results[name] = json.load(fh) if os.path.getsize(path) else {"error": proc.returncode}
+        finally:
+            os.remove(path)
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Imprime a variação por métrica; retorna quantas pioraram mais que `threshold` (fração)."""
+    worse = 0
+    for name in current:
+        now, before = flatten(current[name]), flatten(baseline.get(name, {}))
+        for key in sorted(now):
+            if key not in before or not before[key] or key.endswith(("pool", "rows", "funds", "repeat", "latency")):
+                continue
+            change = (now[key] - before[key]) / abs(before[key])
+            better = change > 0 if key.split(".")[-1].startswith(HIGHER_IS_BETTER) else change < 0
+            flag = ""
+            if not better and abs(change) > threshold:
+                flag = "  <-- piorou"
+                worse += 1
+            print(f"  {name}.{key:<48} {before[key]:>12g} -> {now[key]:>12g}  {change:+7.1%}{flag}")
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roda a suíte de benchmarks offline e compara com um baseline.")
+    parser.add_argument("--only", default=None, help=f"subconjunto, separado por vírgula ({', '.join(SUITE)})")
+    parser.add_argument("--save", default=None, help="grava os resultados neste JSON (ex.: o baseline)")
+    parser.add_argument("--compare", default=None, help="JSON de um baseline para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora tolerada antes de sinalizar (fração)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(SUITE)
+    results = run_suite(names)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        print(f"Comparação com {args.compare} (limite {args.threshold:.0%}):")
+        worse = compare(results, baseline, args.threshold)
+        print(f"{worse} métricas pioraram além do limite")
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
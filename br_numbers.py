@@ -0,0 +1,135 @@
+# br_numbers.py
+# Conversão de valores no formato brasileiro ("98.906.104,87", "-1.035.645,13",
+# "(1.234,56)", "R$ ,00") para número.
+#
+#   parse_num_br(s)          um valor por vez (a função antiga do scraping.py)
+#   parse_br_series(serie)   a coluna inteira numa passada (pyarrow.compute, ou
+#                            operações .str do pandas sem pyarrow)
+#
+# parse_br_series só aceita números no formato BR: "Cód. CVM: 237477" vira NaN
+# (parse_num_br arrancava as letras e devolvia 0.237477).
+
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+# numpy/pandas/pyarrow só são importados por parse_br_series: parse_num_br e
+# parse_br_number (um valor por vez) não pagam o import deles.
+
+# sinal, parte inteira (com ou sem pontos de milhar) e decimais após a vírgula;
+# "R$" e espaços nas pontas são ignorados antes de validar
+BR_NUMBER_RE = r"^(?P<sign>-?)(?P<int>\d{1,3}(?:\.\d{3})+|\d+)?(?:,(?P<dec>\d+))?$"
+
+# validação da coluna inteira, aceitando também "(1.234,56)" e exigindo ao menos
+# um dígito (sem grupos nomeados: sintaxe RE2 do pyarrow)
+_NUM = r"(?:(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?|,\d+)"
+BR_COLUMN_RE = rf"^(?:-?{_NUM}|\({_NUM}\))$"
+
+_BR_NUMBER = re.compile(BR_NUMBER_RE)
+
+
+def parse_num_br(s):
+    """Converte '1.234.567,89' -> 1234567.89, retorna None se não for número."""
+    if s is None:
+        return None
+    s = str(s).strip()
+    if s == "":
+        return None
+    # manter dígitos, pontos, vírgulas, hífen
+    s = re.sub(r"[^\d\-,\.]", "", s)
+    # se ambos presentes, remover pontos (milhares) e trocar vírgula por ponto
+    if "." in s and "," in s:
+        s = s.replace(".", "").replace(",", ".")
+    else:
+        # trocar vírgula por ponto se for decimal
+        if "," in s and s.count(",") == 1 and s.count(".") == 0:
+            s = s.replace(",", ".")
+        else:
+            s = s.replace(",", ".")
+    try:
+        return float(s)
+    except:
+        return None
+
+
+def normalize_br_number(s):
+    """'(1.234,56)' -> '-1234.56' (texto pronto para float/Decimal); None se não for número BR."""
+    if s is None:
+        return None
+    s = str(s).replace("R$", "").strip()
+    if len(s) > 2 and s[0] == "(" and s[-1] == ")":
+        s = "-" + s[1:-1]
+    m = _BR_NUMBER.match(s)
+    if not m or (m.group("int") is None and m.group("dec") is None):
+        return None
+    dec = "." + m.group("dec") if m.group("dec") else ""
+    return f"{m.group('sign')}{(m.group('int') or '0').replace('.', '')}{dec}"
+
+
+def parse_br_number(s, exact=False):
+    """Um valor no formato BR -> float (ou Decimal com exact=True); None se não for número."""
+    text = normalize_br_number(s)
+    if text is None:
+        return None
+    return Decimal(text) if exact else float(text)
+
+
+@lru_cache(maxsize=None)
+def _has_arrow():
+    try:
+        import pyarrow.compute  # noqa: F401
+    except ImportError:  # sem pyarrow: parse_br_series usa as operações .str do pandas
+        return False
+    return True
+
+
+def _parse_arrow(values, exact):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = pa.array(values, type=pa.string(), from_pandas=True)
+    text = pc.utf8_trim_whitespace(pc.replace_substring(text, "R$", ""))
+    valid = pc.match_substring_regex(text, BR_COLUMN_RE)
+    negative = pc.starts_with(text, "(")
+    text = pc.replace_substring(pc.replace_substring(pc.utf8_trim(text, "()"), ".", ""), ",", ".")
+    text = pc.if_else(valid, text, pa.scalar(None, pa.string()))
+    if exact:
+        text = pc.if_else(negative, pc.binary_join_element_wise("-", text, ""), text)
+        return [Decimal(t) if t is not None else None for t in text.to_pylist()]
+    floats = pc.cast(text, pa.float64())
+    return pc.if_else(negative, pc.negate(floats), floats).to_numpy(zero_copy_only=False)
+
+
+def _parse_pandas(values, exact):
+    import numpy as np
+    import pandas as pd
+
+    text = values.astype(object).where(values.notna(), None).str.replace("R$", "", regex=False).str.strip()
+    valid = text.str.fullmatch(BR_COLUMN_RE[1:-1]).fillna(False).astype(bool)
+    negative = text.str.startswith("(").fillna(False).astype(bool)
+    text = text.str.strip("()").str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    text = text.mask(negative, "-" + text).where(valid)
+    if exact:
+        return [Decimal(t) if isinstance(t, str) else None for t in text]
+    return pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def parse_br_series(values, exact=False):
+    """
+    Converte uma coluna (Series/lista) de valores BR de uma vez.
+    Retorna Series float64 (NaN onde não é número) ou, com exact=True,
+    Series de Decimal (None onde não é número). Colunas já numéricas
+    passam direto. Usa pyarrow.compute se disponível; senão, .str do pandas.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, dtype=object)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype(object).map(lambda v: Decimal(str(v))) if exact else values.astype(np.float64)
+    if not pd.api.types.is_string_dtype(values.dtype) or values.dtype == object:
+        values = values.where(values.isna(), values.astype(str))
+
+    parsed = _parse_arrow(values, exact) if _has_arrow() else _parse_pandas(values, exact)
+    return pd.Series(parsed, index=values.index, dtype=object if exact else np.float64)
@@ -0,0 +1,316 @@
+# browser_pool.py
+# Ciclo de vida do navegador para workers de longa duração (batch.py).
+# Cada worker tem um ManagedBrowser (a sync_api do Playwright é presa à thread)
+# que:
+#   - reaproveita o mesmo contexto entre fundos (sem abrir um por CNPJ);
+#   - ao fim de cada fundo fecha TODAS as páginas do contexto, inclusive os
+#     popups do Balancete (que o scrape_balancete só fecha no caminho feliz),
+#     e limpa cookies/armazenamento;
+#   - descarta o contexto depois de um fundo com erro (estado incerto);
+#   - recicla o contexto a cada N fundos e o navegador a cada M fundos ou
+#     quando o RSS do próprio Chromium (o processo principal que ele lançou e
+#     os filhos: renderers, GPU...) passa do limite, para a memória ficar
+#     estável em execuções de horas. O limite é por worker: os navegadores
+#     dos outros workers não entram na conta.
+# PoolStats soma os eventos de todos os workers (vai para o summary.json).
+#
+# Uso:
+#   stats = PoolStats()
+#   with sync_playwright() as p, ManagedBrowser(p, headless=True, stats=stats) as slot:
+#       with slot.page() as page:
+#           scrape_balancete(page, cnpj)
+#   log(stats.summary())
+
+import os
+import threading
+from contextlib import contextmanager
+
+from loading_profile import LoadingProfile
+
+DEFAULT_CONTEXT_FUNDS = 25
+DEFAULT_BROWSER_FUNDS = 200
+DEFAULT_MAX_RSS_MB = 2048
+
+# launch() serializado entre os workers: os processos novos que aparecem
+# durante o launch são os do navegador deste worker
+_LAUNCH_LOCK = threading.Lock()
+
+
+# --------------------------
+# MEMÓRIA
+# --------------------------
+def _proc_children():
+    """{pid: [filhos]} a partir de /proc (Linux)."""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", encoding="utf-8") as fh:
+                # o nome do processo vem entre parênteses e pode ter espaços
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _proc_parents():
+    """{pid: pai} a partir de /proc; {} onde não há /proc."""
+    if not os.path.isdir("/proc"):
+        return {}
+    return {child: ppid for ppid, kids in _proc_children().items() for child in kids}
+
+
+def new_browser_pids(before):
+    """
+    Processos principais de navegador criados desde `before` ({pid: pai} de
+    _proc_parents): os novos cujo pai é um driver do Playwright, isto é, um
+    filho direto deste processo Python. Renderers de outros navegadores
+    (netos do driver) ficam de fora.
+    """
+    after = _proc_parents()
+    drivers = {pid for pid, ppid in after.items() if ppid == os.getpid()}
+    return [pid for pid, ppid in after.items() if pid not in before and ppid in drivers]
+
+
+def tree_rss_mb(pid=None):
+    """
+    RSS (MiB) do processo e de todos os descendentes — o Chromium roda em
+    processos filhos do driver do Playwright, fora do RSS do Python.
+    None onde não há /proc (macOS/Windows): a reciclagem por memória fica desligada.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    pid = pid or os.getpid()
+    children = _proc_children()
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += _rss_kb(current)
+        stack.extend(children.get(current, ()))
+    return round(total / 1024, 1)
+
+
+# --------------------------
+# ESTATÍSTICAS
+# --------------------------
+class PoolStats:
+    """Contadores do ciclo de vida, somados entre os workers. Seguro entre threads."""
+
+    FIELDS = ("funds", "browsers_launched", "contexts_created", "pages_opened", "pages_closed", "popups_closed",
+              "contexts_discarded")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self.recycles = {}   # motivo -> vezes (context_funds, browser_funds, rss)
+        self.peak_rss_mb = None
+        self.last_rss_mb = None
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def recycled(self, reason):
+        with self._lock:
+            self.recycles[reason] = self.recycles.get(reason, 0) + 1
+
+    def rss(self, value):
+        if value is None:
+            return
+        with self._lock:
+            self.last_rss_mb = value
+            self.peak_rss_mb = max(self.peak_rss_mb or 0, value)
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.counts, "recycles": dict(self.recycles), "peak_rss_mb": self.peak_rss_mb,
+                    "last_rss_mb": self.last_rss_mb}
+
+    def summary(self):
+        s = self.snapshot()
+        recycles = ", ".join(f"{k}={v}" for k, v in sorted(s["recycles"].items())) or "nenhuma"
+        rss = f", pico de RSS {s['peak_rss_mb']:.0f} MiB" if s["peak_rss_mb"] else ""
+        return (f"Navegadores: {s['browsers_launched']} abertos, {s['contexts_created']} contextos para "
+                f"{s['funds']} fundos; {s['pages_closed']} páginas fechadas ({s['popups_closed']} popups); "
+                f"reciclagens: {recycles}{rss}")
+
+
+# --------------------------
+# NAVEGADOR GERENCIADO (um por worker)
+# --------------------------
+class ManagedBrowser:
+    """
+    Navegador + contexto reaproveitados por um worker. Não é seguro entre
+    threads: cada thread cria o seu (com o seu sync_playwright()).
+    context_funds / browser_funds: fundos antes de reciclar o contexto / o
+    navegador (0 desliga). max_rss_mb: limite do RSS do Chromium deste worker
+    (processo principal + filhos; 0 desliga), checado depois de cada fundo.
+    light: instala o loading_profile em cada contexto; last_loading traz o que
+    o último fundo bloqueou/carregou.
+    """
+
+    def __init__(self, playwright, headless=True, light=False, stats=None, context_funds=DEFAULT_CONTEXT_FUNDS,
+                 browser_funds=DEFAULT_BROWSER_FUNDS, max_rss_mb=DEFAULT_MAX_RSS_MB, context_options=None):
+        self.playwright = playwright
+        self.headless = headless
+        self.light = light
+        self.stats = stats or PoolStats()
+        self.context_funds = context_funds
+        self.browser_funds = browser_funds
+        self.max_rss_mb = max_rss_mb
+        self.context_options = {"accept_downloads": True, **(context_options or {})}
+        self.browser = None
+        self.browser_pids = []   # processos principais do Chromium lançado por este worker
+        self.context = None
+        self.profile = None
+        self._browser_count = 0
+        self._context_count = 0
+        self.last_loading = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- abertura / fechamento ----
+    def _ensure_context(self):
+        if self.browser is None or not self.browser.is_connected():
+            with _LAUNCH_LOCK:
+                before = _proc_parents()
+                self.browser = self.playwright.chromium.launch(headless=self.headless)
+                self.browser_pids = new_browser_pids(before)
+            self._browser_count = 0
+            self.context = None
+            self.stats.add("browsers_launched")
+        if self.context is None:
+            self.context = self.browser.new_context(**self.context_options)
+            self.profile = LoadingProfile().install(self.context) if self.light else None
+            self._context_count = 0
+            self.stats.add("contexts_created")
+        return self.context
+
+    def warm(self):
+        """Abre navegador e contexto já, para o primeiro fundo não pagar a partida a frio."""
+        self._ensure_context()
+        return self
+
+    def close_context(self):
+        if self.context is not None:
+            try:
+                self.context.close()
+            except Exception:
+                pass
+        self.context = None
+        self.profile = None
+
+    def close(self):
+        self.close_context()
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+        self.browser = None
+        self.browser_pids = []
+
+    def _close_pages(self, main):
+        """Fecha todas as páginas abertas no contexto (a principal e popups). Retorna quantas fechou."""
+        closed = 0
+        for page in list(self.context.pages):
+            try:
+                page.close()
+            except Exception:
+                continue
+            closed += 1
+            if page is not main:
+                self.stats.add("popups_closed")
+        return closed
+
+    # ---- um fundo ----
+    @contextmanager
+    def page(self):
+        """
+        Rende uma página nova no contexto reaproveitado. Na saída fecha todas as
+        páginas, limpa cookies e decide se recicla contexto/navegador. Em erro o
+        contexto é descartado (o próximo fundo começa num limpo).
+        """
+        context = self._ensure_context()
+        before = self.profile.stats() if self.profile else None
+        page = context.new_page()
+        self.stats.add("pages_opened")
+        ok = False
+        try:
+            yield page
+            ok = True
+        finally:
+            self.last_loading = self._loading_delta(before)
+            self.stats.add("funds")
+            self._context_count += 1
+            self._browser_count += 1
+            try:
+                self.stats.add("pages_closed", self._close_pages(page))
+                context.clear_cookies()
+            except Exception:
+                ok = False
+            if not ok:
+                self.stats.add("contexts_discarded")
+                self.close_context()
+            self._maybe_recycle()
+
+    def _loading_delta(self, before):
+        if before is None or self.profile is None:
+            return None
+        after = self.profile.stats()
+        return {
+            "blocked": after["blocked"] - before["blocked"],
+            "allowed": after["allowed"] - before["allowed"],
+            "bytes_loaded": after["bytes_loaded"] - before["bytes_loaded"],
+        }
+
+    def browser_rss_mb(self):
+        """RSS (MiB) do Chromium deste worker; None sem /proc ou sem o pid do navegador."""
+        if not self.browser_pids:
+            return None
+        sizes = [tree_rss_mb(pid) for pid in self.browser_pids]
+        return None if None in sizes else round(sum(sizes), 1)
+
+    def _maybe_recycle(self):
+        rss = self.browser_rss_mb()
+        self.stats.rss(rss)
+        if self.max_rss_mb and rss is not None and rss > self.max_rss_mb:
+            self.stats.recycled("rss")
+            self.close()
+        elif self.browser_funds and self._browser_count >= self.browser_funds:
+            self.stats.recycled("browser_funds")
+            self.close()
+        elif self.context is not None and self.context_funds and self._context_count >= self.context_funds:
+            self.stats.recycled("context_funds")
+            self.close_context()
+
+
+def add_pool_args(parser):
+    parser.add_argument("--context-funds", type=int, default=DEFAULT_CONTEXT_FUNDS, metavar="N",
+                        help="fundos por contexto antes de recriá-lo (0 = nunca)")
+    parser.add_argument("--browser-funds", type=int, default=DEFAULT_BROWSER_FUNDS, metavar="N",
+                        help="fundos por navegador antes de reabri-lo (0 = nunca)")
+    parser.add_argument("--max-rss-mb", type=int, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help="reabre o navegador do worker se o RSS do Chromium dele passar disso (0 = sem limite)")
+
+
+def pool_options_from_args(args):
+    """kwargs de ManagedBrowser a partir dos argumentos de add_pool_args."""
+    return {"context_funds": args.context_funds, "browser_funds": args.browser_funds, "max_rss_mb": args.max_rss_mb}
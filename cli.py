@@ -0,0 +1,51 @@
+# cli.py
+# Ponto de entrada único, com subcomandos. Cada subcomando importa o seu
+# módulo só quando é escolhido: `cli.py --help` não importa nada do projeto,
+# `parse`/`export` não carregam o Playwright, `export` nem o pandas.
+# Os argumentos depois do subcomando vão inteiros para o main() do módulo.
+#
+# Uso:
+#   python cli.py scrape 32.811.422/0001-33
+#   python cli.py fetch 32811422000133 --base-url http://127.0.0.1:8765
+#   python cli.py batch cnpjs.txt --workers 4
+#   python cli.py history 32811422000133 --workers 4
+#   python cli.py parse saida/*/balancete_popup.html --workers 8
+#   python cli.py export saida/*/balancete_popup.html --ndjson todas.ndjson --parquet todas.parquet
+#   python cli.py serve --port 8080
+#   python cli.py parse --help
+
+import argparse
+import importlib
+import sys
+
+# subcomando -> (módulo com main(argv), descrição)
+COMMANDS = {
+    "scrape": ("scraping", "fluxo do navegador para um CNPJ (Playwright)"),
+    "fetch": ("http_fetch", "Balancete de um CNPJ via HTTP, com fallback para o navegador"),
+    "batch": ("batch", "lote de CNPJs em paralelo (navegador)"),
+    "history": ("history", "série histórica de um fundo, via HTTP"),
+    "parse": ("parse_html", "parseia páginas de Balancete salvas -> CSV/JSON"),
+    "export": ("row_stream", "exporta páginas salvas em fluxo -> CSV/NDJSON/Parquet"),
+    "serve": ("service", "serviço HTTP GET /balancete/{cnpj}"),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Balancetes de fundos do cvmweb (CVM).",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="subcomandos:\n" + "\n".join(f"  {name:<9} {desc}" for name, (_, desc) in COMMANDS.items())
+        + "\n\n`cli.py <subcomando> --help` mostra as opções de cada um.",
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="subcomando", help="ver a lista abaixo")
+    # só o subcomando é lido aqui; o resto (inclusive --help) é do módulo
+    args = parser.parse_args(argv[:1])
+
+    module, _ = COMMANDS[args.command]
+    sys.argv[0] = f"cli.py {args.command}"  # prog dos --help dos módulos
+    return importlib.import_module(module).main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# fund_index.py
+# Índice local CNPJ -> fundos/classes do cvmweb, montado aos poucos a partir
+# das próprias buscas (FormBuscaParticFdo.aspx -> ResultBuscaParticFdo.aspx).
+# Para cada linha da lista de resultado guarda Cód. CVM, nome, tipo, a
+# posição do link (Linkbutton4) e o alvo da postback; quando o fundo é aberto,
+# guarda também a URL da página do fundo (ResultConsultaParticFdo.aspx?PK_PARTIC=...).
+#
+# Com a URL no índice, as execuções seguintes vão direto à página do fundo,
+# sem a busca (uma postback a menos por fundo). Quando o CNPJ tem várias
+# classes, a escolha é determinística: o Cód. CVM pedido ou, sem ele, o menor
+# Cód. CVM (com aviso listando as outras), em vez do primeiro link da página.
+#
+# Uso:
+#   python fund_index.py build cnpjs.txt [--base-url http://127.0.0.1:8765]
+#   python fund_index.py show 32811422000133
+#   python fund_index.py stats
+#   python batch.py cnpjs.txt --fund-index            (consulta e alimenta o índice)
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+
+DEFAULT_PATH = os.environ.get("CVM_FUND_INDEX", ".cvm_fund_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS funds (
+    cnpj           TEXT NOT NULL,
+    position       INTEGER NOT NULL,
+    cod_cvm        TEXT,
+    nome           TEXT,
+    tipo           TEXT,
+    cnpj_text      TEXT,
+    event_target   TEXT,
+    event_argument TEXT,
+    fund_url       TEXT,
+    seen_at        REAL NOT NULL,
+    opened_at      REAL,
+    PRIMARY KEY (cnpj, position)
+);
+"""
+
+POSTBACK_RE = re.compile(r"__doPostBack\('([^']*)'\s*,\s*'([^']*)'\)")
+CNPJ_TEXT_RE = re.compile(r"\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}")
+
+COLUMNS = ("cnpj_text", "nome", "tipo", "cod_cvm", "event_target", "event_argument", "fund_url")
+
+
+class FundEntry:
+    """Uma linha da lista de resultado da busca (um fundo/classe do CNPJ)."""
+
+    __slots__ = ("cnpj", "position") + COLUMNS
+
+    def __init__(self, cnpj, position, cnpj_text=None, nome=None, tipo=None, cod_cvm=None, event_target=None,
+                 event_argument=None, fund_url=None):
+        self.cnpj = cnpj
+        self.position = position
+        self.cnpj_text = cnpj_text
+        self.nome = nome
+        self.tipo = tipo
+        self.cod_cvm = cod_cvm
+        self.event_target = event_target
+        self.event_argument = event_argument
+        self.fund_url = fund_url
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"FundEntry({self.cnpj}#{self.position} cod_cvm={self.cod_cvm} {self.nome!r})"
+
+
+# --------------------------
+# LISTA DE RESULTADO DA BUSCA
+# --------------------------
+def _key(text):
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z]", "", text)
+
+
+# cabeçalho da tabela -> campo
+HEADER_FIELDS = {"cnpj": "cnpj_text", "nome": "nome", "denominacao": "nome", "tipo": "tipo",
+                 "tipodeparticipante": "tipo", "codcvm": "cod_cvm", "codigocvm": "cod_cvm"}
+
+
+def parse_search_results(html, cnpj):
+    """
+    FundEntry de cada link Linkbutton4 da página de resultado, na ordem da
+    página (position = índice em a[id*='Linkbutton4']). As colunas vêm do
+    cabeçalho da tabela; sem ele, CNPJ e Cód. CVM são reconhecidos pelo formato.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "html.parser")
+    entries = []
+    for position, link in enumerate(soup.select("a[id*='Linkbutton4']")):
+        entry = FundEntry(cnpj, position, nome=link.get_text(" ", strip=True))
+        m = POSTBACK_RE.search(link.get("href") or "")
+        if m:
+            entry.event_target, entry.event_argument = m.groups()
+        row = link.find_parent("tr")
+        if row is not None:
+            cells = row.find_all("td", recursive=False)
+            table = row.find_parent("table")
+            header = table.find("tr") if table is not None else None
+            if header is row or (header is not None and header.find("a", id=re.compile("Linkbutton4"))):
+                header = None
+            names = [HEADER_FIELDS.get(_key(td.get_text())) for td in header.find_all(["td", "th"])] if header else []
+            for i, td in enumerate(cells):
+                text = td.get_text(" ", strip=True)
+                field = names[i] if i < len(names) and names[i] else None
+                if field is None or td.find("a") is link:
+                    if CNPJ_TEXT_RE.fullmatch(text):
+                        field = "cnpj_text"
+                    elif text.isdigit() and not entry.cod_cvm:
+                        field = "cod_cvm"
+                    else:
+                        continue
+                if field != "nome":
+                    setattr(entry, field, text)
+        entries.append(entry)
+    return entries
+
+
+def choose_entry(entries, cod_cvm=None):
+    """
+    Fundo/classe a abrir: o do Cód. CVM pedido (LookupError se não estiver na
+    lista), o único, ou — com várias classes — o de menor Cód. CVM.
+    None se a lista estiver vazia.
+    """
+    if not entries:
+        return None
+    if cod_cvm is not None:
+        cod_cvm = str(cod_cvm).strip()
+        for e in entries:
+            if e.cod_cvm == cod_cvm:
+                return e
+        raise LookupError(f"Cód. CVM {cod_cvm} não está entre as classes do CNPJ {entries[0].cnpj}: "
+                          + ", ".join(str(e.cod_cvm) for e in entries))
+    if len(entries) == 1:
+        return entries[0]
+    chosen = min(entries, key=lambda e: (int(e.cod_cvm) if (e.cod_cvm or "").isdigit() else float("inf"),
+                                         e.position))
+    from scraping import log
+
+    log(f"⚠️ CNPJ {chosen.cnpj} tem {len(entries)} classes; usando Cód. CVM {chosen.cod_cvm} ({chosen.nome}). "
+        f"Outras: " + ", ".join(f"{e.cod_cvm} ({e.nome})" for e in entries if e is not chosen))
+    return chosen
+
+
+# --------------------------
+# ÍNDICE EM SQLITE
+# --------------------------
+class FundIndex:
+    """Fundos/classes conhecidos por CNPJ, em SQLite. Seguro entre threads."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def entries(self, cnpj):
+        with self._lock:
+            rows = self._db.execute(f"SELECT cnpj, position, {', '.join(COLUMNS)} FROM funds WHERE cnpj=? "
+                                    "ORDER BY position", (cnpj,)).fetchall()
+        return [FundEntry(*row) for row in rows]
+
+    def choose(self, cnpj, cod_cvm=None):
+        """choose_entry sobre as classes indexadas do CNPJ (None se o CNPJ não estiver no índice)."""
+        return choose_entry(self.entries(cnpj), cod_cvm)
+
+    def record_search(self, cnpj, html):
+        """
+        Indexa a lista de resultado da busca do CNPJ (substitui a anterior). A
+        URL do fundo já conhecida é mantida quando o Cód. CVM continua na lista.
+        Retorna as FundEntry.
+        """
+        entries = parse_search_results(html, cnpj)
+        now = time.time()
+        with self._lock:
+            known = {cod: (url, opened) for cod, url, opened in self._db.execute(
+                "SELECT cod_cvm, fund_url, opened_at FROM funds WHERE cnpj=? AND fund_url IS NOT NULL", (cnpj,))}
+            rows = []
+            for e in entries:
+                url, opened = known.get(e.cod_cvm, (None, None)) if e.cod_cvm else (None, None)
+                e.fund_url = url
+                rows.append((e.cnpj, e.position, *(getattr(e, c) for c in COLUMNS), now, opened))
+            self._db.execute("DELETE FROM funds WHERE cnpj=?", (cnpj,))
+            self._db.executemany(f"INSERT INTO funds (cnpj, position, {', '.join(COLUMNS)}, seen_at, opened_at) "
+                                 f"VALUES ({', '.join('?' * (len(COLUMNS) + 4))})", rows)
+            self._db.commit()
+        return entries
+
+    def record_opened(self, cnpj, position, url):
+        """Guarda a URL da página do fundo aberta a partir do link `position`."""
+        with self._lock:
+            self._db.execute("UPDATE funds SET fund_url=?, opened_at=? WHERE cnpj=? AND position=?",
+                             (url, time.time(), cnpj, position))
+            self._db.commit()
+
+    def forget_url(self, cnpj, position):
+        """Descarta a URL direta (ex.: a página não tinha mais o link do Balancete)."""
+        self.record_opened(cnpj, position, None)
+
+    def stats(self):
+        with self._lock:
+            cnpjs, entries, direct = self._db.execute(
+                "SELECT COUNT(DISTINCT cnpj), COUNT(*), COUNT(fund_url) FROM funds").fetchone()
+            multi = self._db.execute(
+                "SELECT COUNT(*) FROM (SELECT cnpj FROM funds GROUP BY cnpj HAVING COUNT(*) > 1)").fetchone()[0]
+        return {"cnpjs": cnpjs, "entries": entries, "with_url": direct, "multi_class": multi}
+
+
+def is_fund_page_url(url, results_url=None):
+    """URL que abre a página do fundo por GET (e não a própria lista de resultado)."""
+    return bool(url) and url != results_url and "PK_PARTIC=" in url.upper()
+
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None):
+    from scraping import log, normalize_cnpj
+
+    parser = argparse.ArgumentParser(description="Índice local CNPJ -> fundos/classes do cvmweb.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="arquivo SQLite do índice")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="busca (via HTTP) os CNPJs que ainda não estão no índice")
+    p_build.add_argument("source", help="arquivo com um CNPJ por linha, ou '-' para stdin")
+    p_build.add_argument("--base-url", default=None, help="ex.: http://127.0.0.1:8765 para o stub_server.py")
+    p_build.add_argument("--refresh", action="store_true", help="busca de novo CNPJs já indexados")
+    p_show = sub.add_parser("show", help="classes indexadas de um CNPJ")
+    p_show.add_argument("cnpj")
+    sub.add_parser("stats", help="totais do índice")
+    args = parser.parse_args(argv)
+
+    index = FundIndex(args.db)
+    if args.command == "stats":
+        log(index.stats())
+        return 0
+    if args.command == "show":
+        entries = index.entries(normalize_cnpj(args.cnpj))
+        for e in entries:
+            log(f"#{e.position} Cód. CVM {e.cod_cvm} | {e.tipo} | {e.nome} | {e.fund_url or '(sem URL direta)'}")
+        return 0 if entries else 1
+
+    from batch import read_cnpjs
+    from http_fetch import BASE_URL, CvmHttpClient, decode_html
+
+    failed = 0
+    with CvmHttpClient(args.base_url or BASE_URL) as client:
+        for raw in read_cnpjs(args.source):
+            try:
+                cnpj = normalize_cnpj(raw)
+                if index.entries(cnpj) and not args.refresh:
+                    continue
+                # uma busca; depois abre cada classe a partir da mesma lista para guardar as URLs
+                results = client.search(cnpj)
+                entries = index.record_search(cnpj, decode_html(results))
+                for e in entries:
+                    fund = client.open_fund(results, e.position)
+                    if is_fund_page_url(fund.url, results.url):
+                        index.record_opened(cnpj, e.position, fund.url)
+                log(f"{cnpj}: {len(entries)} classes indexadas")
+            except Exception as e:
+                log(f"❌ {raw}: {type(e).__name__}: {e}")
+                failed += 1
+    log(index.stats())
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# history.py
+# Série histórica do Balancete de um fundo: lista as competências do select
+# ddCOMPTC da página do Balancete e baixa cada mês via HTTP (postback do
+# ddCOMPTC, como faz o navegador ao trocar a competência).
+# Os meses são divididos entre `workers` threads; cada thread tem a sua própria
+# sessão (CvmHttpClient), porque o ASP.NET serializa as requisições de uma mesma
+# sessão. Meses já presentes na saída (ou no page_cache) não vão ao site.
+#
+# Saída: um conjunto por (CNPJ, competência)
+#   saida/<cnpj>/<AAAA-MM>/balancete.{csv,json}
+#   saida/<cnpj>/history.json   (resumo da última execução)
+# e, com store (parquet_store.BalanceteStore), uma partição cnpj=/competencia=.
+#
+# Uso:
+#   python history.py 32.811.422/0001-33 --workers 4
+#   python history.py 32811422000133 --months 2025-08,2025-09 --base-url http://127.0.0.1:8765
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+
+import metrics
+from fund_index import DEFAULT_PATH as FUND_INDEX_PATH, FundIndex
+from http_fetch import BASE_URL, CvmHttpClient, FetchError, decode_html
+from parse_html import competencia_from_html, list_competencias, normalize_competencia, parse_balancete_html
+from scraping import log, normalize_cnpj, save_balancete
+from throttle import add_throttle_args, throttle_from_args
+
+
+def month_prefix(out_dir, cnpj, competencia):
+    """out_prefix do save_balancete para (CNPJ, competência "AAAA-MM")."""
+    return os.path.join(out_dir, cnpj, competencia, "balancete")
+
+
+def existing_months(out_dir, cnpj):
+    """Competências ("AAAA-MM") que já têm balancete.csv na saída."""
+    base = os.path.join(out_dir, cnpj)
+    if not os.path.isdir(base):
+        return set()
+    return {m for m in os.listdir(base) if os.path.exists(os.path.join(base, m, "balancete.csv"))}
+
+
+def _write_month(df, html, out_dir, cnpj, competencia, page_cache=None, store=None):
+    """Grava um mês já parseado (direto ou como write() do parse_stage). Retorna o número de linhas."""
+    if df is None or df.empty:
+        raise FetchError(f"Balancete {competencia} sem tabela")
+    if page_cache is not None:
+        page_cache.put(cnpj, competencia, "balancete", html)
+    prefix = month_prefix(out_dir, cnpj, competencia)
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    save_balancete(df, prefix)
+    if store is not None:
+        store.write(df, cnpj, competencia)
+    return len(df)
+
+
+def _save_month(html, out_dir, cnpj, competencia, page_cache=None, store=None, parse_stage=None):
+    """Parseia e grava um mês. Com parse_stage, retorna um Future do número de linhas."""
+    if parse_stage is not None:
+        return parse_stage.submit(html, partial(_write_month, html=html, out_dir=out_dir, cnpj=cnpj,
+                                                competencia=competencia, page_cache=page_cache, store=store),
+                                  cnpj=cnpj)
+    with metrics.step("parse"):
+        df = parse_balancete_html(html)
+    if df is not None:
+        metrics.count("rows_extracted", len(df))
+    with metrics.step("write"):
+        return _write_month(df, html, out_dir, cnpj, competencia, page_cache, store)
+
+
+def _finish_month(result, started, token, report, future):
+    """Callback do Future do parse_stage: completa o resultado do mês e reporta."""
+    try:
+        result["rows"] = future.result()
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        log(f"❌ [{result['worker']}] {result['competencia']}: {result['error']}")
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    report(token, result)
+
+
+# --------------------------
+# WORKER (uma sessão HTTP, vários meses)
+# --------------------------
+def _month_worker(worker_id, cnpj, next_job, report, out_dir, base_url, page_cache, store, throttle=None,
+                  parse_stage=None, fund_index=None):
+    """
+    next_job() -> ((valor do ddCOMPTC, competência), token) ou None; report(token, result).
+    Com parse_stage, a sessão só baixa: o mês é reportado quando o estágio
+    termina o parse/gravação.
+    """
+    client = None
+    balancete = None
+    try:
+        with metrics.tagged(cnpj):
+            while True:
+                item = next_job()
+                if item is None:
+                    return
+                (value, competencia), token = item
+
+                result = {"competencia": competencia, "status": "error", "rows": 0, "elapsed": 0.0,
+                          "error": None, "worker": worker_id}
+                started = time.perf_counter()
+                pending = None
+                try:
+                    if balancete is None:
+                        client = CvmHttpClient(base_url, throttle=throttle, fund_index=fund_index)
+                        balancete = client.open_fund_balancete(cnpj)
+                    balancete = client.open_competencia(balancete, value)
+                    html = decode_html(balancete)
+                    shown = competencia_from_html(html)
+                    if shown and shown != competencia:
+                        raise FetchError(f"pedida a competência {competencia}, a página mostra {shown}")
+                    saved = _save_month(html, out_dir, cnpj, competencia, page_cache, store, parse_stage)
+                    if isinstance(saved, Future):
+                        pending = saved
+                    else:
+                        result["rows"] = saved
+                        result["status"] = "ok"
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                    log(f"❌ [{worker_id}] {cnpj} {competencia}: {result['error']}")
+                    balancete = None  # sessão possivelmente perdida: recomeça no próximo mês
+                finally:
+                    if pending is None:
+                        result["elapsed"] = round(time.perf_counter() - started, 3)
+                        report(token, result)
+                    else:
+                        pending.add_done_callback(partial(_finish_month, result, started, token, report))
+    finally:
+        if client is not None:
+            client.close()
+
+
+# --------------------------
+# SÉRIE DE UM FUNDO
+# --------------------------
+def crawl_history(cnpj, out_dir="saida", workers=4, base_url=BASE_URL, months=None, force=False, page_cache=None,
+                  store=None, job_queue=None, throttle=None, parse_stage=None, fund_index=None):
+    """
+    Baixa todas as competências do Balancete de um CNPJ (ou só `months`,
+    lista de "AAAA-MM"/"MM/AAAA"). Pula meses já salvos em out_dir, a não
+    ser com force=True. store: parquet_store.BalanceteStore que também recebe
+    cada mês. job_queue: job_queue.JobQueue onde cada mês vira um item
+    (tentativas, erro e tempos ficam registrados; meses que esgotaram as
+    tentativas só voltam com retry-failed). throttle: throttle.Throttle
+    compartilhado pelas sessões (ritmo e novas tentativas). parse_stage:
+    parse_stage.ParseStage que parseia/grava os meses em outros processos
+    enquanto as sessões seguem baixando. fund_index: fund_index.FundIndex;
+    cada sessão abre o fundo direto pela URL indexada, sem a busca. Retorna a
+    lista de resultados (um dict por mês).
+    """
+    cnpj = normalize_cnpj(cnpj)
+    wanted = {normalize_competencia(m) for m in months} if months else None
+    done = set() if force else existing_months(out_dir, cnpj)
+    started = time.perf_counter()
+    results = []
+
+    with metrics.tagged(cnpj), CvmHttpClient(base_url, throttle=throttle, fund_index=fund_index) as client:
+        balancete = client.open_fund_balancete(cnpj)
+        html = decode_html(balancete)
+
+    available = list_competencias(html)
+    if not available:
+        raise FetchError("Página do Balancete sem o select de competências (ddCOMPTC)")
+    log(f"[hist] {cnpj}: {len(available)} competências disponíveis "
+        f"({available[-1][1]} a {available[0][1]}), {len(done)} já salvas")
+
+    pending = []
+    for value, competencia in available:
+        if wanted is not None and competencia not in wanted:
+            continue
+        if competencia in done:
+            results.append({"competencia": competencia, "status": "skipped", "rows": 0, "elapsed": 0.0,
+                            "error": None, "worker": None})
+            continue
+        pending.append((value, competencia))
+
+    lock = threading.Lock()
+
+    def add_result(token, result):
+        with lock:
+            results.append(result)
+
+    # a página já aberta é uma das competências; e o page_cache pode ter outras
+    default = competencia_from_html(html)
+    remote = []
+    for value, competencia in pending:
+        cached = html if competencia == default else (
+            page_cache.get(cnpj, competencia, "balancete") if page_cache is not None else None)
+        if cached is None:
+            remote.append((value, competencia))
+            continue
+        t0 = time.perf_counter()
+        result = {"competencia": competencia, "status": "ok", "rows": 0, "elapsed": 0.0, "error": None, "worker": None}
+        try:
+            saved = _save_month(cached, out_dir, cnpj, competencia, page_cache, store, parse_stage)
+            if isinstance(saved, Future):
+                saved.add_done_callback(partial(_finish_month, result, t0, None, add_result))
+                continue
+            result["rows"] = saved
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["elapsed"] = round(time.perf_counter() - t0, 3)
+        add_result(None, result)
+
+    if job_queue is None:
+        jobs = queue.Queue()
+        for item in remote:
+            jobs.put(item)
+
+        def next_job():
+            try:
+                return jobs.get_nowait(), None
+            except queue.Empty:
+                return None
+
+        report = add_result
+    else:
+        values = dict((c, v) for v, c in remote)
+        job_queue.enqueue([cnpj], list(values), reset=force)
+        job_queue.release_orphans()
+
+        def next_job():
+            while True:
+                job = job_queue.claim(cnpj=cnpj, monthly=True)
+                if job is None:
+                    return None
+                if job.competencia in values:
+                    return (values[job.competencia], job.competencia), job
+                # mês da fila que não está mais no select (ou já veio do cache)
+                job_queue.record(job, {"status": "skipped", "rows": 0, "elapsed": 0.0})
+
+        # um mês que falha volta à fila e pode ser pego de novo: vale só o último resultado
+        slots = {}
+
+        def report(job, result):
+            job_queue.record(job, result)
+            with lock:
+                if job.id in slots:
+                    results[slots[job.id]] = result
+                else:
+                    slots[job.id] = len(results)
+                    results.append(result)
+
+    n_workers = max(1, min(workers, len(remote)))
+    if remote:
+        threads = [
+            threading.Thread(target=_month_worker,
+                             args=(i, cnpj, next_job, report, out_dir, base_url, page_cache, store, throttle,
+                                   parse_stage, fund_index),
+                             daemon=True)
+            for i in range(n_workers)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    if parse_stage is not None:
+        parse_stage.join()  # meses ainda no estágio (os callbacks reportam antes de join() voltar)
+
+    results.sort(key=lambda r: r["competencia"])
+    write_history_summary(results, out_dir, cnpj, n_workers, time.perf_counter() - started)
+    return results
+
+
+def write_history_summary(results, out_dir, cnpj, workers, elapsed):
+    """Grava out_dir/<cnpj>/history.json e loga o resumo. Retorna o dict."""
+    count = {s: sum(1 for r in results if r["status"] == s) for s in ("ok", "skipped", "error")}
+    summary = {"cnpj": cnpj, "total": len(results), **count, "workers": workers,
+               "elapsed": round(elapsed, 3), "results": results}
+    os.makedirs(os.path.join(out_dir, cnpj), exist_ok=True)
+    with open(os.path.join(out_dir, cnpj, "history.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+
+    log(f"[hist] {cnpj}: {count['ok']} baixadas, {count['skipped']} já existiam, "
+        f"{count['error']} falharam em {elapsed:.1f}s ({workers} workers)")
+    for r in results:
+        if r["status"] == "error":
+            log(f"  falhou {r['competencia']}: {r['error']}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa a série histórica de balancetes de fundos (uma pasta por mês).")
+    parser.add_argument("cnpjs", nargs="+", help="CNPJs, ou um arquivo com um CNPJ por linha, ou '-' para stdin")
+    parser.add_argument("--workers", type=int, default=4, help="sessões HTTP em paralelo por fundo")
+    parser.add_argument("--out-dir", default="saida", help="diretório de saída")
+    parser.add_argument("--months", default=None, help="só estas competências, ex.: 2025-08,2025-09")
+    parser.add_argument("--force", action="store_true", help="baixa de novo meses já salvos")
+    parser.add_argument("--base-url", default=BASE_URL, help="ex.: http://127.0.0.1:8765 para o stub_server.py")
+    parser.add_argument("--cache-dir", default=None, help="usa o cache local de páginas (page_cache) neste diretório")
+    parser.add_argument("--parquet", default=None, metavar="DIR",
+                        help="grava também no dataset Parquet particionado (parquet_store) neste diretório")
+    parser.add_argument("--queue", default=None, metavar="DB",
+                        help="registra cada mês na fila persistente (job_queue) em SQLite")
+    parser.add_argument("--fund-index", nargs="?", const=FUND_INDEX_PATH, default=None, metavar="DB",
+                        help="índice local CNPJ -> fundo (fund_index): as sessões abrem o fundo sem a busca")
+    parser.add_argument("--parse-workers", type=int, default=0, metavar="N",
+                        help="parse/gravação em N processos separados (parse_stage) enquanto as sessões baixam")
+    add_throttle_args(parser)
+    metrics.add_metrics_args(parser)
+    args = parser.parse_args(argv)
+    metrics.metrics_from_args(args)
+
+    cnpjs = []
+    for item in args.cnpjs:
+        if item == "-" or os.path.isfile(item):
+            from batch import read_cnpjs
+
+            cnpjs.extend(read_cnpjs(item))
+        else:
+            cnpjs.append(item)
+
+    page_cache = None
+    if args.cache_dir:
+        from page_cache import PageCache
+
+        page_cache = PageCache(args.cache_dir)
+    store = None
+    if args.parquet:
+        from parquet_store import BalanceteStore
+
+        store = BalanceteStore(args.parquet)
+    job_queue = None
+    if args.queue:
+        from job_queue import JobQueue
+
+        job_queue = JobQueue(args.queue)
+    fund_index = FundIndex(args.fund_index) if args.fund_index else None
+    months = [m for m in (args.months or "").split(",") if m.strip()] or None
+    throttle = throttle_from_args(args, concurrency=args.workers)
+    parse_stage = None
+    if args.parse_workers:
+        from parse_stage import ParseStage
+
+        parse_stage = ParseStage(workers=args.parse_workers)
+
+    failed = 0
+    for cnpj in cnpjs:
+        try:
+            results = crawl_history(cnpj, out_dir=args.out_dir, workers=args.workers, base_url=args.base_url,
+                                    months=months, force=args.force, page_cache=page_cache, store=store,
+                                    job_queue=job_queue, throttle=throttle, parse_stage=parse_stage,
+                                    fund_index=fund_index)
+            failed += sum(1 for r in results if r["status"] == "error")
+        except Exception as e:
+            log(f"❌ {cnpj}: {type(e).__name__}: {e}")
+            failed += 1
+    if parse_stage is not None:
+        parse_stage.close()
+        log(parse_stage.summary())
+    metrics.METRICS.log_summary()
+    if args.metrics_prom:
+        metrics.METRICS.write_prometheus(args.metrics_prom)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
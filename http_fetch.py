@@ -0,0 +1,343 @@
+# http_fetch.py
+# Busca o Balancete sem navegador: repete as postbacks ASP.NET que o Playwright
+# faz em main_scrape (txtCNPJNome + btnContinuar -> Linkbutton4 -> Hyperlink5)
+# com uma requests.Session (cookies + pool de conexões), levando
+# __VIEWSTATE/__EVENTVALIDATION de uma página para a outra.
+# Se algo falhar, fetch_balancete cai para o fluxo do Playwright.
+#
+# Uso:
+#   python http_fetch.py 32.811.422/0001-33
+#   python http_fetch.py 32811422000133 --fund-index --cod-cvm 237477   (pula a busca na 2ª vez)
+#   python http_fetch.py 32811422000133 --base-url http://127.0.0.1:8765   (stub_server.py)
+
+import argparse
+import re
+import sys
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup, UnicodeDammit
+from requests.adapters import HTTPAdapter
+
+import metrics
+from fund_index import DEFAULT_PATH as FUND_INDEX_PATH, FundIndex
+from scraping import log, normalize_cnpj
+from snapshot_diff import DEFAULT_PATH as SNAPSHOTS_PATH, SnapshotStore
+from throttle import TransientError, add_throttle_args, throttle_from_args
+
+BASE_URL = "https://cvmweb.cvm.gov.br"
+START_PATH = "/SWB/default.asp?sg_sistema=fundosreg"
+SEARCH_PATH = "/SWB/Sistemas/SCW/CPublica/CConsolFdo/FormBuscaParticFdo.aspx"
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+POSTBACK_RE = re.compile(r"__doPostBack\('([^']*)'\s*,\s*'([^']*)'\)")
+
+
+class FetchError(RuntimeError):
+    """Falha numa etapa do fluxo HTTP (página inesperada, link ausente...)."""
+
+
+class FundNotFound(FetchError):
+    """A busca por CNPJ não retornou nenhum fundo."""
+
+
+def decode_html(resp):
+    """Texto da resposta; sem charset no Content-Type, deixa o bs4 detectar pelo <meta>."""
+    if "charset" in resp.headers.get("Content-Type", "").lower():
+        return resp.text
+    return UnicodeDammit(resp.content, is_html=True).unicode_markup
+
+
+def form_fields(soup, form=None):
+    """
+    Campos que o navegador enviaria num submit: inputs (menos botões e
+    checkbox/radio desmarcados) e selects com a opção selecionada.
+    """
+    form = form or soup.find("form")
+    fields = {}
+    if form is None:
+        return fields
+    for inp in form.find_all("input"):
+        name = inp.get("name")
+        kind = (inp.get("type") or "text").lower()
+        if not name or kind in ("submit", "button", "image", "reset"):
+            continue
+        if kind in ("checkbox", "radio") and not inp.has_attr("checked"):
+            continue
+        fields[name] = inp.get("value", "")
+    for sel in form.find_all("select"):
+        name = sel.get("name")
+        if not name:
+            continue
+        opt = sel.find("option", selected=True) or sel.find("option")
+        fields[name] = opt.get("value", opt.get_text()) if opt else ""
+    return fields
+
+
+def form_action(soup, page_url, form=None):
+    form = form or soup.find("form")
+    return urljoin(page_url, (form.get("action") if form else None) or page_url)
+
+
+class CvmHttpClient:
+    """
+    Cliente HTTP do cvmweb. Uma instância = uma sessão (cookies) com pool de
+    conexões; não compartilhe a mesma instância entre threads.
+    throttle: throttle.Throttle (pode ser o mesmo entre clientes/threads) que
+    limita o ritmo e repete falhas transitórias de cada etapa.
+    fund_index: fund_index.FundIndex consultado antes da busca (URL direta do
+    fundo) e alimentado com cada lista de resultado.
+    """
+
+    def __init__(self, base_url=BASE_URL, timeout=30, pool_size=10, throttle=None, fund_index=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.throttle = throttle
+        self.fund_index = fund_index
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --------------------------
+    # HTTP
+    # --------------------------
+    def _request(self, step, method, url, **kwargs):
+        def send():
+            resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            resp.raise_for_status()
+            return resp
+
+        with metrics.step(f"http_{step}"):
+            resp = send() if self.throttle is None else self.throttle.call(step, send)
+        metrics.count("bytes_fetched", len(resp.content), step=step)
+        return resp
+
+    def get(self, url, step="get"):
+        return self._request(step, "GET", url)
+
+    def post(self, url, data, referer=None, step="post"):
+        headers = {"Referer": referer} if referer else None
+        return self._request(step, "POST", url, data=data, headers=headers)
+
+    def submit(self, resp, extra=None, button=None, step="post"):
+        """Envia o form da página `resp` com os campos atuais + extra (+ botão clicado)."""
+        soup = BeautifulSoup(decode_html(resp), "html.parser")
+        data = form_fields(soup)
+        data.update(extra or {})
+        if button:
+            btn = soup.find("input", attrs={"name": button})
+            data[button] = btn.get("value", "") if btn else ""
+        return self.post(form_action(soup, resp.url), data, referer=resp.url, step=step)
+
+    def follow(self, resp, anchor, step="follow"):
+        """Segue um <a>: postback (javascript:__doPostBack) ou href comum."""
+        href = anchor.get("href") or ""
+        m = POSTBACK_RE.search(href)
+        if m:
+            return self.submit(resp, {"__EVENTTARGET": m.group(1), "__EVENTARGUMENT": m.group(2)}, step=step)
+        if not href or href.lower().startswith("javascript:"):
+            raise FetchError(f"Link sem destino navegável: {anchor}")
+        return self.get(urljoin(resp.url, href), step=step)
+
+    # --------------------------
+    # FLUXO
+    # --------------------------
+    def search(self, cnpj):
+        """Busca o CNPJ. Retorna a resposta com a lista de fundos (links Linkbutton4)."""
+        form = self.get(self.base_url + SEARCH_PATH, step="search_frame")
+        return self.submit(form, {"txtCNPJNome": cnpj}, button="btnContinuar", step="search_submit")
+
+    def fund_links(self, results):
+        soup = BeautifulSoup(decode_html(results), "html.parser")
+        return soup.select("a[id*='Linkbutton4']")
+
+    def open_fund(self, results, index=0):
+        links = self.fund_links(results)
+        log(f"Fundos encontrados: {len(links)}")
+        if not links:
+            raise FundNotFound("Nenhum fundo encontrado")
+        return self.follow(results, links[index], step="fund_click")
+
+    def open_balancete(self, fund):
+        soup = BeautifulSoup(decode_html(fund), "html.parser")
+        link = soup.select_one("#Hyperlink5") or soup.select_one("a[id*='Hyperlink5']")
+        if link is None:
+            link = next((a for a in soup.find_all("a") if "balanc" in (a.get("href") or "").lower()), None)
+        if link is None:
+            raise FetchError("Link do Balancete (#Hyperlink5) não encontrado")
+        return self.follow(fund, link, step="balancete_open")
+
+    def open_competencia(self, balancete, value):
+        """Troca a competência do Balancete (postback do select ddCOMPTC). `value` = valor da opção."""
+        return self.submit(balancete, {"ddCOMPTC": value, "__EVENTTARGET": "ddCOMPTC", "__EVENTARGUMENT": ""},
+                           step="competencia")
+
+    def open_fund_page(self, cnpj, cod_cvm=None):
+        """
+        Página do fundo do CNPJ. Busca -> link da classe escolhida
+        (fund_index.choose_entry: o Cód. CVM pedido ou, com várias classes, o
+        menor). Com fund_index, o resultado da busca e a URL do fundo ficam
+        indexados. Retorna (resposta, FundEntry ou None).
+        """
+        from fund_index import choose_entry, is_fund_page_url, parse_search_results
+
+        results = self.search(cnpj)
+        html = decode_html(results)
+        if self.fund_index is not None:
+            entries = self.fund_index.record_search(cnpj, html)
+        else:
+            entries = parse_search_results(html, cnpj)
+        entry = choose_entry(entries, cod_cvm)
+        fund = self.open_fund(results, entry.position if entry else 0)
+        if self.fund_index is not None and entry is not None and is_fund_page_url(fund.url, results.url):
+            self.fund_index.record_opened(cnpj, entry.position, fund.url)
+        return fund, entry
+
+    def open_fund_balancete(self, cnpj, cod_cvm=None):
+        """
+        Busca -> fundo -> Balancete. Retorna a resposta (para postbacks seguintes).
+        Se o fund_index já tem a URL do fundo, pula a busca; se a página direta
+        falhar (ou não tiver o link do Balancete), descarta a URL e busca.
+        """
+        cnpj = normalize_cnpj(cnpj)
+        try:
+            entry = self.fund_index.choose(cnpj, cod_cvm) if self.fund_index is not None else None
+        except LookupError:
+            entry = None  # classe pedida ainda não indexada: a busca atualiza o índice
+        if entry is not None and entry.fund_url:
+            log(f"[http] {cnpj}: fundo direto pelo índice (Cód. CVM {entry.cod_cvm})...")
+            try:
+                if not self.session.cookies:
+                    # as postbacks seguintes (ex.: ddCOMPTC) exigem o cookie de sessão do ASP.NET,
+                    # emitido pela página de busca; um GET basta (sem a postback da busca)
+                    self.get(self.base_url + SEARCH_PATH, step="search_frame")
+                balancete = self.open_balancete(self.get(entry.fund_url, step="fund_direct"))
+                metrics.count("fund_index_hits")
+                return balancete
+            except (requests.RequestException, FetchError) as e:
+                log(f"[http] URL do índice falhou ({e}); refazendo a busca...")
+                self.fund_index.forget_url(cnpj, entry.position)
+        log(f"[http] Buscando {cnpj}...")
+        fund, _ = self.open_fund_page(cnpj, cod_cvm)
+        balancete = self.open_balancete(fund)
+        log(f"[http] Balancete obtido: {balancete.url}")
+        return balancete
+
+    def fetch_balancete_html(self, cnpj, cod_cvm=None):
+        """Busca -> fundo -> Balancete. Retorna o HTML do Balancete."""
+        return decode_html(self.open_fund_balancete(cnpj, cod_cvm))
+
+
+# --------------------------
+# HTTP COM FALLBACK PARA O PLAYWRIGHT
+# --------------------------
+def fetch_balancete(cnpj, out_prefix="balancete", client=None, browser_fallback=True, page_cache=None,
+                    store=None, snapshots=None, cod_cvm=None):
+    """
+    Obtém e salva o balancete de um CNPJ. Lê do page_cache se houver; senão
+    tenta HTTP puro e, se falhar e browser_fallback=True, usa o fluxo do
+    Playwright (scraping.scrape_balancete). store e snapshots: ver
+    scraping.persist_balancete. cod_cvm escolhe a classe quando o CNPJ tem
+    várias (ver fund_index.choose_entry). Retorna DataFrame.
+    """
+    from parse_html import parse_balancete_html
+    from scraping import load_cached_balancete, persist_balancete
+
+    cnpj = normalize_cnpj(cnpj)
+    if page_cache is not None:
+        df = load_cached_balancete(page_cache, cnpj, out_prefix, store=store, snapshots=snapshots)
+        if df is not None:
+            return df
+
+    own_client = client is None
+    client = client or CvmHttpClient()
+    start_url = client.base_url + START_PATH
+    fund_index = client.fund_index
+    try:
+        html = client.fetch_balancete_html(cnpj, cod_cvm)
+        with metrics.step("parse"):
+            df = parse_balancete_html(html)
+        if df is None or df.empty:
+            raise FetchError("Página do Balancete sem tabela")
+        metrics.count("rows_extracted", len(df))
+        with metrics.step("write"):
+            persist_balancete(df, out_prefix, cnpj=cnpj, html=html, page_cache=page_cache, store=store,
+                              snapshots=snapshots)
+        return df
+    except FundNotFound:
+        raise   # resposta final do site: o navegador também não acharia o fundo
+    except (requests.RequestException, FetchError, TransientError) as e:
+        if not browser_fallback:
+            raise
+        log(f"[http] falhou ({e}); usando Playwright...")
+    finally:
+        if own_client:
+            client.close()
+
+    from playwright.sync_api import sync_playwright
+    from scraping import scrape_balancete
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            page = browser.new_context(accept_downloads=True).new_page()
+            return scrape_balancete(page, cnpj, out_prefix=out_prefix, url=start_url, page_cache=page_cache,
+                                    store=store, snapshots=snapshots, fund_index=fund_index, cod_cvm=cod_cvm)
+        finally:
+            browser.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa o balancete de um fundo via HTTP (sem navegador).")
+    parser.add_argument("cnpj")
+    parser.add_argument("--base-url", default=BASE_URL, help="ex.: http://127.0.0.1:8765 para o stub_server.py")
+    parser.add_argument("--out-prefix", default="balancete")
+    parser.add_argument("--no-fallback", action="store_true", help="não cair para o Playwright em caso de erro")
+    parser.add_argument("--cache-dir", default=None, help="usa o cache local de páginas (page_cache) neste diretório")
+    parser.add_argument("--parquet", default=None, metavar="DIR",
+                        help="grava também no dataset Parquet particionado (parquet_store) neste diretório")
+    parser.add_argument("--snapshots", nargs="?", const=SNAPSHOTS_PATH, default=None, metavar="DB",
+                        help="compara com a última extração (snapshot_diff) e não regrava se nada mudou")
+    parser.add_argument("--fund-index", nargs="?", const=FUND_INDEX_PATH, default=None, metavar="DB",
+                        help="índice local CNPJ -> fundo (fund_index): pula a busca para fundos já vistos")
+    parser.add_argument("--cod-cvm", default=None, help="classe a abrir quando o CNPJ tem várias")
+    add_throttle_args(parser)
+    args = parser.parse_args(argv)
+
+    page_cache = None
+    if args.cache_dir:
+        from page_cache import PageCache
+
+        page_cache = PageCache(args.cache_dir)
+    store = None
+    if args.parquet:
+        from parquet_store import BalanceteStore
+
+        store = BalanceteStore(args.parquet)
+    snapshots = SnapshotStore(args.snapshots) if args.snapshots else None
+    fund_index = FundIndex(args.fund_index) if args.fund_index else None
+    with CvmHttpClient(args.base_url, throttle=throttle_from_args(args, concurrency=1),
+                       fund_index=fund_index) as client:
+        df = fetch_balancete(args.cnpj, out_prefix=args.out_prefix, client=client,
+                             browser_fallback=not args.no_fallback, page_cache=page_cache, store=store,
+                             snapshots=snapshots, cod_cvm=args.cod_cvm)
+    return 0 if df is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# job_queue.py
+# Fila persistente (SQLite) dos itens CNPJ x competência de uma execução longa.
+# Cada item guarda status, tentativas, último erro e tempos; os workers pegam
+# itens de forma atômica (BEGIN IMMEDIATE) com um prazo (lease). Se o processo
+# cair, os itens "running" com prazo vencido voltam para a fila na próxima
+# execução (os de um processo desta máquina que já morreu voltam na hora,
+# com release_orphans), e o que já terminou não é refeito.
+#
+# competencia "" = a que o site mostra por padrão (fluxo do batch.py);
+# "AAAA-MM" = um mês específico (history.py).
+#
+# Uso:
+#   python job_queue.py enqueue cnpjs.txt --db jobs.sqlite [--months 2025-08,2025-09]
+#   python job_queue.py status --db jobs.sqlite
+#   python job_queue.py retry-failed --db jobs.sqlite
+#   python job_queue.py release --db jobs.sqlite      (após um crash: libera os "running")
+#   python batch.py cnpjs.txt --queue jobs.sqlite     (retoma de onde parou)
+
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get("CVM_JOB_QUEUE", "jobs.sqlite")
+DEFAULT_LEASE = 15 * 60     # s que um worker pode segurar um item antes de ele voltar à fila
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,
+    cnpj        TEXT NOT NULL,
+    competencia TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    worker      TEXT,
+    rows        INTEGER,
+    enqueued_at REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    elapsed     REAL,
+    lease_until REAL,
+    UNIQUE (cnpj, competencia)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class Job:
+    """Item pego da fila."""
+
+    __slots__ = ("id", "cnpj", "competencia", "attempts")
+
+    def __init__(self, id, cnpj, competencia, attempts):
+        self.id = id
+        self.cnpj = cnpj
+        self.competencia = competencia
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.cnpj!r}, {self.competencia!r}, tentativa {self.attempts})"
+
+
+class JobQueue:
+    """
+    Fila em SQLite (modo WAL). Seguro para várias threads da mesma instância
+    e para vários processos abrindo o mesmo arquivo.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _tx(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return out
+
+    # --------------------------
+    # ENFILEIRAR
+    # --------------------------
+    def enqueue(self, cnpjs, competencias=("",), reset=False):
+        """
+        Inclui CNPJ x competência. Itens que já existem ficam como estão (é isso
+        que permite retomar), a não ser com reset=True, que os devolve à fila.
+        Retorna quantos itens entraram (ou voltaram) na fila.
+        """
+        now = time.time()
+        items = [(c, m, now) for c in cnpjs for m in competencias]
+        sql = "INSERT INTO jobs (cnpj, competencia, enqueued_at) VALUES (?, ?, ?) ON CONFLICT (cnpj, competencia) DO "
+        sql += ("UPDATE SET status='pending', attempts=0, last_error=NULL, enqueued_at=excluded.enqueued_at"
+                if reset else "NOTHING")
+
+        def run(db):
+            before = db.total_changes
+            db.executemany(sql, items)
+            return db.total_changes - before
+
+        return self._tx(run)
+
+    def retry_failed(self):
+        """Volta os itens que esgotaram as tentativas para a fila, zerando o contador."""
+        return self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status=?, attempts=0 WHERE status=?", (PENDING, FAILED)).rowcount)
+
+    def release_running(self):
+        """
+        Devolve à fila os itens "running" sem esperar o prazo (use depois de um
+        crash, quando se sabe que nenhum outro processo está consumindo).
+        """
+        return self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status=?, lease_until=NULL WHERE status=?", (PENDING, RUNNING)).rowcount)
+
+    def release_orphans(self):
+        """
+        Devolve à fila os itens "running" de processos desta máquina que não
+        existem mais (o worker é "host:pid:thread"), sem esperar o prazo.
+        Itens de outras máquinas ou de processos vivos ficam como estão.
+        """
+        if os.name != "posix":   # os.kill(pid, 0) só serve de teste em POSIX
+            return 0
+        prefix = f"{socket.gethostname()}:"
+
+        def alive(pid):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+            return True
+
+        def run(db):
+            orphans = []
+            for id_, worker in db.execute("SELECT id, worker FROM jobs WHERE status=?", (RUNNING,)).fetchall():
+                if not worker or not worker.startswith(prefix):
+                    continue
+                try:
+                    pid = int(worker.split(":")[1])
+                except (IndexError, ValueError):
+                    continue
+                if pid != os.getpid() and not alive(pid):
+                    orphans.append((PENDING, id_))
+            db.executemany("UPDATE jobs SET status=?, lease_until=NULL WHERE id=?", orphans)
+            return len(orphans)
+
+        return self._tx(run)
+
+    # --------------------------
+    # CONSUMIR
+    # --------------------------
+    def claim(self, worker=None, cnpj=None, monthly=None):
+        """
+        Pega o próximo item pendente (ou "running" com prazo vencido) e o marca
+        como running deste worker. None se não houver.
+        cnpj restringe a um fundo; monthly=True só meses específicos
+        (history.py), monthly=False só a competência atual (batch.py).
+        """
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        now = time.time()
+
+        def run(db):
+            # prazo vencido na última tentativa: o worker caiu com o item, não volta mais
+            db.execute("UPDATE jobs SET status=?, last_error=COALESCE(last_error, 'prazo (lease) expirado') "
+                       "WHERE status=? AND lease_until < ? AND attempts >= ?",
+                       (FAILED, RUNNING, now, self.max_attempts))
+            sql = ("SELECT id, cnpj, competencia, attempts FROM jobs "
+                   "WHERE (status=? OR (status=? AND lease_until < ?)) AND attempts < ?")
+            args = [PENDING, RUNNING, now, self.max_attempts]
+            if cnpj is not None:
+                sql += " AND cnpj=?"
+                args.append(cnpj)
+            if monthly is not None:
+                sql += " AND competencia<>''" if monthly else " AND competencia=''"
+            row = db.execute(sql + " ORDER BY id LIMIT 1", args).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status=?, attempts=attempts+1, worker=?, started_at=?, lease_until=? WHERE id=?",
+                (RUNNING, str(worker), now, now + self.lease, row[0]),
+            )
+            return Job(row[0], row[1], row[2], row[3] + 1)
+
+        return self._tx(run)
+
+    def complete(self, job, rows=None, elapsed=None):
+        now = time.time()
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status=?, rows=?, elapsed=?, finished_at=?, last_error=NULL, lease_until=NULL "
+            "WHERE id=?", (DONE, rows, elapsed, now, job.id)))
+
+    def fail(self, job, error, elapsed=None):
+        """Registra o erro; o item volta à fila até esgotar max_attempts, depois fica failed."""
+        now = time.time()
+        status = FAILED if job.attempts >= self.max_attempts else PENDING
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status=?, last_error=?, elapsed=?, finished_at=?, lease_until=NULL WHERE id=?",
+            (status, str(error)[:2000], elapsed, now, job.id)))
+        return status
+
+    def record(self, job, result):
+        """Fecha o item a partir de um dict de resultado do batch/history (status/rows/elapsed/error)."""
+        if result["status"] in ("ok", "skipped"):
+            self.complete(job, result.get("rows"), result.get("elapsed"))
+            return DONE
+        return self.fail(job, result.get("error"), result.get("elapsed"))
+
+    # --------------------------
+    # ESTADO
+    # --------------------------
+    def counts(self, monthly=None):
+        """{status: quantidade}; monthly como em claim()."""
+        where = "" if monthly is None else (" WHERE competencia<>''" if monthly else " WHERE competencia=''")
+        with self._lock:
+            return dict(self._db.execute(f"SELECT status, COUNT(*) FROM jobs{where} GROUP BY status").fetchall())
+
+    def claimable(self, monthly=None):
+        """Itens que claim() pegaria agora: pendentes e "running" com prazo vencido."""
+        where = "" if monthly is None else (" AND competencia<>''" if monthly else " AND competencia=''")
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE (status=? OR (status=? AND lease_until < ?)) AND attempts < ?" + where,
+                (PENDING, RUNNING, time.time(), self.max_attempts)).fetchone()[0]
+
+    def done(self, cnpj):
+        """Competências já concluídas de um CNPJ."""
+        with self._lock:
+            return {r[0] for r in self._db.execute(
+                "SELECT competencia FROM jobs WHERE cnpj=? AND status=?", (cnpj, DONE))}
+
+    def failures(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT cnpj, competencia, attempts, last_error FROM jobs WHERE status=? ORDER BY id", (FAILED,)
+            ).fetchall()
+
+
+def main(argv=None):
+    from scraping import log, normalize_cnpj
+
+    parser = argparse.ArgumentParser(description="Fila persistente de CNPJs x competências.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_enq = sub.add_parser("enqueue", help="inclui CNPJs (arquivo, um por linha, ou '-' para stdin)")
+    p_enq.add_argument("source")
+    p_enq.add_argument("--months", default=None, help="competências AAAA-MM separadas por vírgula (padrão: a atual)")
+    p_status = sub.add_parser("status", help="contagem por status e itens que falharam")
+    p_retry = sub.add_parser("retry-failed", help="devolve à fila os itens que esgotaram as tentativas")
+    p_release = sub.add_parser("release", help="devolve à fila os itens running (após um crash)")
+    for p in (p_enq, p_status, p_retry, p_release):
+        p.add_argument("--db", default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    jobs = JobQueue(args.db)
+    if args.cmd == "enqueue":
+        from batch import read_cnpjs
+        from parse_html import normalize_competencia
+
+        months = [normalize_competencia(m) for m in (args.months or "").split(",") if m.strip()] or [""]
+        cnpjs = []
+        for raw in read_cnpjs(args.source):
+            try:
+                cnpjs.append(normalize_cnpj(raw))
+            except ValueError as e:
+                log(f"⚠️ ignorado: {e}")
+        added = jobs.enqueue(cnpjs, months)
+        log(f"{added} itens incluídos em {args.db}")
+    elif args.cmd == "retry-failed":
+        log(f"{jobs.retry_failed()} itens devolvidos à fila")
+    elif args.cmd == "release":
+        log(f"{jobs.release_running()} itens liberados")
+
+    counts = jobs.counts()
+    log("Fila: " + ", ".join(f"{s}={counts.get(s, 0)}" for s in (PENDING, RUNNING, DONE, FAILED)))
+    if args.cmd == "status":
+        for cnpj, competencia, attempts, error in jobs.failures():
+            log(f"  falhou {cnpj} {competencia or '(atual)'} após {attempts} tentativas: {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# loading_profile.py
+# Perfil de carregamento "leve" para o Playwright: intercepta as requisições com
+# route() e bloqueia imagens, CSS, fontes e mídia, além dos frames de cabeçalho
+# e rodapé do cvmweb (header-cvmweb.asp, footer.asp), que a extração nunca lê.
+# Funciona com a sync_api e com a async_api (o handler devolve a corrotina de
+# route.abort()/fulfill()/continue_() para o Playwright aguardar).
+#
+# Uso:
+#   profile = LoadingProfile()
+#   profile.install(context)      # ou page; na async_api: await profile.install_async(context)
+#   ...
+#   log(profile.summary())
+
+import threading
+
+BLOCKED_RESOURCE_TYPES = ("image", "stylesheet", "font", "media")
+
+# frames do frameset que não interessam à extração
+BLOCKED_URL_FRAGMENTS = ("header-cvmweb.asp", "footer.asp")
+
+# resposta no lugar dos frames bloqueados (evita página de erro no frame)
+EMPTY_FRAME = "<html><body></body></html>"
+
+
+class LoadingProfile:
+    """
+    Bloqueia recursos dispensáveis e conta o que foi bloqueado/carregado.
+    Uma instância pode ser instalada em vários contextos; os contadores somam.
+    """
+
+    def __init__(self, block_types=BLOCKED_RESOURCE_TYPES, block_urls=BLOCKED_URL_FRAGMENTS):
+        self.block_types = set(block_types)
+        self.block_urls = tuple(u.lower() for u in block_urls)
+        self._lock = threading.Lock()
+        self.blocked = {}
+        self.allowed = 0
+        self.bytes_loaded = 0
+
+    def install(self, target):
+        """Instala no BrowserContext ou Page da sync_api. Retorna o próprio perfil."""
+        target.route("**/*", self._handle)
+        target.on("response", self._on_response)
+        return self
+
+    async def install_async(self, target):
+        """Mesmo que install, para BrowserContext/Page da async_api."""
+        await target.route("**/*", self._handle)
+        target.on("response", self._on_response)
+        return self
+
+    def _count_blocked(self, kind):
+        with self._lock:
+            self.blocked[kind] = self.blocked.get(kind, 0) + 1
+
+    def _handle(self, route, request=None):
+        request = request or route.request
+        url = request.url.lower()
+        if request.resource_type in self.block_types:
+            self._count_blocked(request.resource_type)
+            return route.abort()
+        if any(frag in url for frag in self.block_urls):
+            self._count_blocked("frame")
+            return route.fulfill(status=200, content_type="text/html; charset=utf-8", body=EMPTY_FRAME)
+        with self._lock:
+            self.allowed += 1
+        return route.continue_()
+
+    def _on_response(self, response):
+        # content-length é o que dá para saber sem outra ida ao navegador
+        size = response.headers.get("content-length")
+        if size and size.isdigit():
+            with self._lock:
+                self.bytes_loaded += int(size)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "blocked": sum(self.blocked.values()),
+                "blocked_by_type": dict(self.blocked),
+                "allowed": self.allowed,
+                "bytes_loaded": self.bytes_loaded,
+            }
+
+    def summary(self):
+        s = self.stats()
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(s["blocked_by_type"].items())) or "nada"
+        return (f"Perfil leve: {s['blocked']} requisições bloqueadas ({detail}); "
+                f"{s['allowed']} liberadas, {s['bytes_loaded'] / 1024:.1f} KiB carregados")
@@ -0,0 +1,244 @@
+# metrics.py
+# Instrumentação das etapas do fluxo (scraping.py, extract_table.py, batch.py):
+# duração de cada etapa, novas tentativas, bytes baixados e linhas extraídas.
+#
+#   with metrics.step("goto"): ...            duração da etapa (ok/erro)
+#   metrics.count("rows_extracted", len(df))  contadores (opcionalmente por etapa)
+#   with metrics.fund(cnpj): ...              etiqueta os eventos da thread com o
+#                                             CNPJ e mede o fundo inteiro ("fund")
+#
+# Tudo vai para o coletor do processo (METRICS), que guarda os agregados em
+# memória e, se configurado, grava cada evento como uma linha JSON. No fim do
+# lote: summary() / log_summary() com p50/p95 por etapa e prometheus() com o
+# texto no formato de exposição do Prometheus (arquivo ou endpoint /metrics).
+#
+# Uso:
+#   python batch.py cnpjs.txt --metrics-jsonl saida/metrics.jsonl --metrics-prom saida/metrics.prom
+#   python batch.py cnpjs.txt --metrics-port 9108      (GET http://127.0.0.1:9108/metrics)
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# amostras guardadas por etapa para os percentis (as mais recentes)
+MAX_SAMPLES = 10000
+
+PROM_PREFIX = "cvm"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values, q):
+    """Percentil q (0..1) por interpolação linear; None sem valores."""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class Metrics:
+    """Coletor de durações e contadores. Seguro entre threads."""
+
+    def __init__(self, jsonl_path=None):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._jsonl = None
+        self.reset()
+        if jsonl_path:
+            self.open_jsonl(jsonl_path)
+
+    def reset(self):
+        with self._lock:
+            self.samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+            self.totals = defaultdict(float)    # step -> segundos somados
+            self.calls = defaultdict(int)       # step -> execuções
+            self.errors = defaultdict(int)      # step -> execuções com exceção
+            self.counters = defaultdict(float)  # (nome, step) -> valor
+
+    def open_jsonl(self, path):
+        """Passa a gravar cada evento em `path` (uma linha JSON por evento, modo append)."""
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+            self._jsonl = open(path, "a", encoding="utf-8", buffering=1)
+
+    def close(self):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+    # --------------------------
+    # REGISTRO
+    # --------------------------
+    @property
+    def current_fund(self):
+        return getattr(self._local, "cnpj", None)
+
+    def _emit(self, event):
+        if self._jsonl is not None:
+            event = {"ts": round(time.time(), 3), "cnpj": self.current_fund, **event}
+            self._jsonl.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def record(self, step, seconds, ok=True, **extra):
+        with self._lock:
+            self.samples[step].append(seconds)
+            self.totals[step] += seconds
+            self.calls[step] += 1
+            if not ok:
+                self.errors[step] += 1
+            self._emit({"step": step, "seconds": round(seconds, 6), "ok": ok, **extra})
+
+    def count(self, name, value=1, step=None):
+        with self._lock:
+            self.counters[(name, step)] += value
+            self._emit({"counter": name, "step": step, "value": value})
+
+    @contextmanager
+    def step(self, name, **extra):
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - started, ok, **extra)
+
+    @contextmanager
+    def tagged(self, cnpj):
+        """Etiqueta os eventos desta thread com o CNPJ (sem medir nada)."""
+        previous = self.current_fund
+        self._local.cnpj = cnpj
+        try:
+            yield
+        finally:
+            self._local.cnpj = previous
+
+    @contextmanager
+    def fund(self, cnpj):
+        with self.tagged(cnpj), self.step("fund"):
+            yield
+
+    # --------------------------
+    # SAÍDAS
+    # --------------------------
+    def summary(self):
+        """{etapa: {count, errors, total, mean, p50, p95, max}} (segundos) e {contador: valor}."""
+        with self._lock:
+            steps = {}
+            for name, values in self.samples.items():
+                values = list(values)
+                steps[name] = {
+                    "count": self.calls[name],
+                    "errors": self.errors[name],
+                    "total": round(self.totals[name], 3),
+                    "mean": round(self.totals[name] / self.calls[name], 4),
+                    "p50": round(percentile(values, 0.5), 4),
+                    "p95": round(percentile(values, 0.95), 4),
+                    "max": round(max(values), 4),
+                }
+            counters = {}
+            for (name, step), value in sorted(self.counters.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+                counters[f"{name}[{step}]" if step else name] = value
+        return {"steps": steps, "counters": counters}
+
+    def log_summary(self):
+        from scraping import log
+
+        s = self.summary()
+        if not s["steps"]:
+            return s
+        log(f"{'etapa':<22}{'n':>7}{'erros':>7}{'p50 s':>9}{'p95 s':>9}{'máx s':>9}{'total s':>10}")
+        for name, v in sorted(s["steps"].items(), key=lambda kv: -kv[1]["total"]):
+            log(f"{name:<22}{v['count']:>7}{v['errors']:>7}{v['p50']:>9.3f}{v['p95']:>9.3f}{v['max']:>9.3f}"
+                f"{v['total']:>10.1f}")
+        for name, value in s["counters"].items():
+            log(f"  {name} = {value:g}")
+        return s
+
+    def prometheus(self):
+        """Texto no formato de exposição do Prometheus (summary por etapa + contadores)."""
+        p = PROM_PREFIX
+        lines = [f"# HELP {p}_step_seconds Duração das etapas do fluxo.", f"# TYPE {p}_step_seconds summary"]
+        with self._lock:
+            for name in sorted(self.samples):
+                values = list(self.samples[name])
+                for q in QUANTILES:
+                    lines.append(f'{p}_step_seconds{{step="{name}",quantile="{q}"}} {percentile(values, q):.6f}')
+                lines.append(f'{p}_step_seconds_sum{{step="{name}"}} {self.totals[name]:.6f}')
+                lines.append(f'{p}_step_seconds_count{{step="{name}"}} {self.calls[name]}')
+            lines += [f"# HELP {p}_step_errors_total Etapas que terminaram com exceção.",
+                      f"# TYPE {p}_step_errors_total counter"]
+            lines += [f'{p}_step_errors_total{{step="{name}"}} {n}' for name, n in sorted(self.errors.items())]
+            by_name = defaultdict(list)
+            for (name, step), value in self.counters.items():
+                by_name[name].append((step, value))
+            for name in sorted(by_name):
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                for step, value in sorted(by_name[name], key=lambda sv: sv[0] or ""):
+                    labels = f'{{step="{step}"}}' if step else ""
+                    lines.append(f"{p}_{name}_total{labels} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Grava prometheus() em `path` (ex.: para o textfile collector do node_exporter)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Sobe GET /metrics numa thread daemon. Retorna o servidor (server.shutdown() para parar)."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# coletor do processo: é nele que scraping/extract_table/batch registram
+METRICS = Metrics()
+step = METRICS.step
+count = METRICS.count
+fund = METRICS.fund
+tagged = METRICS.tagged
+
+
+def add_metrics_args(parser):
+    parser.add_argument("--metrics-jsonl", default=None, metavar="PATH",
+                        help="grava a duração de cada etapa (e contadores) como linhas JSON")
+    parser.add_argument("--metrics-prom", default=None, metavar="PATH",
+                        help="grava as métricas no formato texto do Prometheus ao final")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="expõe GET /metrics (Prometheus) nesta porta durante a execução")
+
+
+def metrics_from_args(args):
+    """Configura METRICS a partir dos argumentos de add_metrics_args. Retorna METRICS."""
+    if args.metrics_jsonl:
+        METRICS.open_jsonl(args.metrics_jsonl)
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    return METRICS
@@ -0,0 +1,193 @@
+# page_cache.py
+# Cache local das páginas baixadas do cvmweb, chaveado por
+# (CNPJ, competência, tipo de página). O HTML fica comprimido (gzip) num
+# armazenamento endereçado por conteúdo (sha256): páginas idênticas ocupam
+# espaço uma vez só. O índice é um SQLite ao lado dos blobs.
+#
+#   .cvm_cache/
+#     index.sqlite
+#     objects/ab/ab12...ef.html.gz
+#
+# competência "" = "a que o site mostra por padrão" (a mais recente); essa
+# entrada expira pelo TTL. Competências explícitas ("2025-09") não mudam e
+# só saem por falta de espaço (LRU).
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_ROOT = os.environ.get("CVM_PAGE_CACHE", ".cvm_cache")
+DEFAULT_TTL = 24 * 3600            # s, para a competência "" (mais recente)
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cnpj        TEXT NOT NULL,
+    competencia TEXT NOT NULL,
+    page_type   TEXT NOT NULL,
+    sha256      TEXT NOT NULL,
+    fetched_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (cnpj, competencia, page_type)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_sha ON entries (sha256);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+
+class PageCache:
+    """
+    Cache de páginas em disco. Seguro para várias threads do mesmo processo
+    (uma conexão SQLite protegida por lock).
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _blob_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha + ".html.gz")
+
+    # --------------------------
+    # LEITURA / ESCRITA
+    # --------------------------
+    def get(self, cnpj, competencia="", page_type="balancete", max_age=None):
+        """
+        HTML em cache ou None. max_age (s) sobrescreve o TTL; o TTL só vale
+        para competencia "" (as explícitas não expiram).
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, fetched_at FROM entries WHERE cnpj=? AND competencia=? AND page_type=?",
+                (cnpj, competencia, page_type),
+            ).fetchone()
+            if row is None:
+                return None
+            sha, fetched_at = row
+            max_age = max_age if max_age is not None else (self.ttl if competencia == "" else None)
+            if max_age is not None and time.time() - fetched_at > max_age:
+                return None
+            try:
+                with gzip.open(self._blob_path(sha), "rt", encoding="utf-8") as fh:
+                    html = fh.read()
+            except OSError:
+                self._db.execute("DELETE FROM entries WHERE sha256=?", (sha,))
+                self._db.execute("DELETE FROM blobs WHERE sha256=?", (sha,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed_at=? WHERE cnpj=? AND competencia=? AND page_type=?",
+                (time.time(), cnpj, competencia, page_type),
+            )
+            self._db.commit()
+            return html
+
+    def put(self, cnpj, competencia, page_type, html):
+        """Grava o HTML e aponta a chave para ele. Retorna o sha256 do conteúdo."""
+        data = html.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha)
+        now = time.time()
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp, "wb", compresslevel=6) as fh:
+                    fh.write(data)
+                os.replace(tmp, path)
+            self._db.execute("INSERT OR REPLACE INTO blobs (sha256, size) VALUES (?, ?)", (sha, os.path.getsize(path)))
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (cnpj, competencia, page_type, sha256, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cnpj, competencia, page_type, sha, now, now),
+            )
+            self._db.commit()
+        return sha
+
+    def put_balancete(self, cnpj, html):
+        """
+        Grava um Balancete sob a chave "" (mais recente) e, se a página
+        informar a competência (select#ddCOMPTC), também sob ela.
+        """
+        from parse_html import competencia_from_html
+
+        sha = self.put(cnpj, "", "balancete", html)
+        competencia = competencia_from_html(html)
+        if competencia:
+            self.put(cnpj, competencia, "balancete", html)
+        return sha
+
+    def keys(self, page_type="balancete"):
+        """Lista (cnpj, competencia) em cache para um tipo de página."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT cnpj, competencia FROM entries WHERE page_type=? ORDER BY cnpj, competencia", (page_type,)
+            ).fetchall()
+
+    # --------------------------
+    # EVICÇÃO
+    # --------------------------
+    def evict(self):
+        """
+        Remove entradas "" vencidas pelo TTL e, se o total passar de max_bytes,
+        as menos acessadas (LRU). Apaga blobs sem referência. Retorna (entradas, blobs) removidos.
+        """
+        with self._lock:
+            db = self._db
+            removed = db.execute(
+                "DELETE FROM entries WHERE competencia='' AND fetched_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+            total = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs WHERE sha256 IN (SELECT sha256 FROM entries)"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                rows = db.execute(
+                    "SELECT e.cnpj, e.competencia, e.page_type, e.sha256, b.size "
+                    "FROM entries e JOIN blobs b ON b.sha256 = e.sha256 ORDER BY e.accessed_at"
+                ).fetchall()
+                refs = {}
+                for *_, sha, _ in rows:
+                    refs[sha] = refs.get(sha, 0) + 1
+                for cnpj, comp, ptype, sha, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    db.execute("DELETE FROM entries WHERE cnpj=? AND competencia=? AND page_type=?", (cnpj, comp, ptype))
+                    removed += 1
+                    refs[sha] -= 1
+                    if refs[sha] == 0:
+                        total -= size
+
+            orphans = [r[0] for r in db.execute(
+                "SELECT sha256 FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM entries)"
+            ).fetchall()]
+            for sha in orphans:
+                try:
+                    os.remove(self._blob_path(sha))
+                except OSError:
+                    pass
+                db.execute("DELETE FROM blobs WHERE sha256=?", (sha,))
+            db.commit()
+        return removed, len(orphans)
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"entries": entries, "blobs": blobs, "bytes": size}
@@ -0,0 +1,150 @@
+# parquet_store.py
+# Armazena as extrações num dataset Parquet particionado por CNPJ e competência
+# (partições no estilo hive), com colunas tipadas, em vez de um CSV/JSON por
+# execução:
+#
+#   store/cnpj=32811422000133/competencia=2025-09/part-0.parquet
+#
+# Cada (CNPJ, competência) é um arquivo; gravar de novo o mesmo mês substitui
+# o arquivo (idempotente). A leitura usa pyarrow.dataset, que só abre as
+# partições e row groups que passam no filtro.
+#
+# Uso:
+#   store = BalanceteStore("store")
+#   store.write(df, cnpj="32811422000133", competencia="2025-09")
+#   df = store.read(cnpjs=["32811422000133"], contas=[10000007])
+
+import os
+import re
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from balancete_model import HEADER_FIELDS
+from br_numbers import parse_br_series
+
+DEFAULT_ROOT = os.environ.get("CVM_PARQUET_STORE", "store")
+
+VALOR_TYPE = pa.decimal128(18, 2)
+
+SCHEMA = pa.schema([
+    ("cod_cvm", pa.int32()),
+    ("conta", pa.int32()),
+    ("descricao", pa.string()),
+    ("valor", VALOR_TYPE),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("cnpj", pa.string()), ("competencia", pa.string())]), flavor="hive")
+
+CONTA_RE = re.compile(r"^\d{8}$")
+
+
+def header_metadata(df):
+    """
+    Campos do cabeçalho que o extrator mistura às contas ("Nome do Fundo: ...",
+    "CNPJ: ...", "Tipo: ...", "Cód. CVM: ..."). Retorna dict (só os achados).
+    """
+    meta = {}
+    for col in ("conta", "descricao"):
+        for text in df[col].astype(str):
+            label, sep, value = text.partition(":")
+            field = HEADER_FIELDS.get(label.strip().lower())
+            if sep and field and field not in meta:
+                meta[field] = value.strip()
+    return meta
+
+
+def account_rows(df):
+    """Só as linhas de conta (código COSIF de 8 dígitos), sem cabeçalho."""
+    return df[df["conta"].astype(str).str.strip().str.fullmatch(CONTA_RE.pattern)]
+
+
+def to_table(df, cod_cvm=None):
+    """DataFrame do extrator (conta/descricao/valor_text/valor) -> pyarrow.Table no SCHEMA."""
+    rows = account_rows(df)
+    valores = parse_br_series(rows["valor_text"], exact=True)
+    cod = int(re.sub(r"\D", "", str(cod_cvm))) if cod_cvm not in (None, "") else None
+    return pa.table({
+        "cod_cvm": pa.array([cod] * len(rows), pa.int32()),
+        "conta": pa.array(rows["conta"].astype(str).str.strip().astype(int), pa.int32()),
+        "descricao": pa.array(rows["descricao"].astype(str), pa.string()),
+        "valor": pa.array([v.quantize(Decimal("0.01")) if v is not None else None for v in valores], VALOR_TYPE),
+    }, schema=SCHEMA)
+
+
+class BalanceteStore:
+    """Dataset Parquet dos balancetes, particionado por cnpj/competencia."""
+
+    def __init__(self, root=DEFAULT_ROOT, compression="zstd"):
+        self.root = root
+        self.compression = compression
+        os.makedirs(root, exist_ok=True)
+
+    def partition_dir(self, cnpj, competencia):
+        return os.path.join(self.root, f"cnpj={cnpj}", f"competencia={competencia}")
+
+    def has(self, cnpj, competencia):
+        return os.path.exists(os.path.join(self.partition_dir(cnpj, competencia), "part-0.parquet"))
+
+    def write(self, df, cnpj, competencia, cod_cvm=None):
+        """
+        Grava (substitui) a partição (cnpj, competencia "AAAA-MM"). cod_cvm vem
+        do cabeçalho da tabela se não for informado. Retorna o caminho do arquivo.
+        """
+        from parse_html import normalize_competencia
+
+        cnpj = re.sub(r"\D", "", str(cnpj))
+        competencia = normalize_competencia(competencia)
+        if cod_cvm is None:
+            cod_cvm = header_metadata(df).get("cod_cvm")
+        table = to_table(df, cod_cvm)
+
+        out_dir = self.partition_dir(cnpj, competencia)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, "part-0.parquet")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp, compression=self.compression)
+        os.replace(tmp, path)
+        return path
+
+    def write_page(self, df, cnpj, html, cod_cvm=None):
+        """Como write, tirando a competência do HTML do Balancete (select#ddCOMPTC)."""
+        from parse_html import competencia_from_html
+
+        competencia = competencia_from_html(html)
+        if not competencia:
+            raise ValueError("Competência não encontrada na página do Balancete")
+        return self.write(df, cnpj, competencia, cod_cvm)
+
+    # --------------------------
+    # LEITURA
+    # --------------------------
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING)
+
+    def read(self, cnpjs=None, competencias=None, contas=None, columns=None, as_float=True):
+        """
+        Lê o dataset filtrando por CNPJs, competências e contas (filtros
+        empurrados para o pyarrow: partições e row groups fora do filtro nem
+        são lidos). as_float=True entrega valor como float64 em vez de Decimal.
+        Retorna DataFrame.
+        """
+        from parse_html import normalize_competencia
+
+        expr = None
+        for field, values in (
+            ("cnpj", [re.sub(r"\D", "", str(c)) for c in cnpjs] if cnpjs else None),
+            ("competencia", [normalize_competencia(c) for c in competencias] if competencias else None),
+            ("conta", [int(c) for c in contas] if contas else None),
+        ):
+            if values is None:
+                continue
+            cond = ds.field(field).isin(values)
+            expr = cond if expr is None else expr & cond
+        table = self.dataset().to_table(columns=columns, filter=expr)
+        if as_float and "valor" in table.column_names:
+            i = table.column_names.index("valor")
+            table = table.set_column(i, "valor", table.column("valor").cast(pa.float64()))
+        return table.to_pandas()
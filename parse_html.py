@@ -0,0 +1,178 @@
+# parse_html.py
+# Parser offline do Balancete: lê um HTML salvo (balancete_popup.html,
+# balancete_frame.html, *_frame_{i}.html, ...) e produz o mesmo DataFrame que
+# scraping.capture_balancete_and_save, sem abrir o Chromium.
+#
+# Uso:
+#   python parse_html.py balancete_popup.html
+#   python parse_html.py arquivo/*.html --workers 8
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from scraping import log, records_from_rows, save_balancete
+
+# mesmos seletores (e mesma ordem) de scraping.capture_balancete_and_save
+TABLE_SELECTORS = ["table#Table1", "table.BodyPP", "form#form1 table"]
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r\f]+")
+
+# rótulos do cabeçalho da tabela ("Rótulo: valor") -> campo de balancete_model.FundMeta
+HEADER_FIELDS = {
+    "nome do fundo": "nome",
+    "cnpj": "cnpj",
+    "tipo": "tipo",
+    "cód. cvm": "cod_cvm",
+}
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+def cell_text(td):
+    """
+    Aproxima o innerText.trim() do navegador: colapsa espaços/quebras de linha do
+    código-fonte, mas mantém os &nbsp; internos (\\xa0), como o navegador faz.
+    """
+    return WHITESPACE_RE.sub(" ", td.get_text()).strip()
+
+
+def find_balancete_table(soup, selectors=None):
+    """Retorna (tabela, seletor) da primeira tabela encontrada, ou (None, None)."""
+    for sel in selectors or TABLE_SELECTORS:
+        table = soup.select_one(sel)
+        if table is not None:
+            return table, sel
+    return None, None
+
+
+def table_rows(table):
+    """Matriz de textos da tabela, igual a scraping.TABLE_ROWS_JS (tr/td descendentes)."""
+    return [[cell_text(td) for td in tr.select("td")] for tr in table.select("tr")]
+
+
+def parse_balancete_html(html):
+    """
+    Converte o HTML (str ou bytes) de uma página de Balancete em DataFrame com
+    colunas conta, descricao, valor_text, valor. Retorna None se não houver tabela.
+    """
+    import pandas as pd
+
+    soup = BeautifulSoup(html, HTML_PARSER)
+    table, _ = find_balancete_table(soup)
+    if table is None:
+        return None
+    return pd.DataFrame(records_from_rows(table_rows(table)))
+
+
+def normalize_competencia(value):
+    """
+    Normaliza a competência para "AAAA-MM". Aceita "09/2025", "01/09/2025",
+    "2025-09" e "202509". Levanta ValueError se não reconhecer.
+    """
+    value = str(value).strip()
+    m = re.fullmatch(r"(?:\d{1,2}/)?(\d{1,2})/(\d{4})", value)
+    if m:
+        return f"{m.group(2)}-{int(m.group(1)):02d}"
+    m = re.fullmatch(r"(\d{4})-?(\d{2})", value)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    raise ValueError(f"Competência inválida: {value}")
+
+
+def competencia_from_html(html):
+    """
+    Competência exibida na página do Balancete (opção selecionada do
+    select#ddCOMPTC), em "AAAA-MM". None se a página não tiver o select.
+    """
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, HTML_PARSER)
+    select = soup.select_one("select#ddCOMPTC")
+    if select is None:
+        return None
+    option = select.find("option", selected=True) or select.find("option")
+    if option is None:
+        return None
+    try:
+        return normalize_competencia(option.get("value") or option.get_text())
+    except ValueError:
+        return None
+
+
+def list_competencias(html):
+    """
+    Competências oferecidas no select#ddCOMPTC, na ordem da página:
+    [(valor_da_opção, "AAAA-MM"), ...]. Lista vazia se não houver o select.
+    """
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, HTML_PARSER)
+    select = soup.select_one("select#ddCOMPTC")
+    if select is None:
+        return []
+    out = []
+    for option in select.find_all("option"):
+        value = option.get("value") or option.get_text().strip()
+        try:
+            out.append((value, normalize_competencia(value)))
+        except ValueError:
+            continue
+    return out
+
+
+def parse_cached(cache, cnpj, competencia=""):
+    """Parseia o Balancete guardado no page_cache.PageCache, sem rede. None se não houver."""
+    html = cache.get(cnpj, competencia, "balancete")
+    if html is None:
+        return None
+    return parse_balancete_html(html)
+
+
+def parse_balancete_file(path):
+    """Lê o arquivo em bytes (o BeautifulSoup detecta o encoding) e parseia."""
+    with open(path, "rb") as fh:
+        return parse_balancete_html(fh.read())
+
+
+def parse_and_save(path, out_prefix=None):
+    """
+    Parseia um arquivo e salva {out_prefix}.csv/.json (por padrão, ao lado do HTML).
+    Retorna (path, número de linhas) — 0 linhas quando não há tabela.
+    Feito para rodar em processos separados (ProcessPoolExecutor).
+    """
+    df = parse_balancete_file(path)
+    if df is None or df.empty:
+        log(f"❌ Nenhuma tabela de balancete em {path}")
+        return path, 0
+    save_balancete(df, out_prefix or os.path.splitext(path)[0])
+    return path, len(df)
+
+
+def parse_many(paths, workers=None):
+    """Reprocessa vários HTMLs em paralelo (um processo por núcleo por padrão)."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_and_save, paths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parseia páginas de Balancete salvas em HTML.")
+    parser.add_argument("paths", nargs="+", help="arquivos HTML")
+    parser.add_argument("--workers", type=int, default=None, help="processos (padrão: núcleos da máquina)")
+    args = parser.parse_args(argv)
+
+    if len(args.paths) == 1:
+        results = [parse_and_save(args.paths[0])]
+    else:
+        results = parse_many(args.paths, workers=args.workers)
+    ok = sum(1 for _, n in results if n)
+    log(f"{ok}/{len(results)} arquivos com tabela.")
+    return 0 if ok == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
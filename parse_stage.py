@@ -0,0 +1,127 @@
+# parse_stage.py
+# Estágio de CPU desacoplado da busca: as threads que dirigem o navegador (ou
+# as sessões HTTP do history.py) só entregam o HTML do Balancete; o parse
+# (BeautifulSoup -> registros -> DataFrame) roda num ProcessPoolExecutor, em
+# todos os núcleos, e a gravação (CSV/JSON, page_cache, snapshots, Parquet)
+# roda nas threads do estágio, fora do caminho do navegador.
+#
+#   busca (threads)  --submit(html)-->  fila limitada  -->  N threads do estágio
+#                                                          parse no processo filho
+#                                                          write(df) aqui
+#
+# A fila tem tamanho máximo: se o parse/disco ficar para trás, submit()
+# bloqueia a busca (backpressure) em vez de acumular HTML na memória.
+# A gravação fica no processo principal porque page_cache/snapshots guardam
+# uma conexão SQLite, que não atravessa processos.
+#
+# Uso:
+#   with ParseStage(workers=4) as stage:
+#       future = stage.submit(html, lambda df: save_balancete(df, prefix), cnpj=cnpj)
+#   future.result()  -> o que write(df) retornou
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import metrics
+from parse_html import parse_balancete_html
+
+_STOP = object()
+
+
+class ParseStage:
+    """
+    workers: processos de parse (e threads de gravação); None = núcleos da máquina.
+    max_pending: HTMLs aguardando na fila antes de submit() bloquear; padrão 2 x workers.
+    parse: função de nível de módulo (precisa ser picklable) html -> DataFrame ou None.
+    """
+
+    def __init__(self, workers=None, max_pending=None, parse=parse_balancete_html):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.parse = parse
+        self.queue = queue.Queue(maxsize=max_pending or 2 * self.workers)
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "parsed": 0, "failed": 0, "blocked": 0, "blocked_seconds": 0.0}
+        self._threads = [threading.Thread(target=self._run, daemon=True, name=f"parse-{i}")
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def submit(self, html, write, cnpj=None):
+        """
+        Enfileira o HTML; bloqueia enquanto a fila estiver cheia. write(df) roda
+        numa thread do estágio com o DataFrame parseado (None se não houver
+        tabela). Retorna um Future com o valor de write(df) ou a exceção.
+        """
+        future = Future()
+        item = (html, write, cnpj or metrics.METRICS.current_fund, future)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            started = time.perf_counter()
+            self.queue.put(item)
+            self._add("blocked")
+            self._add("blocked_seconds", time.perf_counter() - started)
+        self._add("submitted")
+        return future
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            html, write, cnpj, future = item
+            try:
+                self._process(html, write, cnpj, future)
+            finally:
+                self.queue.task_done()
+
+    def _process(self, html, write, cnpj, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with metrics.tagged(cnpj):
+                with metrics.step("parse"):
+                    df = self.pool.submit(self.parse, html).result()
+                if df is not None:
+                    metrics.count("rows_extracted", len(df))
+                with metrics.step("write"):
+                    out = write(df)
+            self._add("parsed")
+            future.set_result(out)  # os callbacks do Future rodam aqui, nesta thread
+        except BaseException as e:
+            self._add("failed")
+            future.set_exception(e)
+
+    def join(self):
+        """Espera tudo o que já foi enviado terminar (inclusive os callbacks dos Futures)."""
+        self.queue.join()
+
+    def close(self):
+        """Espera a fila esvaziar, encerra as threads e os processos. Retorna stats."""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self.pool.shutdown()
+        with self._lock:
+            self.stats["blocked_seconds"] = round(self.stats["blocked_seconds"], 3)
+            return dict(self.stats)
+
+    def summary(self):
+        s = self.stats
+        return (f"Parse em {self.workers} processos: {s['parsed']}/{s['submitted']} ok, {s['failed']} falhas; "
+                f"busca bloqueada {s['blocked']}x ({s['blocked_seconds']:.1f}s) pela fila cheia")
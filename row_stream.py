@@ -0,0 +1,399 @@
+# row_stream.py
+# Extração em fluxo: as linhas do Balancete saem uma a uma (gerador), já
+# tipadas, em vez de uma lista de dicts -> DataFrame -> CSV/JSON inteiros.
+# Os sinks gravam conforme as linhas chegam (CSV, NDJSON e Parquet em row
+# groups), então a memória fica estável em lotes grandes de vários meses e
+# quem consome pode começar antes de a extração terminar.
+#
+#   iter_rows(matriz)                 matriz de textos (read_table_rows/table_rows)
+#   iter_frame_rows(frame)            tabela no navegador, lida em blocos de N <tr>
+#   iter_html_rows(html ou arquivo)   HTML salvo, parseado incrementalmente (html.parser)
+#
+#   with CsvSink("a.csv") as csv, NdjsonSink("a.ndjson") as nd, ParquetSink("a.parquet") as pq:
+#       for row in tee(iter_html_rows("pagina.html"), csv, nd, pq):
+#           ...                       (cada linha já foi gravada)
+#
+# Uso:
+#   python row_stream.py saida/*/balancete_popup.html --ndjson todas.ndjson --parquet todas.parquet
+
+import argparse
+import csv
+import glob
+import json
+import re
+import sys
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from html.parser import HTMLParser
+
+from br_numbers import parse_br_number
+from parse_html import HEADER_FIELDS, normalize_competencia
+
+# mesma normalização de parse_html.cell_text (mantém o &nbsp; interno)
+WHITESPACE_RE = re.compile(r"[ \t\n\r\f]+")
+
+# <tr> lidos do navegador por chamada em iter_frame_rows
+FRAME_CHUNK = 500
+
+ROW_FIELDS = ("cnpj", "competencia", "cod_cvm", "conta", "descricao", "valor_text", "valor")
+
+
+class BalanceteRow:
+    """Uma conta do Balancete com os dados do fundo (cnpj, competência, Cód. CVM)."""
+
+    __slots__ = ROW_FIELDS
+
+    def __init__(self, cnpj, competencia, cod_cvm, conta, descricao, valor_text, valor):
+        self.cnpj = cnpj                # str (14 dígitos) ou None
+        self.competencia = competencia  # "AAAA-MM" ou None
+        self.cod_cvm = cod_cvm          # int ou None
+        self.conta = conta              # int (código COSIF)
+        self.descricao = descricao      # str
+        self.valor_text = valor_text    # str, como na página
+        self.valor = valor              # float ou None
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"BalanceteRow({self.conta}, {self.descricao!r}, {self.valor!r})"
+
+
+# --------------------------
+# GERADORES
+# --------------------------
+def _digits(text):
+    return re.sub(r"\D", "", str(text)) or None
+
+
+def iter_rows(rows, cnpj=None, competencia=None, cod_cvm=None):
+    """
+    BalanceteRow de cada linha de conta (código de 8 dígitos) da matriz de
+    textos, na ordem. As linhas de cabeçalho da tabela ("CNPJ: ...",
+    "Cód. CVM: ...") preenchem cnpj/cod_cvm que não foram informados; o resto
+    (títulos, linhas vazias) é ignorado. `rows` pode ser qualquer iterável.
+    """
+    cnpj = _digits(cnpj) if cnpj else None
+    cod_cvm = int(_digits(cod_cvm)) if cod_cvm and _digits(cod_cvm) else None
+    for texts in rows:
+        if not texts or len(texts) < 2:
+            continue
+        code = texts[0].strip()
+        if len(code) == 8 and code.isdigit():
+            yield BalanceteRow(cnpj, competencia, cod_cvm, int(code), texts[1], texts[-1],
+                               parse_br_number(texts[-1]))
+            continue
+        for text in texts:
+            label, sep, value = str(text).partition(":")
+            field = HEADER_FIELDS.get(label.strip().lower())
+            if not sep or not _digits(value):
+                continue
+            if field == "cnpj" and cnpj is None:
+                cnpj = _digits(value)
+            elif field == "cod_cvm" and cod_cvm is None:
+                cod_cvm = int(_digits(value))
+
+
+TABLE_SLICE_JS = """
+([table, start, end]) => Array.from(table.querySelectorAll('tr')).slice(start, end).map(
+    tr => Array.from(tr.querySelectorAll('td')).map(td => td.innerText.trim())
+)
+"""
+
+
+def iter_table_handle(table_handle, chunk=FRAME_CHUNK):
+    """Matriz de textos da tabela no navegador, `chunk` linhas por ida e volta (gerador)."""
+    total = table_handle.evaluate("table => table.querySelectorAll('tr').length")
+    for start in range(0, total, chunk):
+        yield from table_handle.evaluate(TABLE_SLICE_JS, [table_handle, start, start + chunk])
+
+
+def iter_frame_rows(frame, table_handle=None, chunk=FRAME_CHUNK, **meta):
+    """
+    BalanceteRow da tabela do Balancete no frame (Playwright), lidas em blocos
+    de `chunk` <tr>. meta: cnpj/competencia/cod_cvm (ver iter_rows).
+    """
+    if table_handle is None:
+        table_handle = frame.query_selector("table#Table1") or frame.query_selector("table.BodyPP")
+        if table_handle is None:
+            return
+    yield from iter_rows(iter_table_handle(table_handle, chunk), **meta)
+
+
+class _TableRowParser(HTMLParser):
+    """
+    Parser incremental (feed) que junta as células de cada <tr> da tabela do
+    Balancete (table#Table1 ou table.BodyPP) e a competência selecionada no
+    select#ddCOMPTC. As linhas prontas ficam em self.ready até serem consumidas.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.ready = []
+        self.competencia = None
+        self._depth = 0       # tabelas abertas a partir da do Balancete (0 = fora dela)
+        self._row = None
+        self._cell = None
+        self._in_select = False
+        self._option = None
+        self._first_option = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "table":
+            classes = (attrs.get("class") or "").split()
+            if self._depth or attrs.get("id") == "Table1" or "BodyPP" in classes:
+                self._depth += 1
+        elif self._depth and tag == "tr":
+            self._row = []
+        elif self._depth and tag == "td" and self._row is not None:
+            self._cell = []
+        elif tag == "select" and attrs.get("id") == "ddCOMPTC":
+            self._in_select = True
+        elif tag == "option" and self._in_select:
+            self._option = [attrs.get("value"), "selected" in attrs, []]
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._depth:
+            self._depth -= 1
+        elif tag == "td" and self._cell is not None:
+            self._row.append(WHITESPACE_RE.sub(" ", "".join(self._cell)).strip())
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.ready.append(self._row)
+            self._row = None
+        elif tag == "option" and self._option is not None:
+            self._close_option()
+        elif tag == "select" and self._in_select:
+            if self._option is not None:
+                self._close_option()
+            self._in_select = False
+            if self.competencia is None:
+                self.competencia = self._first_option
+
+    def _close_option(self):
+        value, selected, text = self._option
+        self._option = None
+        try:
+            competencia = normalize_competencia(value or "".join(text).strip())
+        except ValueError:
+            return
+        if selected:
+            self.competencia = competencia
+        elif self._first_option is None:
+            self._first_option = competencia
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        elif self._option is not None:
+            self._option[2].append(data)
+
+
+def _html_chunks(source, size):
+    if isinstance(source, (bytes, bytearray)):
+        source = source.decode("utf-8", errors="replace")
+    if isinstance(source, str) and ("<" in source or not source):
+        for i in range(0, len(source), size):
+            yield source[i:i + size]
+        return
+    with open(source, encoding="utf-8", errors="replace") as fh:
+        while True:
+            chunk = fh.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_html_rows(source, chunk_size=64 * 1024, **meta):
+    """
+    BalanceteRow de um HTML de Balancete (texto, bytes ou caminho de arquivo),
+    lido em pedaços de `chunk_size`: as linhas saem enquanto o arquivo ainda
+    está sendo lido. A competência vem do select#ddCOMPTC se aparecer antes
+    da tabela (ou de meta["competencia"]).
+    """
+    parser = _TableRowParser()
+
+    def matrix():
+        for chunk in _html_chunks(source, chunk_size):
+            parser.feed(chunk)
+            rows, parser.ready = parser.ready, []
+            yield from rows
+        parser.close()
+        yield from parser.ready
+
+    competencia = meta.pop("competencia", None)
+    for row in iter_rows(matrix(), **meta):
+        row.competencia = competencia or parser.competencia
+        yield row
+
+
+# --------------------------
+# SINKS
+# --------------------------
+class _Sink(ABC):
+    """Base dos destinos: subclasses implementam write(row) (e close, se precisarem)."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @abstractmethod
+    def write(self, row):
+        """Grava uma BalanceteRow e soma em self.rows."""
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class CsvSink(_Sink):
+    """CSV com cabeçalho (utf-8-sig, como save_balancete), uma linha gravada por conta."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._fh = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow(ROW_FIELDS)
+
+    def write(self, row):
+        self._writer.writerow([getattr(row, f) for f in ROW_FIELDS])
+        self.rows += 1
+
+    def close(self):
+        self._fh.close()
+
+
+class NdjsonSink(_Sink):
+    """Uma linha JSON por conta (NDJSON); dá para ler com tail -f enquanto grava."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._fh = open(path, "w", encoding="utf-8")
+
+    def write(self, row):
+        self._fh.write(json.dumps(row.as_dict(), ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def close(self):
+        self._fh.close()
+
+
+class ParquetSink(_Sink):
+    """
+    Parquet gravado em row groups de `row_group_size` linhas (só um row group
+    fica em memória). Valor em decimal(18,2) a partir do texto, como o
+    parquet_store; precisa do pyarrow.
+    """
+
+    def __init__(self, path, row_group_size=50_000, compression="zstd"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from parquet_store import VALOR_TYPE
+
+        super().__init__()
+        self.path = path
+        self.row_group_size = row_group_size
+        self._pa = pa
+        self.schema = pa.schema([
+            ("cnpj", pa.string()),
+            ("competencia", pa.string()),
+            ("cod_cvm", pa.int32()),
+            ("conta", pa.int32()),
+            ("descricao", pa.string()),
+            ("valor", VALOR_TYPE),
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        self._buffer = {name: [] for name in self.schema.names}
+
+    def write(self, row):
+        buf = self._buffer
+        buf["cnpj"].append(row.cnpj)
+        buf["competencia"].append(row.competencia)
+        buf["cod_cvm"].append(row.cod_cvm)
+        buf["conta"].append(row.conta)
+        buf["descricao"].append(row.descricao)
+        valor = parse_br_number(row.valor_text, exact=True)
+        buf["valor"].append(valor.quantize(Decimal("0.01")) if valor is not None else None)
+        self.rows += 1
+        if len(buf["conta"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer["conta"]:
+            return
+        self._writer.write_table(self._pa.table(self._buffer, schema=self.schema))
+        self._buffer = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def tee(rows, *sinks):
+    """Grava cada linha em todos os sinks e a repassa adiante (gerador)."""
+    for row in rows:
+        for sink in sinks:
+            sink.write(row)
+        yield row
+
+
+def open_sinks(csv_path=None, ndjson_path=None, parquet_path=None, row_group_size=50_000):
+    """Sinks para os caminhos informados (os None ficam de fora)."""
+    sinks = []
+    if csv_path:
+        sinks.append(CsvSink(csv_path))
+    if ndjson_path:
+        sinks.append(NdjsonSink(ndjson_path))
+    if parquet_path:
+        sinks.append(ParquetSink(parquet_path, row_group_size=row_group_size))
+    return sinks
+
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None):
+    from scraping import log
+
+    parser = argparse.ArgumentParser(description="Extrai em fluxo as contas de páginas de Balancete salvas.")
+    parser.add_argument("paths", nargs="+", help="arquivos HTML (aceita glob)")
+    parser.add_argument("--csv", default=None, help="grava todas as linhas neste CSV")
+    parser.add_argument("--ndjson", default=None, help="grava todas as linhas neste NDJSON")
+    parser.add_argument("--parquet", default=None, help="grava todas as linhas neste Parquet")
+    parser.add_argument("--row-group", type=int, default=50_000, help="linhas por row group do Parquet")
+    parser.add_argument("--cnpj", default=None, help="CNPJ das páginas (se a tabela não trouxer)")
+    args = parser.parse_args(argv)
+
+    paths = [p for pattern in args.paths for p in (sorted(glob.glob(pattern)) or [pattern])]
+    sinks = open_sinks(args.csv, args.ndjson, args.parquet, args.row_group)
+    if not sinks:
+        parser.error("informe ao menos um destino: --csv, --ndjson ou --parquet")
+    total = 0
+    try:
+        for path in paths:
+            n = sum(1 for _ in tee(iter_html_rows(path, cnpj=args.cnpj), *sinks))
+            if not n:
+                log(f"❌ Nenhuma conta em {path}")
+            total += n
+    finally:
+        for sink in sinks:
+            sink.close()
+    log(f"{total} linhas de {len(paths)} arquivos gravadas em " + ", ".join(s.path for s in sinks))
+    return 0 if total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,21 @@
 # scraping.py (versão atualizada: extrai coluna 'Valor Saldo' do balancete)
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-import time
-import sys
-import re
-import json
-
-# pandas é usado para salvar CSV e visualizar
-import pandas as pd
+import argparse
+import os
+
+# pandas e Playwright são importados só nas funções que os usam: normalizar um
+# CNPJ não carrega nenhum dos dois, e parsear HTML salvo não carrega o Playwright.
+
+import metrics
+from br_numbers import parse_br_series
+from strategy_cache import StrategyCache
+from throttle import RETRY_STATUS, TransientError, limited
+from waits import (
+    WaitConfig,
+    click_and_wait_navigation,
+    click_link_and_wait,
+    wait_for_frame,
+    wait_for_selector_in_frames,
+)
 
 # --------------------------
 # LOG SIMPLES
@@ -35,40 +44,12 @@ def find_frame_with_url_fragment(page, fragment):
     return None
 
 
-def wait_for_frame_by_fragment(page, fragment, retries=20, delay=0.5):
-    for _ in range(retries):
-        f = find_frame_with_url_fragment(page, fragment)
-        if f:
-            return f
-        time.sleep(delay)
-    return None
-
-
-# --------------------------
-# CONVERTE STRING BR PARA FLOAT
-# --------------------------
-def parse_num_br(s):
-    """Converte '1.234.567,89' -> 1234567.89, retorna None se não for número."""
-    if s is None:
-        return None
-    s = str(s).strip()
-    if s == "":
-        return None
-    # manter dígitos, pontos, vírgulas, hífen
-    s = re.sub(r"[^\d\-,\.]", "", s)
-    # se ambos presentes, remover pontos (milhares) e trocar vírgula por ponto
-    if "." in s and "," in s:
-        s = s.replace(".", "").replace(",", ".")
-    else:
-        # trocar vírgula por ponto se for decimal
-        if "," in s and s.count(",") == 1 and s.count(".") == 0:
-            s = s.replace(",", ".")
-        else:
-            s = s.replace(",", ".")
-    try:
-        return float(s)
-    except:
-        return None
+def wait_for_frame_by_fragment(page, fragment, retries=20, delay=0.5, timeout=None):
+    """
+    Espera o frame aparecer (evento framenavigated, sem polling).
+    timeout em ms; por padrão retries x delay, como no loop antigo.
+    """
+    return wait_for_frame(page, fragment, timeout if timeout is not None else int(retries * delay * 1000))
 
 
 # --------------------------
@@ -100,55 +81,150 @@ def find_link_in_all_frames(page, css_selector=None, text_contains=None, href_co
     return None, None
 
 
-def find_link_by_multiple_strategies(page, selectors=None, texts=None, href_keywords=None, tries=10, delay=0.8):
+def find_cached(page, cache, step):
+    """
+    Testa os caminhos (frame + seletor) que já funcionaram nesta etapa,
+    uma consulta por caminho. Retorna (frame, element, selector) ou (None, None, None).
+    """
+    if not cache:
+        return None, None, None
+    for f, sel in cache.candidates(page, step):
+        try:
+            el = f.query_selector(sel)
+        except Exception:
+            continue
+        if el:
+            log(f"⚡ {step}: caminho em cache '{sel}' no frame '{f.name}'")
+            metrics.count("strategy_cache_hits", step=step)
+            cache.record(step, f, sel)
+            return f, el, sel
+    return None, None, None
+
+
+def find_link_by_multiple_strategies(page, selectors=None, texts=None, href_keywords=None, tries=10, delay=0.8,
+                                     timeout=None, prefer_frame=None, cache=None, cache_step="balancete_link"):
+    """
+    Tenta primeiro o caminho gravado no cache (strategy_cache.StrategyCache);
+    depois espera algum dos seletores aparecer (ver waits.wait_for_selector_in_frames)
+    e, se não aparecer, tenta uma vez por texto e por trecho do href.
+    O caminho vencedor é gravado no cache como seletor.
+    timeout em ms; por padrão tries x delay, como no loop antigo.
+    """
     selectors = selectors or []
     texts = texts or []
     href_keywords = href_keywords or []
-    for attempt in range(tries):
-        log(f"Tentativa {attempt+1}/{tries} para localizar link...")
-        for sel in selectors:
-            f, el = find_link_in_all_frames(page, css_selector=sel)
-            if el:
-                return f, el
-        for txt in texts:
-            f, el = find_link_in_all_frames(page, text_contains=txt)
-            if el:
-                return f, el
-        for kw in href_keywords:
-            f, el = find_link_in_all_frames(page, href_contains=kw)
-            if el:
-                return f, el
-        time.sleep(delay)
+    timeout = timeout if timeout is not None else int(tries * delay * 1000)
+
+    f, el, _ = find_cached(page, cache, cache_step)
+    if el:
+        return f, el
+
+    if selectors:
+        f, el, sel = wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=prefer_frame)
+        if el:
+            if cache:
+                cache.record(cache_step, f, sel)
+            return f, el
+    for txt in texts:
+        f, el = find_link_in_all_frames(page, text_contains=txt)
+        if el:
+            if cache:
+                cache.record(cache_step, f, f"text={txt}")
+            return f, el
+    for kw in href_keywords:
+        f, el = find_link_in_all_frames(page, href_contains=kw)
+        if el:
+            if cache:
+                cache.record(cache_step, f, f"a[href*='{kw}' i]")
+            return f, el
     return None, None
 
 
 # --------------------------
 # PROCURA TABELA EM TODOS OS FRAMES
 # --------------------------
-def find_table_frame(page, selectors=None, tries=8, delay=0.6):
+def find_table_frame(page, selectors=None, tries=8, delay=0.6, timeout=None, prefer_frame=None,
+                     cache=None, cache_step="balancete_table"):
+    """
+    Espera a tabela aparecer em algum frame (caminho em cache primeiro).
+    Retorna (frame, handle, seletor).
+    timeout em ms; por padrão tries x delay, como no loop antigo.
+    """
     selectors = selectors or ["table#Table1", "table.BodyPP", "form#form1 table"]
-    for attempt in range(tries):
-        log(f"Procurando tabela (tentativa {attempt+1}/{tries})...")
-        for f in page.frames:
-            try:
-                for sel in selectors:
-                    el = f.query_selector(sel)
-                    if el:
-                        log(f"Encontrada tabela com seletor '{sel}' no frame: name='{f.name}' url='{f.url}'")
-                        return f, el, sel
-            except Exception:
-                continue
-        time.sleep(delay)
-    return None, None, None
+    timeout = timeout if timeout is not None else int(tries * delay * 1000)
+    f, el, sel = find_cached(page, cache, cache_step)
+    if el:
+        return f, el, sel
+
+    log("Procurando tabela...")
+    f, el, sel = wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=prefer_frame)
+    if el:
+        log(f"Encontrada tabela com seletor '{sel}' no frame: name='{f.name}' url='{f.url}'")
+        if cache:
+            cache.record(cache_step, f, sel)
+    return f, el, sel
 
 
 # --------------------------
 # EXTRAI LINHAS DA TABELA DO BALANCETE
 # --------------------------
-def extract_balancete_table_from_frame(frame, table_handle=None):
+# Executado dentro do navegador: devolve a matriz de textos (linhas x células)
+# da tabela numa única ida e volta, em vez de um inner_text() por célula.
+# Usa querySelectorAll como o modo "cells" para manter as mesmas linhas.
+TABLE_ROWS_JS = """
+table => Array.from(table.querySelectorAll('tr')).map(
+    tr => Array.from(tr.querySelectorAll('td')).map(td => td.innerText.trim())
+)
+"""
+
+
+def read_table_rows(table_handle, mode="evaluate"):
+    """
+    Lê a tabela como lista de linhas, cada linha uma lista de textos das <td>.
+    mode="evaluate": uma única chamada ao navegador (padrão).
+    mode="cells": um inner_text() por célula (comportamento antigo).
+    """
+    if mode == "evaluate":
+        return table_handle.evaluate(TABLE_ROWS_JS)
+
+    rows = []
+    for tr in table_handle.query_selector_all("tr"):
+        try:
+            rows.append([td.inner_text().strip() for td in tr.query_selector_all("td")])
+        except Exception:
+            continue
+    return rows
+
+
+def records_from_rows(rows):
+    """
+    Converte a matriz de textos nos registros conta/descricao/valor_text/valor.
+    Linhas com menos de 2 células são ignoradas.
+    """
+    records = []
+    for texts in rows:
+        if not texts or len(texts) < 2:
+            continue
+        # heurística: 1º = conta, 2º = descrição, último = valor
+        records.append({
+            "conta": texts[0],
+            "descricao": texts[1],
+            "valor_text": texts[-1],
+            "valor": None
+        })
+    # valores convertidos de uma vez (br_numbers); texto que não é número vira None
+    valores = parse_br_series([r["valor_text"] for r in records])
+    for r, v in zip(records, valores.tolist()):
+        r["valor"] = None if v != v else v
+    return records
+
+
+def extract_balancete_table_from_frame(frame, table_handle=None, mode="evaluate"):
     """
     Recebe um frame (contendo a tabela) e extrai as linhas.
+    mode: ver read_table_rows ("evaluate" = uma ida e volta ao navegador).
     Retorna pandas.DataFrame com colunas: conta, descricao, valor_text, valor
+    (para ler em fluxo, linha a linha, ver row_stream.iter_frame_rows).
     """
     if table_handle is None:
         table_handle = frame.query_selector("table#Table1") or frame.query_selector("table.BodyPP")
@@ -156,28 +232,9 @@ def extract_balancete_table_from_frame(frame, table_handle=None):
             log("❌ table_handle não fornecida e não encontrada no frame.")
             return None
 
-    rows = table_handle.query_selector_all("tr")
-    records = []
-    for tr in rows:
-        try:
-            tds = tr.query_selector_all("td")
-            if not tds or len(tds) < 2:
-                continue
-            texts = [td.inner_text().strip() for td in tds]
-            # heurística: 1º = conta, 2º = descrição, último = valor
-            conta = texts[0]
-            descricao = texts[1] if len(texts) > 1 else ""
-            valor_text = texts[-1]
-            valor = parse_num_br(valor_text)
-            records.append({
-                "conta": conta,
-                "descricao": descricao,
-                "valor_text": valor_text,
-                "valor": valor
-            })
-        except Exception:
-            continue
+    import pandas as pd
 
+    records = records_from_rows(read_table_rows(table_handle, mode=mode))
     df = pd.DataFrame(records)
     return df
 
@@ -185,12 +242,20 @@ def extract_balancete_table_from_frame(frame, table_handle=None):
 # --------------------------
 # CAPTURA BALANCETE (procura tabela e salva)
 # --------------------------
-def capture_balancete_and_save(page, out_prefix="balancete"):
+def capture_balancete_and_save(page, out_prefix="balancete", timeout=None, prefer_frame=None, cache=None,
+                               page_cache=None, cnpj=None, store=None, snapshots=None, parse_stage=None):
     """
     Procura a tabela do balancete em todos os frames, extrai e salva CSV/JSON.
+    prefer_frame: frame onde o Balancete abriu (espera nele pela tabela).
+    cache: strategy_cache.StrategyCache com os caminhos já vencedores.
+    page_cache, store, snapshots (com cnpj): ver persist_balancete.
+    parse_stage: parse_stage.ParseStage; só o HTML do frame sai daqui, o parse
+    e a gravação ficam com o estágio (retorna um Future do DataFrame).
     Retorna DataFrame.
     """
-    f, table_handle, used_sel = find_table_frame(page, selectors=["table#Table1", "table.BodyPP", "form#form1 table"])
+    with metrics.step("balancete_table"):
+        f, table_handle, used_sel = find_table_frame(page, selectors=["table#Table1", "table.BodyPP", "form#form1 table"],
+                                                     timeout=timeout, prefer_frame=prefer_frame, cache=cache)
     if not f:
         log("❌ Não localizei a tabela do balancete em nenhum frame.")
         # salva debug
@@ -202,13 +267,39 @@ def capture_balancete_and_save(page, out_prefix="balancete"):
                 pass
         return None
 
+    if parse_stage is not None:
+        with metrics.step("page_html"):
+            html = f.content()
+        log(f"HTML do frame '{f.name}' enviado ao estágio de parse.")
+        return parse_stage.submit(html, lambda df: _persist_parsed(df, out_prefix, cnpj, html, page_cache, store,
+                                                                   snapshots), cnpj=cnpj)
+
     log(f"Extraindo tabela no frame '{f.name}' ({f.url}) com seletor '{used_sel}'...")
-    df = extract_balancete_table_from_frame(f, table_handle=table_handle)
+    with metrics.step("extract"):
+        df = extract_balancete_table_from_frame(f, table_handle=table_handle)
     if df is None or df.empty:
         log("❌ Extração retornou vazio.")
         return None
+    metrics.count("rows_extracted", len(df))
+
+    with metrics.step("page_html"):
+        html = f.content() if cnpj and (page_cache, store, snapshots) != (None, None, None) else None
+    with metrics.step("write"):
+        persist_balancete(df, out_prefix, cnpj=cnpj, html=html, page_cache=page_cache, store=store,
+                          snapshots=snapshots)
+    return df
+
 
-    # salvar
+def _persist_parsed(df, out_prefix, cnpj, html, page_cache, store, snapshots):
+    """write() do ParseStage para o fluxo do navegador. Retorna o DataFrame."""
+    if df is None or df.empty:
+        raise RuntimeError("Falha ao extrair tabela do balancete")
+    persist_balancete(df, out_prefix, cnpj=cnpj, html=html, page_cache=page_cache, store=store, snapshots=snapshots)
+    return df
+
+
+def save_balancete(df, out_prefix="balancete"):
+    """Salva o DataFrame extraído em {out_prefix}.csv e {out_prefix}.json."""
     csv_path = f"{out_prefix}.csv"
     json_path = f"{out_prefix}.json"
     df.to_csv(csv_path, index=False, encoding="utf-8-sig")
@@ -216,146 +307,289 @@ def capture_balancete_and_save(page, out_prefix="balancete"):
 
     log(f"✅ Extração salva: {csv_path}, {json_path}")
     print(df.head(10))
-    return df
+
+
+def persist_balancete(df, out_prefix="balancete", cnpj=None, html=None, page_cache=None, store=None,
+                      snapshots=None):
+    """
+    Destinos de uma extração (os opcionais precisam de cnpj e do html da página):
+      page_cache  page_cache.PageCache: guarda o HTML;
+      snapshots   snapshot_diff.SnapshotStore: compara com a última extração do
+                  CNPJ; sem mudança, não regrava o que já está em disco (CSV,
+                  partição do store); com mudança, grava também {out_prefix}.delta.json.
+                  O snapshot só é atualizado depois das gravações: se alguma
+                  falhar, a próxima execução ainda vê a mudança;
+      store       parquet_store.BalanceteStore: grava a partição do mês;
+    e save_balancete (CSV/JSON). Retorna o SnapshotDiff (ou None).
+    """
+    if not cnpj or html is None:
+        save_balancete(df, out_prefix)
+        return None
+    if page_cache is not None:
+        page_cache.put_balancete(cnpj, html)
+
+    delta = None
+    competencia = None
+    if snapshots is not None:
+        from parse_html import competencia_from_html
+
+        competencia = competencia_from_html(html)
+        delta = snapshots.compare(cnpj, df, competencia)
+        log(f"Δ {delta.summary()}")
+    unchanged = delta is not None and delta.unchanged
+
+    if not (unchanged and os.path.exists(f"{out_prefix}.csv")):
+        save_balancete(df, out_prefix)
+    if store is not None and not (unchanged and competencia and store.has(cnpj, competencia)):
+        store.write_page(df, cnpj, html)
+    if delta is not None and not unchanged:
+        if not delta.first:
+            delta.save(f"{out_prefix}.delta.json")
+        snapshots.update(cnpj, df, competencia)
+    return delta
 
 
 # ==========================================================
-# SCRAPER PRINCIPAL (mantém o seu fluxo original)
+# FLUXO DE UM FUNDO (reutilizável em lote)
 # ==========================================================
-def main_scrape(raw_cnpj):
-    cnpj = normalize_cnpj(raw_cnpj)
-    URL = "https://cvmweb.cvm.gov.br/SWB/default.asp?sg_sistema=fundosreg"
+URL = "https://cvmweb.cvm.gov.br/SWB/default.asp?sg_sistema=fundosreg"
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        context = browser.new_context(accept_downloads=True)
-        page = context.new_page()
 
-        try:
-            # 1) Página inicial
-            log("Abrindo página inicial...")
-            page.goto(URL, wait_until="domcontentloaded")
-            page.wait_for_load_state("networkidle")
-            time.sleep(1)
-
-            # 2) Localizar frame com formulário
-            log("Localizando frame de busca...")
-            search_frame = wait_for_frame_by_fragment(page, "FormBuscaParticFdo.aspx")
-            if not search_frame:
-                log("❌ Frame de busca não encontrado!")
-                return
+def load_cached_balancete(page_cache, cnpj, out_prefix="balancete", competencia="", store=None, snapshots=None):
+    """Parseia e salva o Balancete do page_cache, se houver. Retorna DataFrame ou None."""
+    from parse_html import parse_balancete_html
 
-            log(f"Frame encontrado: {search_frame.url}")
+    with metrics.step("page_cache"):
+        html = page_cache.get(cnpj, competencia, "balancete")
+        df = parse_balancete_html(html) if html is not None else None
+    if df is None or df.empty:
+        return None
+    log(f"♻️ Balancete de {cnpj} lido do cache local (sem rede).")
+    metrics.count("page_cache_hits")
+    metrics.count("rows_extracted", len(df))
+    with metrics.step("write"):
+        persist_balancete(df, out_prefix, cnpj=cnpj, html=html, store=store, snapshots=snapshots)
+    return df
 
-            # 3) Preencher CNPJ
-            log("Preenchendo CNPJ...")
-            search_frame.fill("#txtCNPJNome", cnpj)
-            time.sleep(0.3)
 
-            log("Clicando em btnContinuar...")
-            search_frame.click("#btnContinuar")
-            page.wait_for_load_state("domcontentloaded")
-            time.sleep(1)
+def scrape_balancete(page, cnpj, out_prefix="balancete", debug_dir=".", url=URL, wait_config=None,
+                     strategy_cache=None, page_cache=None, store=None, snapshots=None, throttle=None,
+                     parse_stage=None, fund_index=None, cod_cvm=None):
+    """
+    Executa o fluxo busca -> fundo -> Balancete -> tabela numa página já aberta.
+    Não abre nem fecha navegador: quem chama controla o ciclo de vida
+    (main_scrape para uso interativo, batch.py para lotes).
+    url permite apontar para outro host (ex.: stub_server.py).
+    wait_config: waits.WaitConfig com os timeouts de cada etapa.
+    strategy_cache: StrategyCache; None usa o cache padrão em disco, False desliga.
+    page_cache: page_cache.PageCache; se tiver o Balancete do CNPJ dentro do
+    TTL, parseia dali sem abrir o site; senão grava o HTML baixado.
+    store: parquet_store.BalanceteStore onde gravar a extração (além do CSV/JSON).
+    snapshots: snapshot_diff.SnapshotStore; extração igual à anterior não é regravada.
+    throttle: throttle.Throttle; cada navegação passa pelo limiter e a página
+    inicial é recarregada em falhas transitórias.
+    parse_stage: parse_stage.ParseStage; a página só entrega o HTML e o retorno
+    é um concurrent.futures.Future do DataFrame (parse/gravação em outro processo).
+    fund_index: fund_index.FundIndex; com a URL do fundo já indexada pula a
+    busca, e cada busca feita alimenta o índice. cod_cvm: classe a abrir
+    quando o CNPJ tem várias (padrão: a de menor Cód. CVM, com aviso).
+    Retorna DataFrame ou levanta RuntimeError descrevendo a etapa que falhou.
+    """
+    # todos os argumentos opcionais, para refazer o fluxo pela busca sem esquecer nenhum
+    options = {k: v for k, v in locals().items() if k not in ("page", "cnpj")}
+    cnpj = normalize_cnpj(cnpj)
+    if page_cache is not None:
+        df = load_cached_balancete(page_cache, cnpj, out_prefix, store=store, snapshots=snapshots)
+        if df is not None:
+            return df
+    waits = wait_config or WaitConfig()
+    cache = StrategyCache.shared() if strategy_cache is None else strategy_cache or None
+    page.set_default_timeout(waits.default)
+
+    def goto(target, step):
+        def open_page():
+            resp = page.goto(target, wait_until="domcontentloaded", timeout=waits.timeout("goto"))
+            if resp is not None and resp.status in RETRY_STATUS:
+                raise TransientError(f"HTTP {resp.status} em {target}", resp.status, resp.headers.get("retry-after"))
+
+        with metrics.step(step):
+            if throttle is None:
+                open_page()
+            else:
+                throttle.call(step, open_page)
 
-            # 4) Achar lista de fundos
-            log("Procurando links de fundos...")
-            links = search_frame.query_selector_all("a[id*='Linkbutton4']")
-            log(f"Fundos encontrados: {len(links)}")
+    # 0) Fundo já conhecido no fund_index: vai direto à página dele
+    direct = None
+    if fund_index is not None:
+        try:
+            direct = fund_index.choose(cnpj, cod_cvm)
+        except LookupError:
+            direct = None  # classe pedida ainda não indexada: a busca atualiza o índice
+    if direct is not None and direct.fund_url:
+        log(f"Abrindo o fundo direto pelo índice (Cód. CVM {direct.cod_cvm})...")
+        goto(direct.fund_url, "fund_direct")
+        search_frame = page.main_frame
+        metrics.count("fund_index_hits")
+    else:
+        direct = None
+        # 1) Página inicial
+        log("Abrindo página inicial...")
+        goto(url, "goto")
+
+        # 2) Localizar frame com formulário
+        log("Localizando frame de busca...")
+        with metrics.step("search_frame"):
+            search_frame = wait_for_frame(page, "FormBuscaParticFdo.aspx", waits.timeout("search_frame"))
+        if not search_frame:
+            raise RuntimeError("Frame de busca não encontrado")
+
+        log(f"Frame encontrado: {search_frame.url}")
+
+        # 3) Preencher CNPJ (fill já espera o campo existir)
+        log("Preenchendo CNPJ...")
+        search_frame.fill("#txtCNPJNome", cnpj, timeout=waits.timeout("search_frame"))
+
+        log("Clicando em btnContinuar...")
+        with metrics.step("search_submit"), limited(throttle, "search_submit"):
+            click_and_wait_navigation(search_frame, "#btnContinuar", waits.timeout("search_submit"))
+
+        # 4) Achar lista de fundos
+        log("Procurando links de fundos...")
+        links = search_frame.query_selector_all("a[id*='Linkbutton4']")
+        log(f"Fundos encontrados: {len(links)}")
+
+        if not links:
+            raise RuntimeError(f"Nenhum fundo encontrado para o CNPJ {cnpj}")
+
+        # 5) Clicar no fundo (a classe pedida ou, com várias, a de menor Cód. CVM — ver fund_index)
+        from fund_index import choose_entry, is_fund_page_url, parse_search_results
+
+        results_url = search_frame.url
+        results_html = search_frame.content()
+        if fund_index is not None:
+            entries = fund_index.record_search(cnpj, results_html)
+        else:
+            entries = parse_search_results(results_html, cnpj)
+        entry = choose_entry(entries, cod_cvm)
+        position = entry.position if entry is not None and entry.position < len(links) else 0
+        log(f"Clicando no fundo #{position}...")
+        links[position].scroll_into_view_if_needed()
+        with metrics.step("fund_click"), limited(throttle, "fund_click"):
+            click_and_wait_navigation(search_frame, links[position], waits.timeout("fund_click"))
+        if fund_index is not None and entry is not None and is_fund_page_url(search_frame.url, results_url):
+            fund_index.record_opened(cnpj, position, search_frame.url)
+
+    # Debug
+    log("=== FRAMES APÓS O CLIQUE DO FUNDO ===")
+    for i, f in enumerate(page.frames):
+        log(f"[{i}] name='{f.name}'  url='{f.url}'")
+    log("======================================")
+
+    # ==========================================================
+    # BUSCAR O LINK DO BALANCETE (#Hyperlink5)
+    # ==========================================================
+    log("🔍 Buscando o link do BALANCETE (#Hyperlink5)...")
+
+    selectors = [
+        "#Hyperlink5",       # seletor exato
+        "a[id*='Hyperlink5']"
+    ]
+
+    texts = [
+        "Balancete",
+        "Balançete"
+    ]
+
+    href_keywords = [
+        "balanc",
+        "balan"
+    ]
+
+    with metrics.step("balancete_link"):
+        frame_link, link_handle = find_link_by_multiple_strategies(
+            page,
+            selectors=selectors,
+            texts=texts,
+            href_keywords=href_keywords,
+            timeout=waits.timeout("balancete_link"),
+            prefer_frame=search_frame,
+            cache=cache
+        )
+
+    if not link_handle and direct is not None:
+        log("URL do índice sem o link do Balancete; refazendo pela busca...")
+        fund_index.forget_url(cnpj, direct.position)
+        return scrape_balancete(page, cnpj, **options)
+    if not link_handle:
+        log("❌ Não foi possível localizar o link #Hyperlink5 (Balancete).")
+        log("Salvando debug...")
+        page.screenshot(path=os.path.join(debug_dir, "balancete_not_found.png"), full_page=True)
+        for i, f in enumerate(page.frames):
+            try:
+                open(os.path.join(debug_dir, f"frame_debug_{i}.html"), "w", encoding="utf-8").write(f.content())
+            except:
+                pass
+        raise RuntimeError("Link do Balancete (#Hyperlink5) não encontrado")
+
+    log(f"✅ Link do Balancete encontrado no frame '{frame_link.name}' ({frame_link.url})")
+
+    # ==========================================================
+    # CLICAR NO BALANCETE E CAPTURAR TABELA
+    # ==========================================================
+    log("Clicando no link do Balancete...")
+
+    with metrics.step("balancete_open"), limited(throttle, "balancete_open"):
+        page_to_extract, table_frame = click_link_and_wait(page, frame_link, link_handle,
+                                                           waits.timeout("balancete_open"))
+    with metrics.step("debug_dump"):
+        if page_to_extract is not page:
+            log("Balancete abriu em popup.")
+            page_to_extract.screenshot(path=os.path.join(debug_dir, "balancete_popup.png"), full_page=True)
+            open(os.path.join(debug_dir, "balancete_popup.html"), "w", encoding="utf-8").write(page_to_extract.content())
+        else:
+            log("Nenhum popup — a página abriu no mesmo frame.")
+            # salvamos o HTML/screenshot do frame onde foi clicado (debug)
+            try:
+                table_frame.frame_element().screenshot(path=os.path.join(debug_dir, "balancete_frame.png"))
+                open(os.path.join(debug_dir, "balancete_frame.html"), "w", encoding="utf-8").write(table_frame.content())
+            except:
+                page.screenshot(path=os.path.join(debug_dir, "balancete_page.png"), full_page=True)
+                open(os.path.join(debug_dir, "balancete_page.html"), "w", encoding="utf-8").write(page.content())
+
+    # Agora: extração do balancete (procura tabela no contexto page_to_extract)
+    log("Iniciando extração da tabela do balancete (valor saldo)...")
+    df = capture_balancete_and_save(page_to_extract, out_prefix=out_prefix,
+                                    timeout=waits.timeout("balancete_table"), prefer_frame=table_frame,
+                                    cache=cache, page_cache=page_cache, cnpj=cnpj,
+                                    store=store, snapshots=snapshots, parse_stage=parse_stage)
+    if page_to_extract is not page:
+        page_to_extract.close()
+    if df is None:
+        raise RuntimeError("Falha ao extrair tabela do balancete")
+
+    log("✅ Extração do balancete concluída com sucesso.")
+    return df
 
-            if not links:
-                log("❌ Nenhum fundo encontrado.")
-                return
 
-            # 5) Clicar no primeiro fundo
-            log("Clicando no primeiro fundo...")
-            links[0].scroll_into_view_if_needed()
-            links[0].click()
-            time.sleep(1)
-
-            # Debug
-            log("=== FRAMES APÓS O CLIQUE DO FUNDO ===")
-            for i, f in enumerate(page.frames):
-                log(f"[{i}] name='{f.name}'  url='{f.url}'")
-            log("======================================")
-
-            # ==========================================================
-            # BUSCAR O LINK DO BALANCETE (#Hyperlink5)
-            # ==========================================================
-            log("🔍 Buscando o link do BALANCETE (#Hyperlink5)...")
-
-            selectors = [
-                "#Hyperlink5",       # seletor exato
-                "a[id*='Hyperlink5']"
-            ]
-
-            texts = [
-                "Balancete",
-                "Balançete"
-            ]
-
-            href_keywords = [
-                "balanc",
-                "balan"
-            ]
-
-            frame_link, link_handle = find_link_by_multiple_strategies(
-                page,
-                selectors=selectors,
-                texts=texts,
-                href_keywords=href_keywords,
-                tries=15,
-                delay=0.7
-            )
-
-            if not link_handle:
-                log("❌ Não foi possível localizar o link #Hyperlink5 (Balancete).")
-                log("Salvando debug...")
-                page.screenshot(path="balancete_not_found.png", full_page=True)
-                for i, f in enumerate(page.frames):
-                    try:
-                        open(f"frame_debug_{i}.html", "w", encoding="utf-8").write(f.content())
-                    except:
-                        pass
-                return
+# ==========================================================
+# SCRAPER PRINCIPAL (mantém o seu fluxo original)
+# ==========================================================
+def main_scrape(raw_cnpj):
+    from playwright.sync_api import sync_playwright
 
-            log(f"✅ Link do Balancete encontrado no frame '{frame_link.name}' ({frame_link.url})")
+    cnpj = normalize_cnpj(raw_cnpj)
 
-            # ==========================================================
-            # CLICAR NO BALANCETE E CAPTURAR TABELA
-            # ==========================================================
-            log("Clicando no link do Balancete...")
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=False)
+        context = browser.new_context(accept_downloads=True)
+        page = context.new_page()
 
-            page_to_extract = page  # por padrão
+        try:
             try:
-                with page.expect_popup(timeout=3000) as popup_info:
-                    try:
-                        link_handle.click()
-                    except:
-                        frame_link.evaluate("el => el.click()", link_handle)
-                popup = popup_info.value
-                log("Balancete abriu em popup.")
-                popup.wait_for_load_state("domcontentloaded", timeout=10000)
-                popup.screenshot(path="balancete_popup.png", full_page=True)
-                open("balancete_popup.html", "w", encoding="utf-8").write(popup.content())
-                page_to_extract = popup
-            except PlaywrightTimeoutError:
-                log("Nenhum popup — a página abriu no mesmo frame.")
-                # salvamos o HTML/screenshot do frame onde foi clicado (debug)
-                try:
-                    frame_link.screenshot(path="balancete_frame.png")
-                    open("balancete_frame.html", "w", encoding="utf-8").write(frame_link.content())
-                except:
-                    page.screenshot(path="balancete_page.png", full_page=True)
-                    open("balancete_page.html", "w", encoding="utf-8").write(page.content())
-                # page_to_extract fica como page (contendo frames)
-
-            # Agora: extração do balancete (procura tabela no contexto page_to_extract)
-            log("Iniciando extração da tabela do balancete (valor saldo)...")
-            df = capture_balancete_and_save(page_to_extract, out_prefix="balancete")
-            if df is None:
-                log("❌ Falha ao extrair tabela do balancete.")
-            else:
-                log("✅ Extração do balancete concluída com sucesso.")
+                scrape_balancete(page, cnpj, out_prefix="balancete")
+            except RuntimeError as e:
+                log(f"❌ {e}")
+                return
 
             log("Processo finalizado.")
             input("Pressione ENTER para fechar...")
@@ -372,10 +606,14 @@ def main_scrape(raw_cnpj):
             raise
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa o balancete de um fundo pelo navegador (Playwright).")
+    parser.add_argument("cnpj", nargs="?", default="32.811.422/0001-33")
+    args = parser.parse_args(argv)
+    main_scrape(args.cnpj)
+    return 0
+
+
 # Execução
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        value = sys.argv[1]
-    else:
-        value = "32.811.422/0001-33"
-    main_scrape(value)
+    main()
@@ -0,0 +1,472 @@
+# service.py
+# Modo serviço: um processo de longa duração que responde
+#   GET /balancete/{cnpj}?month=AAAA-MM    (month opcional = competência mais recente)
+# com o Balancete em JSON, lido da memória, do page_cache ou buscado na hora.
+#
+#   - memória: as últimas respostas montadas (LRU), em milissegundos;
+#   - page_cache: HTML já baixado (TTL do page_cache para a mais recente);
+#   - busca: sessões HTTP (CvmHttpClient) mantidas abertas e aquecidas (cookie
+#     de sessão e conexão TCP já estabelecidos) e, se o HTTP falhar, navegadores
+#     já abertos (browser_pool.ManagedBrowser, um por thread).
+# Pedidos iguais (mesmo CNPJ e competência) que chegam enquanto a busca está
+# em andamento esperam a mesma busca (single-flight), em vez de repeti-la.
+#
+#   GET /health     contadores do serviço e do pool de navegadores
+#   GET /metrics    métricas no formato do Prometheus (metrics.py)
+#   ?refresh=1      ignora memória e page_cache
+#
+# Uso:
+#   python service.py --port 8080 --cache-dir .cvm_cache --http-clients 4 --browsers 1
+#   python service.py --base-url http://127.0.0.1:8765 --browsers 0      (stub_server.py, só HTTP)
+#   curl "http://127.0.0.1:8080/balancete/32811422000133?month=2025-08"
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+import metrics
+from browser_pool import PoolStats, add_pool_args, pool_options_from_args
+from fund_index import DEFAULT_PATH as FUND_INDEX_PATH, FundIndex
+from http_fetch import BASE_URL, SEARCH_PATH, START_PATH, CvmHttpClient, FetchError, FundNotFound, decode_html
+from page_cache import DEFAULT_ROOT, PageCache
+from parse_html import competencia_from_html, list_competencias, normalize_competencia
+from row_stream import iter_html_rows
+from scraping import log, normalize_cnpj
+from throttle import TransientError, add_throttle_args, throttle_from_args
+
+DEFAULT_PORT = 8080
+DEFAULT_MEMORY_ITEMS = 512
+
+_STOP = object()
+
+
+class NotAvailable(LookupError):
+    """Competência que a página do Balancete do fundo não oferece."""
+
+
+# --------------------------
+# SINGLE-FLIGHT
+# --------------------------
+class SingleFlight:
+    """
+    Uma execução por chave: quem chega com a mesma chave enquanto fn() roda
+    espera o mesmo resultado (ou a mesma exceção). Seguro entre threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, fn):
+        """Retorna (valor, shared); shared=True quando aproveitou a execução de outra thread."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats["calls"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            return future.result(), True
+        try:
+            value = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+# --------------------------
+# SESSÕES HTTP AQUECIDAS
+# --------------------------
+class ClientPool:
+    """
+    `size` CvmHttpClient reaproveitados entre pedidos (o ASP.NET serializa as
+    requisições de uma sessão, então cada busca pega uma sessão só para si).
+    Sessão que falha é trocada por uma nova.
+    """
+
+    def __init__(self, size, base_url=BASE_URL, throttle=None, fund_index=None):
+        self.base_url = base_url
+        self._factory = lambda: CvmHttpClient(base_url, throttle=throttle, fund_index=fund_index)
+        self._idle = queue.LifoQueue()
+        self._clients = [self._factory() for _ in range(size)]
+        for client in self._clients:
+            self._idle.put(client)
+
+    def warm(self):
+        """GET da página de busca em cada sessão: cookie do ASP.NET e conexão prontos."""
+        for client in list(self._clients):
+            try:
+                client.get(self.base_url + SEARCH_PATH, step="search_frame")
+            except (requests.RequestException, TransientError) as e:
+                log(f"[service] sessão não aqueceu ({e}); segue fria")
+
+    @contextmanager
+    def client(self):
+        client = self._idle.get()
+        try:
+            yield client
+        except (requests.RequestException, TransientError):
+            # só erro de transporte troca a sessão; FetchError (fundo inexistente,
+            # página inesperada) não diz nada sobre ela
+            client.close()
+            self._clients.remove(client)
+            client = self._factory()
+            self._clients.append(client)
+            raise
+        finally:
+            self._idle.put(client)
+
+    def close(self):
+        for client in self._clients:
+            client.close()
+
+
+# --------------------------
+# NAVEGADORES AQUECIDOS
+# --------------------------
+class _FreshCache:
+    """page_cache que não devolve nada (refresh) mas continua gravando o HTML baixado."""
+
+    def __init__(self, page_cache):
+        self._page_cache = page_cache
+
+    def get(self, *args, **kwargs):
+        return None
+
+    def put_balancete(self, cnpj, html):
+        return self._page_cache.put_balancete(cnpj, html)
+
+
+class BrowserWorkers:
+    """
+    `count` threads, cada uma com o seu sync_playwright() e um ManagedBrowser
+    aberto desde a partida. fetch(cnpj) entrega o fundo a uma delas e espera:
+    o Balancete vai para o page_cache (e para out_dir/<cnpj>/balancete.{csv,json}).
+    """
+
+    def __init__(self, count, page_cache, start_url, out_dir="servico", fund_index=None, pool_options=None):
+        self.page_cache = page_cache
+        self.start_url = start_url
+        self.out_dir = out_dir
+        self.fund_index = fund_index
+        self.pool_options = pool_options or {}
+        self.stats = PoolStats()
+        self.queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._run, daemon=True, name=f"browser-{i}") for i in range(count)]
+        for t in self._threads:
+            t.start()
+
+    def fetch(self, cnpj, refresh=False, timeout=None):
+        future = Future()
+        self.queue.put((cnpj, refresh, future))
+        return future.result(timeout)
+
+    def _run(self):
+        from playwright.sync_api import sync_playwright
+
+        from browser_pool import ManagedBrowser
+        from scraping import scrape_balancete
+
+        try:
+            with sync_playwright() as p, ManagedBrowser(p, headless=True, stats=self.stats,
+                                                        **self.pool_options) as slot:
+                slot.warm()
+                while True:
+                    item = self.queue.get()
+                    if item is _STOP:
+                        return
+                    cnpj, refresh, future = item
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        os.makedirs(os.path.join(self.out_dir, cnpj), exist_ok=True)
+                        with metrics.tagged(cnpj), slot.page() as page:
+                            df = scrape_balancete(page, cnpj, out_prefix=os.path.join(self.out_dir, cnpj, "balancete"),
+                                                  url=self.start_url, fund_index=self.fund_index,
+                                                  page_cache=_FreshCache(self.page_cache) if refresh else self.page_cache)
+                        future.set_result(df)
+                    except BaseException as e:
+                        future.set_exception(e)
+        except Exception as e:
+            # navegador não abriu: quem estiver esperando (ou chegar depois) recebe o erro
+            log(f"❌ [service] navegador indisponível: {type(e).__name__}: {e}")
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    return
+                item[2].set_exception(RuntimeError(f"navegador indisponível: {e}"))
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join(timeout=30)
+
+
+# --------------------------
+# SERVIÇO
+# --------------------------
+class BalanceteService:
+    """
+    Respostas do Balancete por (cnpj, competência): memória -> page_cache ->
+    busca (HTTP aquecido; navegador se o HTTP falhar e houver `browsers`).
+    A busca da competência mais recente pelo navegador é a única que ele faz;
+    meses específicos só vão por HTTP (postback do ddCOMPTC).
+    """
+
+    def __init__(self, page_cache, base_url=BASE_URL, http_clients=4, browsers=1, throttle=None, fund_index=None,
+                 pool_options=None, out_dir="servico", memory_items=DEFAULT_MEMORY_ITEMS):
+        self.page_cache = page_cache
+        self.clients = ClientPool(http_clients, base_url, throttle=throttle, fund_index=fund_index)
+        self.browsers = BrowserWorkers(browsers, page_cache, base_url + START_PATH, out_dir, fund_index,
+                                       pool_options) if browsers else None
+        self.flight = SingleFlight()
+        self.memory_items = memory_items
+        self._memory = OrderedDict()   # (cnpj, competência) -> (payload, guardado em)
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(("requests", "memory", "page_cache", "http", "browser", "errors"), 0)
+
+    def warm(self):
+        self.clients.warm()
+        return self
+
+    def close(self):
+        if self.browsers is not None:
+            self.browsers.close()
+        self.clients.close()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    # ---- memória ----
+    def _remembered(self, key):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            payload, stored_at = item
+            # a mais recente ("") vence junto com o TTL do page_cache; meses fechados não mudam
+            if key[1] == "" and time.time() - stored_at > self.page_cache.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return payload
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._memory[key] = (payload, time.time())
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # ---- consulta ----
+    def balancete(self, cnpj, month="", refresh=False):
+        """
+        Retorna (payload, origem, shared). origem: memory | page_cache | http | browser.
+        Levanta ValueError (CNPJ/mês inválido), NotAvailable, FundNotFound ou o erro da busca.
+        """
+        cnpj = normalize_cnpj(cnpj)
+        month = normalize_competencia(month) if month else ""
+        key = (cnpj, month)
+        self._count("requests")
+        if not refresh:
+            payload = self._remembered(key)
+            if payload is not None:
+                self._count("memory")
+                metrics.count("service_memory_hits")
+                return payload, "memory", False
+            with metrics.step("page_cache"):
+                html = self.page_cache.get(cnpj, month, "balancete")
+            if html is not None:
+                payload = self._payload(cnpj, html)
+                self._remember(key, payload)
+                self._count("page_cache")
+                metrics.count("page_cache_hits")
+                return payload, "page_cache", False
+        try:
+            (payload, source), shared = self.flight.do(key, lambda: self._fetch(cnpj, month, refresh))
+        except Exception:
+            self._count("errors")
+            raise
+        return payload, source, shared
+
+    def _fetch(self, cnpj, month, refresh):
+        with metrics.tagged(cnpj), metrics.step("service_fetch"):
+            try:
+                html = self._fetch_http(cnpj, month)
+                source = "http"
+            except FundNotFound:
+                raise   # o navegador também não acharia o fundo
+            except (requests.RequestException, FetchError, TransientError) as e:
+                if self.browsers is None or month:
+                    raise
+                log(f"[service] {cnpj}: HTTP falhou ({e}); usando o navegador...")
+                self.browsers.fetch(cnpj, refresh)
+                html = self.page_cache.get(cnpj, "", "balancete", max_age=float("inf"))
+                if html is None:
+                    raise FetchError(f"navegador não gravou o Balancete de {cnpj} no page_cache")
+                source = "browser"
+            payload = self._payload(cnpj, html)
+        self._remember((cnpj, month), payload)
+        if month == "" and payload["competencia"]:
+            self._remember((cnpj, payload["competencia"]), payload)
+        self._count(source)
+        return payload, source
+
+    def _fetch_http(self, cnpj, month):
+        with self.clients.client() as client:
+            balancete = client.open_fund_balancete(cnpj)
+            html = decode_html(balancete)
+            if month and competencia_from_html(html) != month:
+                values = [value for value, competencia in list_competencias(html) if competencia == month]
+                if not values:
+                    raise NotAvailable(f"competência {month} não disponível para {cnpj}")
+                html = decode_html(client.open_competencia(balancete, values[0]))
+                shown = competencia_from_html(html)
+                if shown and shown != month:
+                    raise FetchError(f"pedida a competência {month}, a página mostra {shown}")
+        if month:
+            self.page_cache.put(cnpj, month, "balancete", html)
+        else:
+            self.page_cache.put_balancete(cnpj, html)
+        return html
+
+    def _payload(self, cnpj, html):
+        rows = list(iter_html_rows(html, cnpj=cnpj))
+        if not rows:
+            raise FetchError("Página do Balancete sem tabela")
+        metrics.count("rows_extracted", len(rows))
+        first = rows[0]
+        return {
+            "cnpj": first.cnpj,
+            "competencia": first.competencia,
+            "cod_cvm": first.cod_cvm,
+            "rows": [{"conta": r.conta, "descricao": r.descricao, "valor_text": r.valor_text, "valor": r.valor}
+                     for r in rows],
+        }
+
+    def health(self):
+        with self._lock:
+            out = {"counts": dict(self.counts), "memory_items": len(self._memory)}
+        out["single_flight"] = dict(self.flight.stats)
+        out["page_cache"] = self.page_cache.stats()
+        if self.browsers is not None:
+            out["browser_pool"] = self.browsers.stats.snapshot()
+        return out
+
+
+# --------------------------
+# HTTP
+# --------------------------
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """ThreadingHTTPServer com as rotas do serviço (uma thread por conexão)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json; charset=utf-8"):
+            if not isinstance(body, bytes):
+                body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts == ["health"]:
+                return self._send(200, service.health())
+            if parts == ["metrics"]:
+                return self._send(200, metrics.METRICS.prometheus().encode("utf-8"),
+                                  "text/plain; version=0.0.4; charset=utf-8")
+            if len(parts) != 2 or parts[0] != "balancete":
+                return self._send(404, {"error": "use GET /balancete/{cnpj}?month=AAAA-MM"})
+
+            query = parse_qs(url.query)
+            month = query.get("month", [""])[0]
+            refresh = query.get("refresh", ["0"])[0] not in ("", "0", "false")
+            try:
+                cnpj = normalize_cnpj(parts[1])
+                month = normalize_competencia(month) if month else ""
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            started = time.perf_counter()
+            try:
+                payload, source, shared = service.balancete(cnpj, month, refresh=refresh)
+            except (NotAvailable, FundNotFound) as e:
+                return self._send(404, {"error": str(e)})
+            except Exception as e:
+                log(f"❌ [service] {parts[1]} {month}: {type(e).__name__}: {e}")
+                return self._send(502, {"error": f"{type(e).__name__}: {e}"})
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._send(200, {**payload, "source": source, "shared": shared, "elapsed_ms": elapsed_ms})
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP do Balancete (cache + sessões/navegadores aquecidos).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--base-url", default=BASE_URL, help="ex.: http://127.0.0.1:8765 para o stub_server.py")
+    parser.add_argument("--cache-dir", default=DEFAULT_ROOT, help="diretório do page_cache")
+    parser.add_argument("--http-clients", type=int, default=4, metavar="N", help="sessões HTTP mantidas abertas")
+    parser.add_argument("--browsers", type=int, default=1, metavar="N",
+                        help="navegadores abertos para quando o HTTP falhar (0 = só HTTP)")
+    parser.add_argument("--out-dir", default="servico", help="onde o fluxo do navegador grava CSV/JSON")
+    parser.add_argument("--memory-items", type=int, default=DEFAULT_MEMORY_ITEMS,
+                        help="respostas guardadas em memória (LRU)")
+    parser.add_argument("--fund-index", nargs="?", const=FUND_INDEX_PATH, default=None, metavar="DB",
+                        help="índice local CNPJ -> fundo (fund_index): pula a busca para fundos já vistos")
+    add_throttle_args(parser)
+    add_pool_args(parser)
+    args = parser.parse_args(argv)
+
+    service = BalanceteService(
+        PageCache(args.cache_dir), base_url=args.base_url, http_clients=args.http_clients, browsers=args.browsers,
+        throttle=throttle_from_args(args, concurrency=args.http_clients),
+        fund_index=FundIndex(args.fund_index) if args.fund_index else None,
+        pool_options=pool_options_from_args(args), out_dir=args.out_dir, memory_items=args.memory_items,
+    ).warm()
+    server = make_server(service, args.host, args.port)
+    log(f"Serviço em http://{args.host}:{args.port}/balancete/{{cnpj}}?month=AAAA-MM "
+        f"({args.http_clients} sessões HTTP, {args.browsers} navegadores)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("Encerrando...")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
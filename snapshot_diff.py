@@ -0,0 +1,173 @@
+# snapshot_diff.py
+# Detecta o que mudou entre a extração nova de um fundo e a última guardada
+# para o mesmo CNPJ. Cada conta vira um hash curto (descrição + valor como
+# aparece na página), chaveado pelo código; o snapshot inteiro tem um digest
+# (hash dos hashes em ordem de conta). A comparação devolve só as contas
+# incluídas, removidas e alteradas.
+#
+# Os hashes ficam num SQLite (um snapshot por CNPJ, o mais recente). Se o
+# digest e a competência são os mesmos da última vez, o snapshot não mudou e o
+# pipeline pode pular a gravação (CSV/JSON/Parquet) e o reprocessamento.
+#
+# Uso:
+#   snapshots = SnapshotStore(".cvm_snapshots.sqlite")
+#   delta = snapshots.update("32811422000133", df, competencia="2025-09")
+#   if delta.unchanged: ...
+#   delta.changed -> [(conta, valor_antigo, valor_novo), ...]
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get("CVM_SNAPSHOTS", ".cvm_snapshots.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    cnpj        TEXT PRIMARY KEY,
+    competencia TEXT,
+    digest      TEXT NOT NULL,
+    rows        INTEGER NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    cnpj       TEXT NOT NULL,
+    conta      TEXT NOT NULL,
+    hash       TEXT NOT NULL,
+    valor_text TEXT,
+    PRIMARY KEY (cnpj, conta)
+);
+"""
+
+
+def _is_conta(text):
+    text = str(text).strip()
+    return len(text) == 8 and text.isdigit()
+
+
+def row_hash(descricao, valor_text):
+    data = f"{descricao}\x1f{valor_text}".encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def account_hashes(df):
+    """
+    {conta: (hash, valor_text)} das linhas de conta do DataFrame dos extratores
+    (conta/descricao/valor_text); linhas de cabeçalho ficam de fora.
+    """
+    out = {}
+    for conta, descricao, valor_text in df[["conta", "descricao", "valor_text"]].astype(str).itertuples(index=False):
+        conta = conta.strip()
+        if _is_conta(conta):
+            out[conta] = (row_hash(descricao, valor_text), valor_text)
+    return out
+
+
+def snapshot_digest(hashes):
+    h = hashlib.blake2b(digest_size=16)
+    for conta in sorted(hashes):
+        h.update(f"{conta}:{hashes[conta][0]};".encode("ascii"))
+    return h.hexdigest()
+
+
+class SnapshotDiff:
+    """Diferença entre dois snapshots de um CNPJ."""
+
+    __slots__ = ("cnpj", "competencia", "previous_competencia", "digest", "first", "added", "removed", "changed")
+
+    def __init__(self, cnpj, competencia, previous_competencia, digest, first, added, removed, changed):
+        self.cnpj = cnpj
+        self.competencia = competencia
+        self.previous_competencia = previous_competencia
+        self.digest = digest
+        self.first = first        # não havia snapshot anterior
+        self.added = added        # [(conta, valor_text)]
+        self.removed = removed    # [(conta, valor_text_antigo)]
+        self.changed = changed    # [(conta, valor_text_antigo, valor_text_novo)]
+
+    @property
+    def unchanged(self):
+        return (not self.first and not (self.added or self.removed or self.changed)
+                and self.competencia == self.previous_competencia)
+
+    def summary(self):
+        if self.first:
+            return f"{self.cnpj}: primeiro snapshot ({len(self.added)} contas)"
+        if self.unchanged:
+            return f"{self.cnpj}: sem mudanças desde a última extração"
+        return (f"{self.cnpj} {self.previous_competencia or '?'} -> {self.competencia or '?'}: "
+                f"{len(self.added)} incluídas, {len(self.removed)} removidas, {len(self.changed)} alteradas")
+
+    def as_dict(self):
+        return {
+            "cnpj": self.cnpj,
+            "competencia": self.competencia,
+            "previous_competencia": self.previous_competencia,
+            "digest": self.digest,
+            "first": self.first,
+            "added": [{"conta": c, "valor_text": v} for c, v in self.added],
+            "removed": [{"conta": c, "valor_text": v} for c, v in self.removed],
+            "changed": [{"conta": c, "antes": a, "depois": d} for c, a, d in self.changed],
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.as_dict(), fh, ensure_ascii=False, indent=2)
+
+
+class SnapshotStore:
+    """Último snapshot (hashes por conta) de cada CNPJ, em SQLite. Seguro entre threads."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def compare(self, cnpj, df, competencia=None):
+        """SnapshotDiff da extração `df` contra o último snapshot do CNPJ (sem gravar)."""
+        return self._compare(cnpj, account_hashes(df), competencia)
+
+    def _compare(self, cnpj, new, competencia):
+        digest = snapshot_digest(new)
+        with self._lock:
+            head = self._db.execute("SELECT competencia, digest FROM snapshots WHERE cnpj=?", (cnpj,)).fetchone()
+            if head is None:
+                return SnapshotDiff(cnpj, competencia, None, digest, True,
+                                    sorted((c, v) for c, (_, v) in new.items()), [], [])
+            previous_competencia, old_digest = head
+            if old_digest == digest:
+                return SnapshotDiff(cnpj, competencia, previous_competencia, digest, False, [], [], [])
+            old = {c: (h, v) for c, h, v in self._db.execute(
+                "SELECT conta, hash, valor_text FROM accounts WHERE cnpj=?", (cnpj,))}
+
+        added = sorted((c, v) for c, (_, v) in new.items() if c not in old)
+        removed = sorted((c, v) for c, (_, v) in old.items() if c not in new)
+        changed = sorted((c, old[c][1], v) for c, (h, v) in new.items() if c in old and old[c][0] != h)
+        return SnapshotDiff(cnpj, competencia, previous_competencia, digest, False, added, removed, changed)
+
+    def update(self, cnpj, df, competencia=None):
+        """Compara com o último snapshot e passa a guardar este. Retorna o SnapshotDiff."""
+        new = account_hashes(df)
+        diff = self._compare(cnpj, new, competencia)
+        if diff.unchanged:
+            return diff
+        with self._lock:
+            db = self._db
+            if diff.first or diff.removed:
+                db.execute("DELETE FROM accounts WHERE cnpj=?", (cnpj,))
+                rows = new.items()
+            else:
+                rows = [(c, new[c]) for c, *_ in diff.added + diff.changed]
+            db.executemany("INSERT OR REPLACE INTO accounts (cnpj, conta, hash, valor_text) VALUES (?, ?, ?, ?)",
+                           [(cnpj, c, h, v) for c, (h, v) in rows])
+            db.execute("INSERT OR REPLACE INTO snapshots (cnpj, competencia, digest, rows, updated_at) "
+                       "VALUES (?, ?, ?, ?, ?)", (cnpj, competencia, diff.digest, len(new), time.time()))
+            db.commit()
+        return diff
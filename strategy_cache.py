@@ -0,0 +1,111 @@
+# strategy_cache.py
+# Cache em disco dos "caminhos vencedores" de cada busca no DOM: em qual frame
+# (nome + página) e com qual seletor o link do Balancete ou a tabela foram
+# achados, ex.: {"frame_name": "Main", "url_fragment": "ResultConsultaParticFdo.aspx",
+# "selector": "#Hyperlink5"}. As próximas execuções testam esses caminhos
+# primeiro (uma consulta) e só fazem a busca completa quando nenhum serve.
+#
+# O cache só guarda dados; quem consulta o DOM é o chamador (sync ou async),
+# via candidates() -> (frame, seletor).
+
+import atexit
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATH = os.environ.get("CVM_STRATEGY_CACHE", ".cvm_strategies.json")
+
+# intervalo mínimo entre gravações quando só os contadores mudaram (s)
+SAVE_INTERVAL = 30
+
+
+def url_fragment(url):
+    """Último segmento do path da URL (sem query): 'CPublicaBalancete.aspx'."""
+    path = urlsplit(url or "").path.rstrip("/")
+    return path.rsplit("/", 1)[-1]
+
+
+class StrategyCache:
+    """
+    Mapeia etapa -> lista de caminhos {frame_name, url_fragment, selector, hits, last}.
+    Thread-safe; grava em JSON (escrita atômica) quando aparece um caminho novo
+    e, para contadores, no máximo a cada SAVE_INTERVAL segundos e na saída.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self.data = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    self.data = json.load(fh)
+            except (OSError, ValueError):
+                self.data = {}
+        atexit.register(self.save)
+
+    @classmethod
+    def shared(cls, path=DEFAULT_PATH):
+        """Instância única por arquivo (para várias threads do mesmo processo)."""
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path)
+            return cls._shared[path]
+
+    def entries(self, step):
+        with self._lock:
+            return sorted(self.data.get(step, []), key=lambda e: -e["hits"])
+
+    def candidates(self, page, step):
+        """
+        (frame, seletor) a testar, do caminho mais usado ao menos usado.
+        Só considera frames com o mesmo nome e a mesma página do caminho gravado.
+        """
+        frames = page.frames
+        for entry in self.entries(step):
+            for f in frames:
+                if entry["frame_name"] and f.name != entry["frame_name"]:
+                    continue
+                if entry["url_fragment"] and entry["url_fragment"].lower() not in (f.url or "").lower():
+                    continue
+                yield f, entry["selector"]
+
+    def record(self, step, frame, selector):
+        """Registra que `selector` funcionou em `frame` nesta etapa."""
+        name, fragment = frame.name or "", url_fragment(frame.url)
+        with self._lock:
+            entries = self.data.setdefault(step, [])
+            for entry in entries:
+                if (entry["frame_name"], entry["url_fragment"], entry["selector"]) == (name, fragment, selector):
+                    entry["hits"] += 1
+                    entry["last"] = time.time()
+                    self._dirty = True
+                    new = False
+                    break
+            else:
+                entries.append({"frame_name": name, "url_fragment": fragment, "selector": selector,
+                                "hits": 1, "last": time.time()})
+                self._dirty = True
+                new = True
+        if new or time.monotonic() - self._last_save > SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self.data, fh, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
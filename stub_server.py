@@ -0,0 +1,359 @@
+# stub_server.py
+# Servidor HTTP local que imita o cvmweb.cvm.gov.br com páginas gravadas em
+# fixtures/: frameset (default.asp), busca (FormBuscaParticFdo.aspx), lista de
+# fundos (ResultBuscaParticFdo.aspx), página do fundo e Balancete.
+# Reproduz o que o fetcher HTTP e o Playwright precisam: cookie de sessão,
+# __VIEWSTATE/__EVENTVALIDATION nas postbacks e redirects após cada postback.
+#
+# Para testar limiter/retry (throttle.py), o stub também injeta latência e
+# falhas: --latency/--jitter atrasam cada resposta, --error-rate devolve 503
+# numa fração das requisições e --max-inflight devolve 429 (com Retry-After)
+# quando há mais requisições simultâneas que isso.
+#
+# Uso:
+#   python stub_server.py --port 8765
+#   python stub_server.py --latency 0.2 --jitter 0.1 --error-rate 0.05 --max-inflight 4
+#   (depois: http_fetch.py --base-url http://127.0.0.1:8765 32811422000133)
+
+import argparse
+import csv
+import html
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CCONSOL = "/SWB/Sistemas/SCW/CPublica/CConsolFdo/"
+BALANCETE = "/SWB/Sistemas/SCW/CPublica/Balancete/"
+SELECTED = ' selected="selected"'
+
+
+def viewstate_for(page):
+    """Token fixo por página: basta para conferir que o cliente devolveu o que recebeu."""
+    return "VS-" + page
+
+
+def eventvalidation_for(page):
+    return "EV-" + page
+
+
+class Faults:
+    """
+    Latência e erros injetados pelo stub. Seguro entre threads.
+    latency/jitter em s; error_rate em [0, 1]; max_inflight 0 = sem limite.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, max_inflight=0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.inflight = 0
+        self.counts = {"requests": 0, "errors": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Conta a requisição e decide a falha: None, 429 ou 503 (depois de esperar a latência)."""
+        with self._lock:
+            self.inflight += 1
+            self.counts["requests"] += 1
+            over = self.max_inflight and self.inflight > self.max_inflight
+            error = self.random.random() < self.error_rate
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if over:
+            with self._lock:
+                self.counts["throttled"] += 1
+            return 429
+        time.sleep(delay)
+        if error:
+            with self._lock:
+                self.counts["errors"] += 1
+            return 503
+        return None
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+
+class StubCvm:
+    """Dados e páginas do stub (sem nada de rede: o handler só chama render/post)."""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, faults=None):
+        self.fixtures_dir = fixtures_dir
+        self.faults = faults or Faults()
+        with open(os.path.join(fixtures_dir, "funds.json"), encoding="utf-8") as fh:
+            self.funds = json.load(fh)
+        self.by_pk = {c["pk_partic"]: c for classes in self.funds.values() for c in classes}
+        self.sessions = set()
+        self._templates = {}
+
+    def template(self, name):
+        if name not in self._templates:
+            with open(os.path.join(self.fixtures_dir, name), encoding="utf-8") as fh:
+                self._templates[name] = Template(fh.read())
+        return self._templates[name]
+
+    def new_session(self):
+        sid = uuid.uuid4().hex
+        self.sessions.add(sid)
+        return sid
+
+    # --------------------------
+    # PÁGINAS
+    # --------------------------
+    def render_form(self, mensagem=""):
+        return self.template("FormBuscaParticFdo.aspx.html").substitute(
+            viewstate=viewstate_for("busca"),
+            eventvalidation=eventvalidation_for("busca"),
+            mensagem=html.escape(mensagem),
+        )
+
+    def render_results(self, cnpj):
+        linhas = []
+        for i, c in enumerate(self.funds.get(cnpj, [])):
+            target = f"ddlFundos$_ctl{i + 2}$Linkbutton4"
+            linhas.append(
+                f"<tr><td>{html.escape(c['cnpj'])}</td>"
+                f"<td><a id=\"ddlFundos__ctl{i + 2}_Linkbutton4\" href=\"javascript:__doPostBack('{target}','')\">"
+                f"{html.escape(c['nome'])}</a></td>"
+                f"<td>{html.escape(c['tipo'])}</td><td>{html.escape(c['cod_cvm'])}</td></tr>"
+            )
+        return self.template("ResultBuscaParticFdo.aspx.html").substitute(
+            cnpj=cnpj,
+            viewstate=viewstate_for("resultado"),
+            eventvalidation=eventvalidation_for("resultado"),
+            linhas="\n".join(linhas),
+        )
+
+    def render_fund(self, pk_partic):
+        c = self.by_pk[pk_partic]
+        return self.template("ResultConsultaParticFdo.aspx.html").substitute(
+            pk_partic=pk_partic, nome=html.escape(c["nome"])
+        )
+
+    def render_balancete(self, pk_partic, competencia=None):
+        c = self.by_pk[pk_partic]
+        meses = list(c["competencias"])
+        competencia = competencia if competencia in c["competencias"] else meses[0]
+        options = "\n".join(
+            f'<option{SELECTED if m == competencia else ""} value="{m}">{m}</option>' for m in meses
+        )
+        with open(os.path.join(self.fixtures_dir, c["competencias"][competencia]), encoding="utf-8") as fh:
+            contas = list(csv.DictReader(fh))
+        linhas = "\n".join(
+            f"<tr>\n<td>{html.escape(r['conta'])}</td>\n<td>{html.escape(r['descricao'])}</td>\n"
+            f"<td align=\"right\">{html.escape(r['valor_text'])}</td>\n</tr>"
+            for r in contas
+        )
+        return self.template("CPublicaBalancete.aspx.html").substitute(
+            pk_partic=pk_partic,
+            viewstate=viewstate_for("balancete"),
+            eventvalidation=eventvalidation_for("balancete"),
+            competencias=options,
+            nome=html.escape(c["nome"]),
+            cnpj=html.escape(c["cnpj"]),
+            tipo=html.escape(c["tipo"]),
+            cod_cvm=html.escape(c["cod_cvm"]),
+            linhas=linhas,
+        )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    stub = None  # StubCvm, definido por make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    # --------------------------
+    # RESPOSTAS
+    # --------------------------
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _redirect(self, location):
+        self._send(302, "", headers={"Location": location})
+
+    def _session_ok(self):
+        m = re.search(r"ASP\.NET_SessionId=(\w+)", self.headers.get("Cookie", ""))
+        return bool(m and m.group(1) in self.stub.sessions)
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = parse_qs(self.rfile.read(length).decode("utf-8"), keep_blank_values=True)
+        return {k: v[0] for k, v in data.items()}
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        path = re.sub(r"/{2,}", "/", parts.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        return path, query
+
+    def _base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def _with_faults(self, handler):
+        faults = self.stub.faults
+        status = faults.enter()
+        try:
+            if status == 429:
+                return self._send(429, "<html><body>Too Many Requests</body></html>",
+                                  headers={"Retry-After": str(faults.retry_after)})
+            if status == 503:
+                return self._send(503, "<html><body>Service Unavailable</body></html>")
+            return handler()
+        finally:
+            faults.leave()
+
+    # --------------------------
+    # GET
+    # --------------------------
+    def do_GET(self):
+        return self._with_faults(self._get)
+
+    def _get(self):
+        path, query = self._route()
+        s = self.stub
+
+        if path == "/SWB/default.asp":
+            return self._send(200, s.template("default.asp.html").substitute(base=self._base()))
+        if path in ("/SWB/header-cvmweb.asp", "/SWB/footer.asp"):
+            return self._send(200, s.template(path.rsplit("/", 1)[1] + ".html").template)
+        if path == "/SWB/estilo.css":
+            return self._send(200, "body { font-family: Verdana; }", content_type="text/css")
+        if path == "/SWB/logo-cvm.gif":
+            return self._send(200, b"GIF89a\x01\x00\x01\x00\x00\x00\x00;", content_type="image/gif")
+
+        if path == CCONSOL + "FormBuscaParticFdo.aspx":
+            sid = s.new_session()
+            return self._send(200, s.render_form(),
+                              headers={"Set-Cookie": f"ASP.NET_SessionId={sid}; path=/; HttpOnly"})
+        if path == CCONSOL + "ResultBuscaParticFdo.aspx" and self._session_ok():
+            return self._send(200, s.render_results(query.get("CNPJNome", "")))
+        if path == CCONSOL + "ResultConsultaParticFdo.aspx" and query.get("PK_PARTIC") in s.by_pk:
+            return self._send(200, s.render_fund(query["PK_PARTIC"]))
+        if path == BALANCETE + "CPublicaBalancete.aspx" and query.get("PK_PARTIC") in s.by_pk:
+            return self._send(200, s.render_balancete(query["PK_PARTIC"]))
+
+        return self._send(404, "<html><body>Not Found</body></html>")
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    # --------------------------
+    # POST (postbacks ASP.NET)
+    # --------------------------
+    def do_POST(self):
+        return self._with_faults(self._post)
+
+    def _post(self):
+        path, query = self._route()
+        form = self._form()
+        s = self.stub
+
+        if not self._session_ok():
+            return self._send(500, "<html><body>Sessão expirada</body></html>")
+
+        if path == CCONSOL + "FormBuscaParticFdo.aspx":
+            if form.get("__VIEWSTATE") != viewstate_for("busca") or form.get("__EVENTVALIDATION") != eventvalidation_for("busca"):
+                return self._send(500, "<html><body>Validation of viewstate MAC failed.</body></html>")
+            cnpj = "".join(c for c in form.get("txtCNPJNome", "") if c.isdigit())
+            if cnpj not in s.funds:
+                return self._send(200, s.render_form(mensagem="Nenhum fundo encontrado."))
+            return self._redirect(f"ResultBuscaParticFdo.aspx?CNPJNome={cnpj}&TpPartic=0&Adm=false&SemFrame=")
+
+        if path == CCONSOL + "ResultBuscaParticFdo.aspx":
+            if form.get("__VIEWSTATE") != viewstate_for("resultado"):
+                return self._send(500, "<html><body>Validation of viewstate MAC failed.</body></html>")
+            m = re.match(r"ddlFundos\$_ctl(\d+)\$Linkbutton4$", form.get("__EVENTTARGET", ""))
+            classes = s.funds.get(query.get("CNPJNome", ""), [])
+            if not m or not 0 <= int(m.group(1)) - 2 < len(classes):
+                return self._send(500, "<html><body>Invalid postback or callback argument.</body></html>")
+            pk = classes[int(m.group(1)) - 2]["pk_partic"]
+            return self._redirect(f"ResultConsultaParticFdo.aspx?PK_PARTIC={pk}&SemFrame=")
+
+        if path == BALANCETE + "CPublicaBalancete.aspx" and query.get("PK_PARTIC") in s.by_pk:
+            if form.get("__VIEWSTATE") != viewstate_for("balancete"):
+                return self._send(500, "<html><body>Validation of viewstate MAC failed.</body></html>")
+            return self._send(200, s.render_balancete(query["PK_PARTIC"], form.get("ddCOMPTC")))
+
+        return self._send(404, "<html><body>Not Found</body></html>")
+
+
+def make_server(host="127.0.0.1", port=0, fixtures_dir=FIXTURES_DIR, faults=None):
+    """
+    Cria o servidor (porta 0 = porta livre). Use server.server_address para a porta.
+    faults: Faults com latência/erros a injetar (server.stub.faults.counts traz as contagens).
+    """
+    stub = StubCvm(fixtures_dir, faults)
+    handler = type("BoundStubHandler", (StubHandler,), {"stub": stub})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.stub = stub
+    return server
+
+
+class running_stub:
+    """
+    Context manager que sobe o stub numa thread e devolve a URL base:
+
+        with running_stub() as base_url:
+            html = CvmHttpClient(base_url).fetch_balancete_html("32811422000133")
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, fixtures_dir=FIXTURES_DIR, faults=None):
+        self.server = make_server(host, port, fixtures_dir, faults)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub local do cvmweb.cvm.gov.br com páginas gravadas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="atraso fixo de cada resposta (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="atraso extra aleatório, entre 0 e isto (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das requisições que recebe 503")
+    parser.add_argument("--max-inflight", type=int, default=0,
+                        help="acima destas requisições simultâneas, responde 429 com Retry-After")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.max_inflight, seed=args.seed)
+    server = make_server(args.host, args.port, args.fixtures, faults)
+    print(f"[LOG] Stub CVM em http://{args.host}:{args.port}/SWB/default.asp?sg_sistema=fundosreg")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+# throttle.py
+# Controle de ritmo das requisições ao cvmweb.cvm.gov.br, compartilhado entre
+# threads (batch.py, history.py, http_fetch.py):
+#
+#   TokenBucket      no máximo `rate` requisições/s, com rajadas de até `burst`
+#   AdaptiveLimiter  rate e concorrência ajustados por AIMD: resposta lenta
+#                    ou 429 cortam pela metade, erro 5xx/timeout recua um
+#                    pouco; respostas rápidas sobem aos poucos (+step req/s, +1 slot)
+#   RetryPolicy      novas tentativas por etapa com espera exponencial e
+#                    jitter ("full jitter": uniforme entre 0 e base * 2^n);
+#                    respeita Retry-After
+#
+# Throttle junta os três: throttle.call("search", fn, ...) espera um slot e um
+# token, chama fn, informa a latência ao limiter e repete se a falha for
+# transitória.
+#
+# Uso:
+#   throttle = Throttle.shared()                       # um por processo
+#   resp = throttle.call("get", session.get, url, timeout=30)
+#   python stub_server.py --latency 0.2 --error-rate 0.1 --max-inflight 4
+#   python batch.py cnpjs.txt --rate 2 --max-concurrency 8
+
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import metrics
+
+DEFAULT_RATE = 2.0            # req/s iniciais
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_MAX_RATE = 20.0
+DEFAULT_TARGET_LATENCY = 2.0  # s; acima disso a resposta conta como "lenta"
+
+# status HTTP que valem nova tentativa (e recuo do limiter)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TransientError(RuntimeError):
+    """Falha que vale repetir (servidor sobrecarregado, timeout...)."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        try:
+            self.retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:  # Retry-After com data HTTP: usa a espera normal
+            self.retry_after = None
+
+
+def _retry_after(resp):
+    value = (resp.headers.get("Retry-After") or "").strip()
+    return float(value) if value.replace(".", "", 1).isdigit() else None
+
+
+def _requests():
+    """
+    O módulo requests, se algum chamador já o importou; senão None (e nenhuma
+    exceção/resposta pode ser dele). Assim o fluxo do navegador não importa requests.
+    """
+    return sys.modules.get("requests")
+
+
+def _error_info(exc):
+    """(status HTTP, Retry-After) de uma exceção, quando houver."""
+    if isinstance(exc, TransientError):
+        return exc.status, exc.retry_after
+    resp = getattr(exc, "response", None)
+    requests = _requests()
+    if requests is not None and isinstance(exc, requests.HTTPError) and resp is not None:
+        return resp.status_code, _retry_after(resp)
+    return None, None
+
+
+def is_transient(exc):
+    """True para erros de rede/timeout, HTTP 429/5xx, timeouts do Playwright e TransientError."""
+    if isinstance(exc, TransientError):
+        return True
+    requests = _requests()
+    if requests is not None and isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if requests is not None and isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRY_STATUS
+    return type(exc).__name__ == "TimeoutError" and type(exc).__module__.startswith("playwright")
+
+
+# --------------------------
+# TOKEN BUCKET
+# --------------------------
+class TokenBucket:
+    """Balde de tokens: `rate` tokens/s, capacidade `burst`. Seguro entre threads."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1.0):
+        """Bloqueia até haver `tokens`. Retorna o tempo esperado (s)."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# --------------------------
+# LIMITER ADAPTATIVO
+# --------------------------
+class AdaptiveLimiter:
+    """
+    Rate (TokenBucket) e concorrência (slots) ajustados pela resposta do servidor.
+
+    Depois de cada requisição, done(latency, ok, throttled):
+      - 429 ou latência > target_latency: rate e slots caem pela metade;
+      - outro erro (5xx, timeout): rate x 0.75 e um slot a menos;
+        (recuos no máximo uma vez a cada `cooldown` s, para uma rajada de
+        erros não zerar tudo de uma vez)
+      - sucesso abaixo da latência alvo: rate += step; a cada `window`
+        sucessos seguidos, +1 slot.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 concurrency=4, min_concurrency=1, max_concurrency=16, target_latency=DEFAULT_TARGET_LATENCY,
+                 step=0.25, window=10, cooldown=2.0):
+        self.bucket = TokenBucket(rate, burst=max(1.0, concurrency))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.step = step
+        self.window = window
+        self.cooldown = cooldown
+        self._inflight = 0
+        self._streak = 0
+        self._last_backoff = 0.0
+        self._cond = threading.Condition()
+        self.stats = {"requests": 0, "errors": 0, "slow": 0, "throttled": 0, "backoffs": 0, "waited": 0.0}
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        """Espera um slot de concorrência e um token. Retorna o tempo esperado (s)."""
+        started = time.monotonic()
+        with self._cond:
+            while self._inflight >= self.concurrency:
+                self._cond.wait()
+            self._inflight += 1
+        self.bucket.acquire()
+        waited = time.monotonic() - started
+        with self._cond:
+            self.stats["waited"] += waited
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify()
+
+    def done(self, latency, ok=True, throttled=False):
+        """Informa o resultado de uma requisição e ajusta rate/concorrência."""
+        with self._cond:
+            self.stats["requests"] += 1
+            slow = ok and latency > self.target_latency
+            if ok and not slow:
+                self._streak += 1
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.step))
+                if self._streak % self.window == 0 and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._cond.notify()
+                return
+            self.stats["errors" if not ok else "slow"] += 1
+            self.stats["throttled"] += bool(throttled)
+            self._streak = 0
+            now = time.monotonic()
+            if now - self._last_backoff < self.cooldown:
+                return
+            self._last_backoff = now
+            self.stats["backoffs"] += 1
+            if throttled or slow:  # sinal claro de sobrecarga: corta pela metade
+                self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            else:                  # erro avulso (5xx, timeout): recuo mais leve
+                self.bucket.set_rate(max(self.min_rate, self.bucket.rate * 0.75))
+                self.concurrency = max(self.min_concurrency, self.concurrency - 1)
+
+    def snapshot(self):
+        with self._cond:
+            return {"rate": round(self.bucket.rate, 3), "concurrency": self.concurrency,
+                    "inflight": self._inflight, **{k: round(v, 3) for k, v in self.stats.items()}}
+
+
+# --------------------------
+# RETRY
+# --------------------------
+class RetryPolicy:
+    """
+    Até `attempts` tentativas por etapa. Espera antes da tentativa n (n >= 1):
+    uniforme entre 0 e min(cap, base * 2^(n-1)), ou o Retry-After do servidor
+    se for maior. `steps` sobrescreve attempts por etapa, ex.: {"goto": 5}.
+    """
+
+    def __init__(self, attempts=4, base=0.5, cap=30.0, steps=None, retry_if=is_transient):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.steps = dict(steps or {})
+        self.retry_if = retry_if
+
+    def attempts_for(self, step):
+        return self.steps.get(step, self.attempts)
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        return max(delay, min(self.cap, retry_after or 0.0))
+
+
+# --------------------------
+# THROTTLE (LIMITER + RETRY)
+# --------------------------
+class Throttle:
+    """AdaptiveLimiter + RetryPolicy para as etapas que falam com o site."""
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, limiter=None, retry=None):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.retry = retry or RetryPolicy()
+
+    @classmethod
+    def shared(cls):
+        """Instância única do processo (todas as threads respeitam o mesmo ritmo)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @contextmanager
+    def limited(self, step):
+        """
+        Um slot do limiter para uma requisição/navegação, sem novas tentativas
+        (para cliques do Playwright, que não dá para simplesmente repetir).
+        """
+        self.limiter.acquire()
+        started = time.monotonic()
+        ok, status = False, None
+        try:
+            yield
+            ok = True
+        except Exception as e:
+            status = _error_info(e)[0]
+            raise
+        finally:
+            self.limiter.release()
+            self.limiter.done(time.monotonic() - started, ok=ok, throttled=status == 429)
+
+    def call(self, step, fn, *args, **kwargs):
+        """
+        Chama fn(*args, **kwargs) dentro do limiter, repetindo falhas
+        transitórias. Respostas requests com status 429/5xx contam como
+        falha. Levanta a última exceção ao esgotar as tentativas.
+        """
+        def attempt():
+            with self.limited(step):
+                out = fn(*args, **kwargs)
+                requests = _requests()
+                if (requests is not None and isinstance(out, requests.Response)
+                        and out.status_code in RETRY_STATUS):
+                    raise TransientError(f"HTTP {out.status_code} em {out.url}", out.status_code, _retry_after(out))
+                return out
+
+        return self.retrying(step, attempt)
+
+    def retrying(self, step, fn, *args, **kwargs):
+        """
+        Só as novas tentativas, sem passar pelo limiter: para etapas compostas
+        (ex.: um fundo inteiro no Playwright) cujas requisições já são limitadas.
+        """
+        from scraping import log
+
+        attempts = self.retry.attempts_for(step)
+        for n in range(1, attempts + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not self.retry.retry_if(e) or n == attempts:
+                    raise
+                wait = self.retry.delay(n, _error_info(e)[1])
+                metrics.count("retries", step=step)
+                log(f"[throttle] {step}: {type(e).__name__}: {e} — tentativa {n + 1}/{attempts} em {wait:.1f}s")
+                time.sleep(wait)
+
+
+def limited(throttle, step):
+    """throttle.limited(step), ou nada se throttle for None."""
+    return nullcontext() if throttle is None else throttle.limited(step)
+
+
+def add_throttle_args(parser):
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="requisições/s iniciais ao site (ajustado conforme a latência e os erros)")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE, help="teto de requisições/s")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="teto de requisições simultâneas")
+    parser.add_argument("--target-latency", type=float, default=DEFAULT_TARGET_LATENCY,
+                        help="latência (s) acima da qual o ritmo é reduzido")
+    parser.add_argument("--retries", type=int, default=4, help="tentativas por etapa em falhas transitórias")
+
+
+def throttle_from_args(args, concurrency=4):
+    limiter = AdaptiveLimiter(rate=args.rate, max_rate=args.max_rate, concurrency=min(concurrency, args.max_concurrency),
+                              max_concurrency=args.max_concurrency, target_latency=args.target_latency)
+    return Throttle(limiter, RetryPolicy(attempts=args.retries))
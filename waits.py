@@ -0,0 +1,212 @@
+# waits.py
+# Esperas orientadas a eventos do Playwright (sync_api), no lugar dos
+# time.sleep fixos e dos loops de N tentativas x atraso.
+# Cada etapa tem um timeout próprio (WaitConfig) e retorna assim que a página
+# fica pronta; se não ficar, falha no timeout da etapa.
+
+import time
+
+# o Playwright é importado dentro das funções (todas recebem uma página já
+# aberta): importar o módulo não carrega o Playwright.
+
+# espera máxima (ms) de cada fatia em click_link_and_wait (popup x navegação)
+EVENT_SLICE_MS = 100
+
+# timeout global (ms) para etapas sem valor próprio
+DEFAULT_TIMEOUT_MS = 15000
+
+# timeouts por etapa (ms)
+STEP_TIMEOUTS = {
+    "goto": 30000,            # carregar o frameset inicial
+    "search_frame": 10000,    # frame FormBuscaParticFdo.aspx aparecer
+    "search_submit": 15000,   # postback do btnContinuar
+    "fund_click": 15000,      # postback do Linkbutton4 (página do fundo)
+    "balancete_link": 10000,  # #Hyperlink5 aparecer
+    "balancete_open": 15000,  # popup ou navegação após clicar no Balancete
+    "balancete_table": 10000, # tabela Table1/BodyPP aparecer
+}
+
+
+class WaitConfig:
+    """
+    Timeouts das etapas do fluxo, em ms.
+
+        WaitConfig()                                  # padrões acima
+        WaitConfig(default=5000)                      # etapas sem valor próprio
+        WaitConfig(steps={"balancete_table": 3000})   # sobrescreve uma etapa
+        WaitConfig(default=5000, override_steps=True) # todas as etapas = 5000
+    """
+
+    def __init__(self, default=DEFAULT_TIMEOUT_MS, steps=None, override_steps=False):
+        self.default = default
+        self.steps = {} if override_steps else dict(STEP_TIMEOUTS)
+        self.steps.update(steps or {})
+
+    def timeout(self, step):
+        return self.steps.get(step, self.default)
+
+    @classmethod
+    def from_args(cls, timeout=None, step_timeouts=None):
+        """Monta a partir de argumentos de CLI: --timeout MS e --step-timeout etapa=MS."""
+        steps = {}
+        for item in step_timeouts or []:
+            name, _, value = item.partition("=")
+            steps[name.strip()] = int(value)
+        if timeout is None:
+            return cls(steps=steps)
+        return cls(default=timeout, steps=steps, override_steps=True)
+
+
+def _remaining_ms(deadline):
+    return max(0, int((deadline - time.monotonic()) * 1000))
+
+
+# --------------------------
+# FRAMES
+# --------------------------
+def wait_for_frame(page, fragment, timeout):
+    """
+    Retorna o frame cuja URL contém `fragment`, esperando pelo evento
+    framenavigated se ele ainda não existir. None se estourar o timeout.
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    fragment = fragment.lower()
+    for f in page.frames:
+        if fragment in (f.url or "").lower():
+            return f
+    try:
+        return page.wait_for_event(
+            "framenavigated",
+            predicate=lambda f: fragment in (f.url or "").lower(),
+            timeout=timeout,
+        )
+    except PlaywrightTimeoutError:
+        return None
+
+
+def _scan_frames(page, selectors):
+    for f in page.frames:
+        try:
+            for sel in selectors:
+                el = f.query_selector(sel)
+                if el:
+                    return f, el, sel
+        except Exception:
+            continue
+    return None, None, None
+
+
+def wait_for_selector_in_frames(page, selectors, timeout, prefer_frame=None):
+    """
+    Procura o primeiro dos `selectors` em todos os frames da página.
+    Se não estiver lá ainda:
+      - com prefer_frame: espera no próprio frame (frame.wait_for_selector,
+        que acompanha navegações desse frame);
+      - sem prefer_frame: reavalia a cada frame navegado/carregado.
+    Retorna (frame, element, selector) ou (None, None, None) no timeout.
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    found = _scan_frames(page, selectors)
+    if found[0]:
+        return found
+
+    deadline = time.monotonic() + timeout / 1000
+    if prefer_frame is not None:
+        try:
+            prefer_frame.wait_for_selector(", ".join(selectors), state="attached", timeout=timeout)
+        except PlaywrightTimeoutError:
+            return None, None, None
+        except Exception:
+            pass  # frame destacado: cai na varredura abaixo
+        for sel in selectors:
+            try:
+                el = prefer_frame.query_selector(sel)
+            except Exception:
+                break
+            if el:
+                return prefer_frame, el, sel
+        return _scan_frames(page, selectors)
+
+    while True:
+        remaining = _remaining_ms(deadline)
+        if remaining <= 0:
+            return None, None, None
+        try:
+            f = page.wait_for_event("framenavigated", timeout=remaining)
+            f.wait_for_load_state("domcontentloaded", timeout=max(1, _remaining_ms(deadline)))
+        except PlaywrightTimeoutError:
+            return _scan_frames(page, selectors)
+        except Exception:
+            pass
+        found = _scan_frames(page, selectors)
+        if found[0]:
+            return found
+
+
+# --------------------------
+# CLIQUES QUE NAVEGAM
+# --------------------------
+def click_and_wait_navigation(frame, target, timeout, wait_until="domcontentloaded"):
+    """
+    Clica em `target` (seletor ou ElementHandle) e espera a navegação do frame
+    (postback ASP.NET). Não há sleep: retorna quando o DOM novo carregou.
+    """
+    with frame.expect_navigation(wait_until=wait_until, timeout=timeout):
+        if isinstance(target, str):
+            frame.click(target)
+        else:
+            target.click()
+
+
+def _click(frame, handle):
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    try:
+        handle.click()
+    except PlaywrightTimeoutError:
+        raise
+    except Exception:
+        # elemento coberto/fora da tela: clique via JS, como no fluxo original
+        frame.evaluate("el => el.click()", handle)
+
+
+def click_link_and_wait(page, frame, link_handle, timeout):
+    """
+    Clica no link e espera o que vier primeiro: um popup (target=_blank,
+    window.open, handler em JS, postback que abre janela...) ou a navegação de
+    um frame da própria página. Não decide pelos atributos do link: os dois
+    eventos ficam escutados desde antes do clique.
+    Retorna (page_ou_popup, frame_que_recebeu_o_conteúdo).
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    popups, navigated = [], []
+    on_popup, on_navigated = popups.append, navigated.append
+    page.on("popup", on_popup)
+    page.on("framenavigated", on_navigated)
+    deadline = time.monotonic() + timeout / 1000
+    try:
+        _click(frame, link_handle)
+        while not (popups or navigated):
+            remaining = _remaining_ms(deadline)
+            if remaining <= 0:
+                raise PlaywrightTimeoutError(f"nem popup nem navegação {timeout} ms depois do clique")
+            # a sync_api só espera um evento por vez: espera a navegação em
+            # fatias curtas, e o listener de popup roda durante cada espera
+            try:
+                page.wait_for_event("framenavigated", timeout=min(remaining, EVENT_SLICE_MS))
+            except PlaywrightTimeoutError:
+                pass
+    finally:
+        page.remove_listener("popup", on_popup)
+        page.remove_listener("framenavigated", on_navigated)
+
+    if popups:
+        popup = popups[0]
+        popup.wait_for_load_state("domcontentloaded", timeout=timeout)
+        return popup, popup.main_frame
+    nav_frame = navigated[0]
+    nav_frame.wait_for_load_state("domcontentloaded", timeout=max(1, _remaining_ms(deadline)))
+    return page, nav_frame